@@ -2,75 +2,579 @@ import os
 import glob
 import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+try:  # Opcional: lector de Excel en Rust, bastante más rápido que openpyxl
+    import python_calamine  # noqa: F401
+except ImportError:
+    python_calamine = None
 
-def load_intents_from_multiple_excels(folder_path):
+# pandas acepta engine="calamine" desde la 2.2
+_PANDAS_VERSION = tuple(int(part) for part in pd.__version__.split(".")[:2])
+EXCEL_READ_ENGINE = (
+    "calamine"
+    if python_calamine is not None and _PANDAS_VERSION >= (2, 2)
+    else "openpyxl"
+)
+
+
+def _read_intent_excel(file_path):
+    """Columnas Intent y Utterance de un Excel de salida del paso 1."""
+    columns = ["Intent", "Utterance"]
+    df = pd.read_excel(file_path, usecols=columns, engine=EXCEL_READ_ENGINE)
+    # calamine lee una celda de solo espacios (sin xml:space="preserve", como
+    # las escribe openpyxl) igual que una vacía, pero la primera se descarta y
+    # la segunda cuenta como "nan": si hay celdas vacías se relee con openpyxl
+    if EXCEL_READ_ENGINE != "openpyxl" and df[columns].isna().any(axis=None):
+        df = pd.read_excel(file_path, usecols=columns, engine="openpyxl")
+    return df
+
+
+def load_intents_from_multiple_excels(folder_path, workers=None, processes=False):
+    """
+    Junta los intents de todos los step1_intent_output_*.xlsx de `folder_path`
+    en un dict intent -> utterances (en el orden de los archivos y filas).
+    Los archivos se leen en paralelo con `workers` hilos, o procesos si
+    processes=True (conviene con openpyxl, que no suelta el GIL).
+    """
     file_pattern = os.path.join(folder_path, "step1_intent_output_*.xlsx")
     excel_files = glob.glob(file_pattern)
 
     intents = defaultdict(list)
-    for file_path in excel_files:
-        df = pd.read_excel(file_path)
-        for _, row in df.iterrows():
-            intent = str(row["Intent"]).strip()
-            utterance = str(row["Utterance"]).strip()
-            if intent and utterance:
-                intents[intent].append(utterance)
+    if not excel_files:
+        return intents
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        frames = list(pool.map(_read_intent_excel, excel_files))
+
+    df = pd.concat(frames, ignore_index=True)
+    # Como str(valor): las celdas vacías quedan como "nan" (con pandas 3,
+    # astype(str) las deja vacías, así que se completan antes)
+    intent = df["Intent"].fillna("nan").astype(str).str.strip()
+    utterance = df["Utterance"].fillna("nan").astype(str).str.strip()
+    keep = (intent != "") & (utterance != "")
+    grouped = utterance[keep].groupby(intent[keep], sort=False).agg(list)
+    intents.update(zip(grouped.index, grouped.tolist()))
     return intents
 
 
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
 from ruamel.yaml import YAML
 from io import BytesIO
 
+try:  # PyYAML es opcional: solo se usa si trae los bindings C de libyaml
+    import yaml as pyyaml
+except ImportError:
+    pyyaml = None
+
+# Cantidad de flujos parseados que se mantienen en memoria (compartidos entre
+# extracción, construcción y merge de una misma sesión).
+PARSED_FLOW_CACHE_SIZE = 8
+
+_parsed_flow_cache = OrderedDict()
+_parsed_flow_cache_lock = threading.Lock()
+
+# Valor todavía no calculado (None es un resultado válido)
+_UNSET = object()
+
+
+class Segment(NamedTuple):
+    """
+    Segmento de un utterance como tupla liviana: texto, entidad (el dict
+    `entity` del YAML, o None) y el resto de las claves como pares (clave,
+    valor), en su orden original.
+    """
+
+    text: str = None
+    entity: dict = None
+    extra: tuple = ()
+
+    @classmethod
+    def from_yaml(cls, segment):
+        if not isinstance(segment, dict):
+            return cls(str(segment))
+        extra = tuple(
+            (key, value)
+            for key, value in segment.items()
+            if key != "text" and key != "entity"
+        )
+        return cls(segment.get("text"), segment.get("entity"), extra)
+
+    def to_dict(self) -> dict:
+        """El segmento como dict, igual que en el YAML (text, entity y el resto)."""
+        segment = {}
+        if self.text is not None:
+            segment["text"] = self.text
+        if self.entity is not None:
+            segment["entity"] = self.entity
+        segment.update(self.extra)
+        return segment
+
+
+def segments_to_dicts(segments) -> list:
+    """Segmentos (tuplas Segment o dicts) como lista de dicts, para JSON o YAML."""
+    return [
+        segment.to_dict() if isinstance(segment, Segment) else segment
+        for segment in segments
+    ]
+
+
+def segments_to_json(value):
+    """
+    Celda de segments_original como texto JSON: serializa una tupla o lista
+    de segmentos y deja igual lo que ya es texto (o está vacío).
+    """
+    if isinstance(value, (list, tuple)):
+        return json.dumps(segments_to_dicts(value)) if value else None
+    return value
+
 
 class Intent:
+    __slots__ = ("name", "utterances")
+
     def __init__(self, name, utterances):
         self.name = name
         self.utterances = [Utterance(u) for u in utterances]
 
 
 class Utterance:
+    __slots__ = ("id", "segments", "_text")
+
     def __init__(self, utterance_obj_from_yaml):
         if isinstance(utterance_obj_from_yaml, dict):
-            self.segments = utterance_obj_from_yaml.get("segments", [{"text": ""}]) # Guardar lista de segmentos
-            self.text = " ".join(seg.get("text", "") for seg in self.segments) # Texto concatenado para visualización/edición simple
+            raw_segments = utterance_obj_from_yaml.get("segments", [{"text": ""}])
+            # Tupla de Segment, sin referencias a los dicts del YAML
+            self.segments = tuple(Segment.from_yaml(s) for s in raw_segments or ())
+            self._text = _UNSET  # Se arma a demanda desde los segmentos
             self.id = utterance_obj_from_yaml.get("id")
         else:
-            self.text = utterance_obj_from_yaml  # fallback for simple text
-            self.segments = [{"text": str(utterance_obj_from_yaml)}] # Estructura de segmento simple para fallback
+            self._text = utterance_obj_from_yaml  # fallback for simple text
+            self.segments = (Segment(str(utterance_obj_from_yaml)),) # Estructura de segmento simple para fallback
             self.id = None
 
+    @property
+    def text(self):
+        """Texto concatenado para visualización/edición simple."""
+        if self._text is _UNSET:
+            return " ".join(segment.text or "" for segment in self.segments)
+        return self._text
 
-class BotFlowLoader:
-    @staticmethod
-    def load_from_bytes(yaml_bytes: bytes):
-        yaml = YAML()
-        data = yaml.load(BytesIO(yaml_bytes))
 
-        # Soportar estructuras tipo "botFlow -> settingsNaturalLanguageUnderstanding"
-        snlu = None
-        if "settingsNaturalLanguageUnderstanding" in data:
-            snlu = data["settingsNaturalLanguageUnderstanding"]
-        elif (
-            "botFlow" in data
-            and "settingsNaturalLanguageUnderstanding" in data["botFlow"]
-        ):
-            snlu = data["botFlow"]["settingsNaturalLanguageUnderstanding"]
+_YAML11_ONLY_TAGS = {
+    "tag:yaml.org,2002:bool",
+    "tag:yaml.org,2002:int",
+    "tag:yaml.org,2002:float",
+    "tag:yaml.org,2002:value",
+}
+
+if pyyaml is not None and getattr(pyyaml, "__with_libyaml__", False):
+
+    class _FastSafeLoader(pyyaml.CSafeLoader):
+        """
+        CSafeLoader (libyaml) que resuelve bool/int/float según YAML 1.2, igual
+        que ruamel: "no", "on", "1:30" o "=" siguen siendo texto.
+        """
+
+    _FastSafeLoader.yaml_implicit_resolvers = {
+        first: [
+            (tag, regexp) for tag, regexp in entries if tag not in _YAML11_ONLY_TAGS
+        ]
+        for first, entries in pyyaml.CSafeLoader.yaml_implicit_resolvers.items()
+    }
+    _FastSafeLoader.add_implicit_resolver(
+        "tag:yaml.org,2002:bool",
+        re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"),
+        list("tTfF"),
+    )
+    _FastSafeLoader.add_implicit_resolver(
+        "tag:yaml.org,2002:int",
+        re.compile(
+            r"^(?:[-+]?0b[0-1_]+|[-+]?0o[0-7_]+|[-+]?[0-9_]+|[-+]?0x[0-9a-fA-F_]+)$"
+        ),
+        list("-+0123456789"),
+    )
+    _FastSafeLoader.add_implicit_resolver(
+        "tag:yaml.org,2002:float",
+        re.compile(
+            r"^(?:[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?"
+            r"|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$"
+        ),
+        list("-+.0123456789"),
+    )
+
+    def _construct_yaml12_int(loader, node):
+        value = loader.construct_scalar(node).replace("_", "")
+        sign = -1 if value.startswith("-") else 1
+        value = value.lstrip("+-")
+        if value.startswith(("0b", "0o", "0x")):
+            return sign * int(value, 0)
+        return sign * int(value, 10)  # Sin octal implícito de YAML 1.1 ("012" == 12)
+
+    _FastSafeLoader.add_constructor("tag:yaml.org,2002:int", _construct_yaml12_int)
+    READ_ONLY_LOADER = "pyyaml-libyaml"
+else:
+    _FastSafeLoader = None
+    READ_ONLY_LOADER = "ruamel-safe"
+
+
+def load_read_only(yaml_bytes: bytes):
+    """
+    Carga de solo lectura (dicts y listas planos, sin comentarios): usa libyaml
+    vía PyYAML si está disponible y, si no, el loader safe de ruamel (que a su
+    vez usa ruamel.yaml.clib cuando está instalado).
+    """
+    if _FastSafeLoader is not None:
+        return pyyaml.load(yaml_bytes, Loader=_FastSafeLoader)
+    return YAML(typ="safe").load(BytesIO(yaml_bytes))
+
+
+# Rutas (desde la raíz) donde puede estar el bloque NLU, como árbol de claves:
+# None marca el valor buscado.
+_NLU_SETTINGS_PATHS = {
+    "settingsNaturalLanguageUnderstanding": None,
+    "botFlow": {"settingsNaturalLanguageUnderstanding": None},
+}
+
+
+class _UnresolvedAlias(Exception):
+    """El subárbol NLU usa un ancla definida fuera de él."""
+
+
+def _skip_node(parser):
+    """Consume los eventos de un nodo completo sin construir nada."""
+    event = parser.get_event()
+    if not isinstance(event, (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)):
+        return
+    depth = 1
+    while depth:
+        event = parser.get_event()
+        if isinstance(event, (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (pyyaml.MappingEndEvent, pyyaml.SequenceEndEvent)):
+            depth -= 1
 
+
+def _compose_node(parser, anchors):
+    """Compone (como el Composer de PyYAML) solo el nodo actual y sus hijos."""
+    event = parser.get_event()
+    if isinstance(event, pyyaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise _UnresolvedAlias(event.anchor)
+        return anchors[event.anchor]
+
+    if isinstance(event, pyyaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = parser.resolve(pyyaml.ScalarNode, event.value, event.implicit)
+        node = pyyaml.ScalarNode(
+            tag, event.value, event.start_mark, event.end_mark, style=event.style
+        )
+    elif isinstance(event, pyyaml.SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = parser.resolve(pyyaml.SequenceNode, None, event.implicit)
+        node = pyyaml.SequenceNode(tag, [], event.start_mark, None)
+        while not parser.check_event(pyyaml.SequenceEndEvent):
+            node.value.append(_compose_node(parser, anchors))
+        node.end_mark = parser.get_event().end_mark
+    else:  # MappingStartEvent
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = parser.resolve(pyyaml.MappingNode, None, event.implicit)
+        node = pyyaml.MappingNode(tag, [], event.start_mark, None)
+        while not parser.check_event(pyyaml.MappingEndEvent):
+            key = _compose_node(parser, anchors)
+            node.value.append((key, _compose_node(parser, anchors)))
+        node.end_mark = parser.get_event().end_mark
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def _find_path(parser, paths):
+    """
+    Avanza por los eventos hasta el valor de alguna de las rutas de `paths`
+    (árbol de claves de mappings anidados), en orden de documento y saltando
+    todo lo demás. Devuelve el evento de la clave encontrada (o None); el
+    parser queda posicionado justo antes de su valor.
+    """
+    if not parser.check_event(pyyaml.MappingStartEvent):
+        _skip_node(parser)
+        return None
+    parser.get_event()
+    while not parser.check_event(pyyaml.MappingEndEvent):
+        key_event = parser.peek_event()
+        if isinstance(key_event, pyyaml.ScalarEvent) and key_event.value in paths:
+            parser.get_event()
+            subpaths = paths[key_event.value]
+            if subpaths is None:
+                return key_event
+            found = _find_path(parser, subpaths)
+            if found is not None:
+                return found
+            continue
+        _skip_node(parser)  # clave
+        _skip_node(parser)  # valor
+    parser.get_event()
+    return None
+
+
+def stream_nlu_settings(yaml_bytes: bytes):
+    """
+    Extrae solo settingsNaturalLanguageUnderstanding recorriendo los eventos
+    de parseo (libyaml) en una única pasada: el resto del flujo (estados,
+    tareas, etc.) se salta sin construir objetos y la lectura se detiene en
+    cuanto el bloque está completo. Devuelve None si el bloque no existe, o
+    _UNSET si no se puede resolver así (sin libyaml, anclas externas al
+    bloque) y hay que cargar el documento completo.
+    """
+    if _FastSafeLoader is None:
+        return _UNSET
+    parser = _FastSafeLoader(yaml_bytes)
+    try:
+        parser.get_event()  # StreamStart
+        if parser.check_event(pyyaml.StreamEndEvent):
+            return None
+        parser.get_event()  # DocumentStart
+        if _find_path(parser, _NLU_SETTINGS_PATHS) is None:
+            return None
+        return parser.construct_document(_compose_node(parser, {}))
+    except _UnresolvedAlias:
+        return _UNSET
+    finally:
+        parser.dispose()
+
+
+# Ruta del nluDomainVersion que reemplaza el merge
+_NLU_DOMAIN_VERSION_PATH = {
+    "botFlow": {"settingsNaturalLanguageUnderstanding": {"nluDomainVersion": None}}
+}
+# Saltos de línea tal como los cuenta libyaml en sus marcas (línea, columna)
+_LINE_BREAK_RE = re.compile("\r\n|[\r\n\x85\u2028\u2029]")
+
+
+def nlu_domain_version_span(yaml_bytes: bytes):
+    """
+    Ubica botFlow.settingsNaturalLanguageUnderstanding.nluDomainVersion en el
+    texto (UTF-8) del YAML recorriendo los eventos de parseo, sin construir
+    el documento. Devuelve (inicio, fin, indentación): desde el comienzo de la
+    línea de la clave hasta el comienzo de la línea del nodo siguiente, de
+    modo que los comentarios que siguen al subárbol quedan dentro. Devuelve
+    None si no hay libyaml, si la clave no existe o si su valor no es un
+    mapping en bloque sin anclas ni alias.
+    """
+    if _FastSafeLoader is None:
+        return None
+    try:
+        text = yaml_bytes.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+    parser = _FastSafeLoader(yaml_bytes)
+    try:
+        parser.get_event()  # StreamStart
+        if parser.check_event(pyyaml.StreamEndEvent):
+            return None
+        parser.get_event()  # DocumentStart
+        key_event = _find_path(parser, _NLU_DOMAIN_VERSION_PATH)
+        if key_event is None:
+            return None
+        value_event = parser.peek_event()
         if (
-            not snlu
-            or "nluDomainVersion" not in snlu
-            or "intents" not in snlu["nluDomainVersion"]
+            not isinstance(value_event, pyyaml.MappingStartEvent)
+            or value_event.flow_style
         ):
-            raise ValueError("No se encontró la sección intents del NLU en el YAML")
+            return None
+        depth = 0
+        last_end_mark = key_event.end_mark
+        while True:
+            event = parser.get_event()
+            if getattr(event, "anchor", None) is not None:
+                return None  # Un ancla o alias podría referirse a nodos de afuera
+            if isinstance(event, pyyaml.ScalarEvent):
+                last_end_mark = max(last_end_mark, event.end_mark, key=_mark_key)
+            elif isinstance(
+                event, (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)
+            ):
+                depth += 1
+            elif isinstance(event, (pyyaml.MappingEndEvent, pyyaml.SequenceEndEvent)):
+                depth -= 1
+                if not depth:
+                    break
+        next_mark = parser.peek_event().start_mark
+    finally:
+        parser.dispose()
+
+    line_starts = [0] + [m.end() for m in _LINE_BREAK_RE.finditer(text)]
+    line_starts.append(len(text))
+    indent = key_event.start_mark.column
+    start = line_starts[key_event.start_mark.line]
+    if text[start : start + indent].strip(" "):
+        return None  # La clave no es la primera de su línea
+    # Hasta el fin de línea del último escalar (un escalar en bloque ya
+    # termina al comienzo de una línea), o hasta la línea del nodo siguiente
+    # si los comentarios posteriores llegan más lejos.
+    last_line = last_end_mark.line + (1 if last_end_mark.column else 0)
+    end = max(
+        line_starts[min(last_line, len(line_starts) - 1)],
+        line_starts[min(next_mark.line, len(line_starts) - 1)],
+    )
+    return start, end, indent
+
+
+def _mark_key(mark):
+    return mark.line, mark.column
+
+
+def flow_digest(yaml_bytes: bytes) -> str:
+    """Hash de contenido (sha256) que identifica un YAML de flujo."""
+    return hashlib.sha256(yaml_bytes).hexdigest()
+
+
+class ParsedFlow:
+    """
+    YAML de un flujo parseado una sola vez y compartido por extractor, builder
+    y merge. Ofrece cuatro vistas, cada una construida a demanda:
+
+    - `nlu_settings()`: solo el bloque NLU, extraído por eventos (extracción
+      e IDs).
+    - `data`: documento completo de solo lectura, con el loader rápido.
+    - `document`: round-trip, conservando comillas y comentarios (merge).
+    - `nlu_domain_version_span()`: posición del nluDomainVersion en el texto,
+      para reemplazar solo ese subárbol (merge por empalme).
 
-        raw_intents = snlu["nluDomainVersion"]["intents"]
-        return BotFlow(raw_intents)
+    El documento es compartido: quien necesite modificarlo temporalmente debe
+    hacerlo con `lock` tomado y restaurarlo antes de liberarlo.
+    """
+
+    def __init__(self, yaml_bytes: bytes, digest: str = None):
+        self.digest = digest or flow_digest(yaml_bytes)
+        self.lock = threading.Lock()
+        self._yaml_bytes = yaml_bytes
+        self._load_lock = threading.Lock()
+        self._data = None
+        self._document = None
+        self._nlu_settings = _UNSET
+        self._nlu_domain_version_span = _UNSET
+        self._bot_flow = None
+
+    @property
+    def data(self):
+        with self._load_lock:
+            if self._data is None:
+                self._data = load_read_only(self._yaml_bytes)
+            return self._data
+
+    @property
+    def document(self):
+        with self._load_lock:
+            if self._document is None:
+                yaml = YAML()
+                yaml.preserve_quotes = True
+                self._document = yaml.load(BytesIO(self._yaml_bytes))
+            return self._document
+
+    def nlu_settings(self):
+        """
+        Devuelve el bloque settingsNaturalLanguageUnderstanding o None. Si el
+        documento completo aún no se cargó, se extrae solo ese subárbol.
+        """
+        with self._load_lock:
+            if self._nlu_settings is _UNSET and self._data is None:
+                self._nlu_settings = stream_nlu_settings(self._yaml_bytes)
+            if self._nlu_settings is not _UNSET:
+                return self._nlu_settings
+
+        data = self.data
+        if not isinstance(data, dict):
+            return None
+        # Soportar estructuras tipo "botFlow -> settingsNaturalLanguageUnderstanding"
+        if "settingsNaturalLanguageUnderstanding" in data:
+            return data["settingsNaturalLanguageUnderstanding"]
+        if isinstance(data.get("botFlow"), dict):
+            return data["botFlow"].get("settingsNaturalLanguageUnderstanding")
+        return None
+
+    def nlu_domain_version_span(self):
+        """nlu_domain_version_span() de este flujo, calculado una sola vez."""
+        with self._load_lock:
+            if self._nlu_domain_version_span is _UNSET:
+                self._nlu_domain_version_span = nlu_domain_version_span(
+                    self._yaml_bytes
+                )
+            return self._nlu_domain_version_span
+
+    def bot_flow(self):
+        if self._bot_flow is None:
+            snlu = self.nlu_settings()
+            if (
+                not snlu
+                or "nluDomainVersion" not in snlu
+                or "intents" not in snlu["nluDomainVersion"]
+            ):
+                raise ValueError("No se encontró la sección intents del NLU en el YAML")
+            self._bot_flow = BotFlow(snlu["nluDomainVersion"]["intents"])
+        return self._bot_flow
+
+
+def parse_flow(yaml_bytes: bytes) -> ParsedFlow:
+    """
+    Devuelve el ParsedFlow de `yaml_bytes`, parseándolo solo si su hash de
+    contenido no está ya en la caché (LRU de PARSED_FLOW_CACHE_SIZE entradas).
+    """
+    digest = flow_digest(yaml_bytes)
+    with _parsed_flow_cache_lock:
+        parsed = _parsed_flow_cache.get(digest)
+        if parsed is not None:
+            _parsed_flow_cache.move_to_end(digest)
+            return parsed
+
+    parsed = ParsedFlow(yaml_bytes, digest)
+    with _parsed_flow_cache_lock:
+        parsed = _parsed_flow_cache.setdefault(digest, parsed)
+        _parsed_flow_cache.move_to_end(digest)
+        while len(_parsed_flow_cache) > PARSED_FLOW_CACHE_SIZE:
+            _parsed_flow_cache.popitem(last=False)
+    return parsed
+
+
+class BotFlowLoader:
+    @staticmethod
+    def load_from_bytes(yaml_bytes: bytes):
+        return parse_flow(yaml_bytes).bot_flow()
 
 
 class BotFlow:
+    __slots__ = ("intents",)
+
     def __init__(self, raw_intents):
         self.intents = [Intent(i["name"], i["utterances"]) for i in raw_intents]
 
     def get_intents(self):
         return self.intents
+
+    def to_columns(self) -> dict:
+        """
+        Utterances del flujo como tabla columnar: una lista por columna
+        (intent_name, utterance_text, utterance_id y segments, con las tuplas
+        de Segment), lista para pd.DataFrame o pyarrow.table.
+        """
+        columns = {
+            "intent_name": [],
+            "utterance_text": [],
+            "utterance_id": [],
+            "segments": [],
+        }
+        for intent in self.intents:
+            n_utterances = len(intent.utterances)
+            columns["intent_name"].extend([intent.name] * n_utterances)
+            columns["utterance_text"].extend(u.text for u in intent.utterances)
+            columns["utterance_id"].extend(u.id for u in intent.utterances)
+            columns["segments"].extend(u.segments for u in intent.utterances)
+        return columns
@@ -0,0 +1,296 @@
+"""
+Modo por lotes (sin interfaz) de IntentFlow Curator, para procesar muchos
+flujos de una sola vez. No importa Streamlit.
+
+    python app/cli.py extract flujos/ -o salida/ --workers 4
+    python app/cli.py build flujos/ --excel-dir curados/ -o salida/
+
+`extract` escribe, por cada flujo, el Excel de curación del paso 2
+(`<flujo>_intents.xlsx`, o el paquete Parquet `<flujo>_intents.zip` con
+--format parquet). `build` toma cada flujo junto con su Excel curado (o su
+paquete) en --excel-dir y escribe `<flujo>_update.yaml`, igual que el
+paso 3. Ambos dejan un resumen con una fila por flujo en
+`summary.csv` dentro del directorio de salida.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from ruamel.yaml import YAML
+
+from utils import result_cache
+from utils.builder import merge_into_original
+from utils.curation_io import (
+    read_curation_file,
+    write_curation_bundle,
+    write_curation_excel,
+)
+
+YAML_EXTENSIONS = (".yaml", ".yml")
+DEFAULT_THRESHOLD = 90
+
+
+def _iter_flows(inputs: list) -> list:
+    """
+    (ruta, nombre) de cada flujo YAML en `inputs` (archivos o directorios,
+    recorridos recursivamente). El nombre es la ruta relativa sin extensión,
+    para que flujos homónimos en subdirectorios no se pisen.
+    """
+    flows = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, _, filenames in os.walk(item):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(YAML_EXTENSIONS):
+                        path = os.path.join(dirpath, filename)
+                        name = os.path.splitext(os.path.relpath(path, item))[0]
+                        flows.append((path, name))
+        else:
+            flows.append((item, os.path.splitext(os.path.basename(item))[0]))
+    return sorted(flows)
+
+
+def _output_path(output_dir: str, name: str, suffix: str) -> str:
+    path = os.path.join(output_dir, f"{name}{suffix}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def extract_flow(
+    path: str,
+    name: str,
+    output_dir: str,
+    threshold: int,
+    semantic: bool = False,
+    trace_memory: bool = False,
+    bundle: bool = False,
+) -> dict:
+    """
+    Extrae un flujo y escribe su Excel (o paquete Parquet) de curación.
+    Devuelve su fila del resumen.
+    """
+    with open(path, "rb") as f:
+        yaml_bytes = f.read()
+    (
+        df_utterances,
+        df_dups,
+        df_entity_declarations,
+        df_entity_types,
+        df_intent_details,
+    ) = result_cache.cached_extract_intents(yaml_bytes, detect_duplicates=False)
+    df_for_duplicates = df_utterances.rename(
+        columns={"intent_name": "intent", "utterance_text": "utterance"}
+    )[["intent", "utterance"]]
+    df_dups, df_confusion = result_cache.cached_duplicates(df_for_duplicates, threshold)
+    if semantic:
+        # Solo acá: los backends semánticos opcionales pueden importar torch
+        from utils.semantic import find_semantic_duplicates
+
+        df_dups = pd.concat(
+            [
+                df_dups,
+                find_semantic_duplicates(df_for_duplicates, fuzzy_threshold=threshold),
+            ],
+            ignore_index=True,
+        )
+
+    frames = (
+        df_utterances,
+        df_dups,
+        df_intent_details,
+        df_entity_declarations,
+        df_entity_types,
+        df_confusion,
+    )
+    if bundle:
+        output_path = _output_path(output_dir, name, "_intents.zip")
+        started = time.perf_counter()
+        write_curation_bundle(output_path, *frames)
+        export_stats = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "peak_mb": None,
+        }
+    else:
+        output_path = _output_path(output_dir, name, "_intents.xlsx")
+        export_stats = write_curation_excel(
+            output_path, *frames, trace_memory=trace_memory
+        )
+    return {
+        "intents": (
+            int(df_utterances["intent_name"].nunique())
+            if not df_utterances.empty
+            else 0
+        ),
+        "utterances": len(df_utterances),
+        "duplicates": len(df_dups),
+        "cross_intent_duplicates": (
+            int((~df_dups["mismo_intent"]).sum()) if not df_dups.empty else 0
+        ),
+        "confused_intent_pairs": len(df_confusion),
+        "export_seconds": export_stats["seconds"],
+        "export_peak_mb": export_stats["peak_mb"],
+        "output": output_path,
+    }
+
+
+def build_flow(
+    path: str, name: str, output_dir: str, excel_dir: str, splice: bool
+) -> dict:
+    """
+    Genera el YAML actualizado de un flujo a partir de su Excel curado (o, si
+    no hay Excel, de su paquete Parquet).
+    """
+    candidates = [
+        os.path.join(excel_dir, f"{name}_intents{extension}")
+        for extension in (".xlsx", ".zip")
+    ]
+    excel_path = next((p for p in candidates if os.path.exists(p)), None)
+    if excel_path is None:
+        raise FileNotFoundError(f"No se encontró el Excel curado: {candidates[0]}")
+    with open(path, "rb") as f:
+        yaml_bytes = f.read()
+    df_utterances, df_intent_details = read_curation_file(excel_path)
+    if df_utterances.empty or df_intent_details.empty:
+        raise ValueError(f"El Excel {excel_path} no tiene utterances o intents")
+
+    nlu_block_str = result_cache.cached_build_yaml(
+        df_utterances, df_intent_details, yaml_bytes
+    )
+    yaml_completo = merge_into_original(
+        yaml_bytes, YAML().load(nlu_block_str), splice=splice
+    )
+    output_path = _output_path(output_dir, name, "_update.yaml")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(yaml_completo)
+    return {
+        "intents": int(df_intent_details["intent_name"].nunique()),
+        "utterances": len(df_utterances),
+        "output": output_path,
+    }
+
+
+def _run_one(task, path: str, name: str, *args) -> dict:
+    """Ejecuta una tarea sobre un flujo sin propagar errores: quedan en el resumen."""
+    started = time.perf_counter()
+    try:
+        row = {"flow": name, "status": "ok", **task(path, name, *args)}
+    except Exception as e:
+        row = {"flow": name, "status": "error", "error": f"{type(e).__name__}: {e}"}
+    row["seconds"] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def run_batch(task, flows: list, args: tuple, workers: int) -> pd.DataFrame:
+    """Corre `task` sobre cada flujo, en un pool de procesos si workers > 1."""
+    if workers <= 1 or len(flows) <= 1:
+        rows = [_run_one(task, path, name, *args) for path, name in flows]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_run_one, task, path, name, *args) for path, name in flows
+            ]
+            rows = [future.result() for future in futures]
+    return pd.DataFrame(rows).convert_dtypes()
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Extracción, detección de duplicados y generación de YAML por lotes.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "inputs", nargs="+", help="Flujos YAML o directorios con flujos"
+    )
+    common.add_argument("-o", "--output-dir", required=True)
+    common.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Procesos en paralelo (1 = sin pool)",
+    )
+    common.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Registrar en el log la duración de cada etapa del pipeline",
+    )
+
+    extract = subparsers.add_parser(
+        "extract", parents=[common], help="Exporta el Excel de curación de cada flujo"
+    )
+    extract.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    extract.add_argument(
+        "--semantic",
+        action="store_true",
+        help="Agregar duplicados semánticos (paráfrasis) a la hoja de duplicados",
+    )
+    extract.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Medir el pico de memoria de la exportación a Excel (más lenta)",
+    )
+    extract.add_argument(
+        "--format",
+        choices=["xlsx", "parquet"],
+        default="xlsx",
+        help="Excel de curación o paquete Parquet (.zip, requiere pyarrow)",
+    )
+
+    build = subparsers.add_parser(
+        "build", parents=[common], help="Genera el YAML actualizado de cada flujo"
+    )
+    build.add_argument(
+        "--excel-dir",
+        required=True,
+        help="Directorio con los <flujo>_intents.xlsx (o .zip) curados",
+    )
+    build.add_argument(
+        "--splice",
+        action="store_true",
+        help="Reescribir solo el subárbol nluDomainVersion del YAML original",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(asctime)s %(processName)s %(name)s: %(message)s",
+    )
+    flows = _iter_flows(args.inputs)
+    if not flows:
+        print("No se encontraron flujos YAML en las entradas indicadas.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.command == "extract":
+        task, task_args = extract_flow, (
+            args.output_dir,
+            args.threshold,
+            args.semantic,
+            args.trace_memory,
+            args.format == "parquet",
+        )
+    else:
+        task, task_args = build_flow, (args.output_dir, args.excel_dir, args.splice)
+    summary = run_batch(task, flows, task_args, args.workers)
+
+    summary_path = os.path.join(args.output_dir, "summary.csv")
+    summary.to_csv(summary_path, index=False)
+    print(summary.drop(columns=["output"], errors="ignore").to_string(index=False))
+    print(f"\nResumen: {summary_path}")
+    return 0 if (summary["status"] == "ok").all() else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
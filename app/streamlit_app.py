@@ -1,10 +1,26 @@
 import streamlit as st
 import pandas as pd
+import contextlib
 import io
+import inspect
 import os
-from utils.extractor import extract_intents
-from utils.builder import build_yaml
+import subprocess
+import threading
+import time
+import uuid
+from utils.duplicates import DuplicateIndex
 from utils.builder import merge_into_original
+from utils import result_cache
+from utils import curation_io
+from utils import instrumentation
+from utils.curation_io import (
+    read_curation_file,
+    serialize_segments,
+    write_curation_bundle,
+    write_curation_excel,
+)
+from utils.extractor import intent_confusion
+from utils.jobs import QUEUED, JobCancelled, JobRunner
 from ruamel.yaml import YAML
 from io import StringIO
 import copy
@@ -114,6 +130,424 @@ def login():
             st.error(t("login_error"))
 
 
+# Umbral de similitud inicial para detectar duplicados (se ajusta en el paso 2)
+DUPLICATE_THRESHOLD = 90
+DUPLICATE_MIN_THRESHOLD = 80
+# En modo barrido los pares se calculan una vez con este umbral y los umbrales
+# mayores salen de cortar esos pares
+DUPLICATE_SWEEP_THRESHOLD = 85
+# Trabajos en segundo plano (extracción, duplicados, generación del YAML,
+# publicación): cuántos corren a la vez entre todas las sesiones, cuántos de
+# una misma sesión y cada cuántos segundos se refresca su progreso
+JOB_WORKERS = 2
+JOBS_PER_SESSION = 1
+JOB_POLL_SECONDS = 0.5
+# Hilos de cada detección de duplicados: los núcleos se reparten entre los
+# trabajos que pueden correr a la vez, para no sobresuscribir el servidor ni
+# multiplicar las matrices por bloque en memoria
+DUPLICATE_WORKERS = max(1, (os.cpu_count() or 1) // JOB_WORKERS)
+
+# Caché en memoria de resultados por hash de contenido: el mismo flujo subido
+# otra vez (o por otro usuario) no se vuelve a procesar. El segundo nivel, en
+# disco, lo maneja utils.result_cache (INTENTFLOW_CACHE_DIR).
+RESULT_CACHE_TTL_SECONDS = 3600
+RESULT_CACHE_MAX_ENTRIES = 16
+# Etapas que conserva el panel de rendimiento de la sesión
+PERFORMANCE_MAX_RECORDS = 200
+# Pestañas que solo ejecutan su contenido si están abiertas (st.tabs con
+# on_change y TabContainer.open, de versiones recientes de Streamlit)
+LAZY_TABS = "on_change" in inspect.signature(st.tabs).parameters
+
+
+def _tab_open(tab):
+    """Si la pestaña está abierta; sin pestañas perezosas, siempre."""
+    return tab.open if LAZY_TABS else True
+
+
+@st.cache_resource
+def _stage_results():
+    """
+    Resultados de la extracción, de los duplicados semánticos y de la
+    generación del YAML por hash de contenido, compartidos por todas las
+    sesiones: (lock, {clave: (hora, resultado)}). Solo se usan desde el hilo del script; los trabajos en
+    segundo plano van directo a utils.result_cache (el nivel en disco).
+    """
+    return threading.Lock(), {}
+
+
+def _recall_result(key):
+    """Resultado guardado con `key`, o None si no está o venció."""
+    lock, results = _stage_results()
+    with lock:
+        entry = results.get(key)
+        if entry is None or time.time() - entry[0] > RESULT_CACHE_TTL_SECONDS:
+            results.pop(key, None)
+            return None
+        # Una copia por sesión, como st.cache_data: nadie modifica la guardada
+        return copy.deepcopy(entry[1])
+
+
+def _remember_result(key, result):
+    lock, results = _stage_results()
+    with lock:
+        results[key] = (time.time(), copy.deepcopy(result))
+        # Se descartan los más viejos por encima del máximo
+        while len(results) > RESULT_CACHE_MAX_ENTRIES:
+            del results[min(results, key=lambda k: results[k][0])]
+
+
+def _df_for_duplicates(df_utterances):
+    """Columnas 'intent' y 'utterance' que esperan los detectores de duplicados."""
+    return df_utterances.rename(
+        columns={"intent_name": "intent", "utterance_text": "utterance"}
+    )[["intent", "utterance"]]
+
+
+@st.cache_resource
+def _job_runner():
+    """Hilos compartidos por todas las sesiones para las etapas largas."""
+    return JobRunner(max_workers=JOB_WORKERS, max_per_owner=JOBS_PER_SESSION)
+
+
+def _submit_job(name, func, *args, **kwargs):
+    """
+    Lanza `func(job, *args, **kwargs)` en segundo plano como trabajo de esta
+    sesión y devuelve el Job. `func` no puede usar comandos de Streamlit.
+    """
+    owner = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    return _job_runner().submit(owner, name, func, *args, **kwargs)
+
+
+def _stage_job(name, label):
+    """
+    Trabajo `name` de la sesión (extracción, generación, publicación). Si
+    sigue en curso muestra su progreso y devuelve None; si terminó lo quita
+    de la sesión y lo devuelve para que el paso lea su resultado.
+    """
+    jobs = st.session_state.setdefault("jobs", {})
+    job = jobs.get(name)
+    if job is None:
+        return None
+    if not job.done():
+        _jobs_progress({label: job})
+        return None
+    return jobs.pop(name)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _jobs_progress(jobs):
+    """
+    Progreso de los trabajos `jobs` ({etiqueta: Job}), con un botón para
+    cancelar los que se pueden cancelar. Cuando terminan todos, recarga la página para que el
+    paso muestre los resultados.
+    """
+    if all(job.done() for job in jobs.values()):
+        st.rerun()
+    for label, job in jobs.items():
+        if job.done():
+            continue
+        if job.status == QUEUED:
+            text = t("job_status_queued", label=label)
+        elif job.cancel_requested:
+            text = t("job_status_cancelling", label=label)
+        else:
+            text = t("job_status_running", label=label, seconds=int(job.seconds))
+        done, total = job.progress
+        progress_col, cancel_col = st.columns([5, 1], vertical_alignment="bottom")
+        progress_col.progress(min(done / total, 1.0) if total else 0.0, text=text)
+        # Un trabajo sin puntos de cancelación solo se cancela en la cola
+        if job.cancellable or job.status == QUEUED:
+            cancel_col.button(
+                t("job_button_cancel"),
+                key=f"cancel_{job.id}",
+                on_click=job.cancel,
+                disabled=job.cancel_requested,
+            )
+
+
+def _extract_job(job, yaml_digest, yaml_bytes):
+    """Extracción del paso 1, en segundo plano. Avanza por etapa."""
+    # Los duplicados no se calculan acá: ver _duplicate_results
+    return result_cache.cached_extract_intents(
+        yaml_bytes, yaml_digest, detect_duplicates=False, progress=job.report
+    )
+
+
+def _apply_extraction(yaml_filename, yaml_bytes, extraction):
+    """Carga en la sesión el resultado de la extracción y pasa al paso 2."""
+    (
+        df_utterances,
+        _,
+        df_entity_declarations,
+        df_entity_types,
+        df_intent_details,
+    ) = extraction
+    st.session_state.yaml_original_filename = (
+        yaml_filename  # Guardar el nombre del archivo
+    )
+    st.session_state.yaml_original = yaml_bytes
+    # El editor del paso 2 muestra (y devuelve) los segmentos como JSON
+    st.session_state.df_utterances = serialize_segments(df_utterances)
+    # Los duplicados del flujo anterior ya no sirven; los nuevos se calculan
+    # en el paso 2, cuando se pidan
+    for dup_job in _duplicate_jobs().values():
+        dup_job.cancel()
+    for key in (
+        "dup_results",
+        "dup_jobs",
+        "dup_indexes",
+        "dup_update_jobs",
+        "semantic_jobs",
+    ):
+        st.session_state.pop(key, None)
+    st.session_state.df_entity_declarations = df_entity_declarations
+    st.session_state.df_entity_types = df_entity_types
+    st.session_state.df_intent_details = df_intent_details  # Store new df
+    st.session_state.step = 2
+    st.rerun()
+
+
+def _duplicates_job(job, df_for_duplicates, threshold):
+    """
+    Arma el índice de duplicados del umbral, del que salen la tabla y la
+    matriz de confusión. Avanza (y se puede cancelar) por bloque comparado.
+    """
+    dup_index = DuplicateIndex(threshold=threshold, workers=DUPLICATE_WORKERS)
+    dup_index.update(df_for_duplicates, progress=job.report)
+    return dup_index
+
+
+def _duplicate_update_job(job, dup_index, df_for_duplicates, threshold):
+    """
+    Pone al día el índice de duplicados con las utterances editadas (solo se
+    comparan las filas nuevas) y arma (df_dups, df_confusion) de `threshold`.
+    Si se cancela, el índice queda como estaba.
+    """
+    with dup_index.lock:
+        dup_index.update(df_for_duplicates, progress=job.report)
+        return (
+            dup_index.to_frame(threshold),
+            intent_confusion(
+                df_for_duplicates,
+                threshold,
+                pair_blocks=lambda norms: dup_index.pair_blocks(norms, threshold),
+            ),
+        )
+
+
+def _semantic_job(job, df_for_duplicates, threshold):
+    """Pares de paráfrasis del modo semántico. Avanza por etapa."""
+    # Recién acá: los backends semánticos opcionales pueden importar torch
+    from utils.semantic import find_semantic_duplicates
+
+    return find_semantic_duplicates(
+        df_for_duplicates, fuzzy_threshold=threshold, progress=job.report
+    )
+
+
+def _build_job(job, build_key, df_utterances, df_intent_details, yaml_bytes):
+    """Paso 3: genera el bloque NLU y lo fusiona con el YAML original."""
+    job.report(0, 2)
+    nlu_block_str = result_cache.cached_build_yaml(
+        df_utterances, df_intent_details, yaml_bytes, key=build_key
+    )
+    job.report(1, 2)
+    yaml_parser = YAML()
+    nlu_block_dict = yaml_parser.load(nlu_block_str)
+    return merge_into_original(yaml_bytes, nlu_block_dict)
+
+
+def _publish_job(job, comando):
+    """Paso 4: corre Archy. Si se cancela el trabajo, se termina el proceso."""
+    process = subprocess.Popen(
+        comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=JOB_POLL_SECONDS)
+        except subprocess.TimeoutExpired:
+            if job.cancel_requested:
+                process.kill()
+                process.communicate()
+                job.raise_if_cancelled()
+            continue
+        return subprocess.CompletedProcess(comando, process.returncode, stdout, stderr)
+
+
+def _duplicate_results(threshold, wait=False):
+    """
+    (df_dups, df_confusion) de las utterances actuales con `threshold`, o
+    None si todavía se están calculando. La detección se lanza recién la
+    primera vez que se pide (pestañas de duplicados y confusión, exportación)
+    y corre en segundo plano; con wait=True se espera a que termine. Si el
+    usuario la canceló, devuelve None hasta que la relance (o se exporte).
+
+    Los índices quedan en la sesión por umbral base y responden cualquier
+    umbral mayor o igual cortando sus pares; en modo barrido el índice se
+    arma con DUPLICATE_SWEEP_THRESHOLD. Tras editar las utterances, el índice
+    se actualiza de forma incremental, también en segundo plano: solo se
+    comparan las filas agregadas o modificadas.
+    """
+    df_for_duplicates = _df_for_duplicates(st.session_state.df_utterances)
+    digest = result_cache.frames_digest(df_for_duplicates)
+    results = st.session_state.setdefault("dup_results", {})
+    if threshold in results and results[threshold][0] == digest:
+        return results[threshold][2:]
+
+    jobs = st.session_state.setdefault("dup_jobs", {})
+    dup_indexes = st.session_state.setdefault("dup_indexes", {})
+    # El índice (o, si no hay, el cálculo en curso) de umbral base más alto
+    # que cubra `threshold`; si no hay ninguno, se lanza uno
+    ready = [base for base in dup_indexes if base <= threshold]
+    running = [base for base in jobs if base <= threshold]
+    if ready:
+        base = max(ready)
+    elif running:
+        base = max(running)
+    else:
+        base = threshold
+        if st.session_state.get("dup_sweep"):
+            base = min(threshold, DUPLICATE_SWEEP_THRESHOLD)
+        # Los cálculos en curso tienen todos un umbral base mayor: el nuevo
+        # índice también responde sus umbrales, así que se cancelan
+        for stale_base in list(jobs):
+            jobs.pop(stale_base).cancel()
+        jobs[base] = _submit_job("duplicates", _duplicates_job, df_for_duplicates, base)
+    job = jobs.get(base) if not ready else None
+    if job is not None and job.cancelled and wait:
+        # La exportación necesita los duplicados: se vuelven a calcular
+        job = jobs[base] = _submit_job(
+            "duplicates", _duplicates_job, df_for_duplicates, base
+        )
+    if job is not None:
+        if job.cancelled or not (wait or job.done()):
+            return None
+        job.wait()
+        # Se quita antes de leer el resultado: si falló, se reintenta
+        del jobs[base]
+        dup_indexes[base] = job.result()
+
+    # El índice se pone al día con las ediciones en segundo plano; solo
+    # interesan el umbral y las utterances actuales
+    update_jobs = st.session_state.setdefault("dup_update_jobs", {})
+    key = (threshold, digest)
+    for stale_key in [stale_key for stale_key in update_jobs if stale_key != key]:
+        update_jobs.pop(stale_key).cancel()
+    job = update_jobs.get(key)
+    if job is None or (job.cancelled and wait):
+        job = update_jobs[key] = _submit_job(
+            "duplicates",
+            _duplicate_update_job,
+            dup_indexes[base],
+            df_for_duplicates,
+            threshold,
+        )
+    if job.cancelled or not (wait or job.done()):
+        return None
+    job.wait()
+    del update_jobs[key]  # Si falló, se reintenta
+    results[threshold] = (digest, base, *job.result())
+    return results[threshold][2:]
+
+
+def _duplicate_index(threshold):
+    """Índice con el que se calcularon los duplicados de `threshold`."""
+    base = st.session_state.dup_results[threshold][1]
+    return st.session_state.dup_indexes[base]
+
+
+def _duplicate_jobs():
+    """
+    Trabajos de duplicados de la sesión (armado de índices, su puesta al día
+    y modo semántico), como {(clave en la sesión, clave del trabajo): Job}.
+    """
+    return {
+        (session_key, job_key): job
+        for session_key in ("dup_jobs", "dup_update_jobs", "semantic_jobs")
+        for job_key, job in st.session_state.get(session_key, {}).items()
+    }
+
+
+def _duplicates_progress():
+    """
+    Progreso de las detecciones de duplicados en curso o, si el usuario las
+    canceló, un botón para relanzarlas.
+    """
+    jobs = _duplicate_jobs()
+    labels = {
+        "dup_jobs": lambda base: t("step2_progress_duplicates", threshold=base),
+        "dup_update_jobs": lambda key: t(
+            "step2_progress_duplicates_update", threshold=key[0]
+        ),
+        "semantic_jobs": lambda key: t("step2_progress_semantic", threshold=key[1]),
+    }
+    running = {
+        labels[session_key](job_key): job
+        for (session_key, job_key), job in sorted(
+            jobs.items(), key=lambda item: item[1].submitted_at
+        )
+        if not job.done()
+    }
+    if running:
+        _jobs_progress(running)
+    elif any(job.cancelled for job in jobs.values()):
+        st.info(t("step2_info_duplicates_cancelled"))
+        if st.button(t("step2_button_retry_duplicates")):
+            for (session_key, job_key), job in jobs.items():
+                if job.cancelled:
+                    del st.session_state[session_key][job_key]
+            st.rerun()
+    else:
+        st.rerun()  # Terminaron entre medio: se muestran los resultados
+
+
+def _duplicates_view(df_dups, threshold, wait=False):
+    """
+    Tabla de duplicados a mostrar y exportar: la de `df_dups` más, si está
+    activado el modo semántico, los pares de paráfrasis que no llegan a
+    `threshold` por fuzzy matching. Los pares semánticos se buscan en segundo
+    plano: devuelve None mientras tanto (o si se cancelaron), salvo con
+    wait=True, que los espera.
+    """
+    if not st.session_state.get("semantic_duplicates"):
+        return df_dups
+    df_for_duplicates = _df_for_duplicates(st.session_state.df_utterances)
+    key = (result_cache.frames_digest(df_for_duplicates), threshold)
+    df_semantic = _recall_result(("semantic", *key))
+    if df_semantic is None:
+        jobs = st.session_state.setdefault("semantic_jobs", {})
+        for stale_key in [stale_key for stale_key in jobs if stale_key != key]:
+            jobs.pop(stale_key).cancel()
+        job = jobs.get(key)
+        if job is None or (job.cancelled and wait):
+            job = jobs[key] = _submit_job(
+                "semantic", _semantic_job, df_for_duplicates, threshold
+            )
+        if job.cancelled or not (wait or job.done()):
+            return None
+        job.wait()
+        del jobs[key]  # Si falló, se reintenta
+        df_semantic = job.result()
+        _remember_result(("semantic", *key), df_semantic)
+    return pd.concat([df_dups, df_semantic], ignore_index=True)
+
+
+def _show_performance(placeholder):
+    """Panel de rendimiento: las etapas medidas en esta sesión, la última arriba."""
+    records = st.session_state.get("performance_records")
+    with placeholder.container():
+        if not records:
+            st.caption(t("sidebar_performance_empty"))
+            return
+        st.dataframe(
+            pd.DataFrame(records[::-1], columns=instrumentation.StageRecord._fields),
+            hide_index=True,
+        )
+        if st.button(t("sidebar_button_clear_performance")):
+            records.clear()
+            st.rerun()
+
+
 def main():
     # Inicializar y cargar idioma en el estado de la sesión si no está presente
     if "language" not in st.session_state:
@@ -175,6 +609,28 @@ def main():
             )
             st.rerun()
 
+        # Panel de rendimiento: mide las etapas del pipeline de esta sesión
+        performance_panel = None
+        if st.toggle(t("sidebar_toggle_performance"), key="show_performance"):
+            instrumentation.enable(
+                st.session_state.setdefault("performance_records", []),
+                trace_memory=st.checkbox(
+                    t("sidebar_checkbox_trace_memory"),
+                    key="performance_trace_memory",
+                ),
+                max_records=PERFORMANCE_MAX_RECORDS,
+            )
+            performance_panel = st.empty()
+        else:
+            instrumentation.disable()
+
+        # Carga de los trabajos en segundo plano, compartidos entre usuarios
+        running_jobs, queued_jobs = _job_runner().counts()
+        if running_jobs or queued_jobs:
+            st.caption(
+                t("sidebar_caption_jobs", running=running_jobs, queued=queued_jobs)
+            )
+
     st.title(t("wizard_title"))
 
     step_labels = [t("nav_step1"), t("nav_step2"), t("nav_step3"), t("nav_step4")]
@@ -198,81 +654,108 @@ def main():
         uploaded_yaml = st.file_uploader(
             t("step1_uploader_label"), type=["yaml", "yml"]
         )
-        if uploaded_yaml and st.button(t("step1_button_extract")):
+        extracting = "extract" in st.session_state.get("jobs", {})
+        if uploaded_yaml and st.button(t("step1_button_extract"), disabled=extracting):
+            # Los mismos bytes (y su parseo, compartido por hash de contenido)
+            # se reutilizan en la extracción y luego en el paso 3.
+            yaml_bytes = uploaded_yaml.getvalue()
+            yaml_digest = hashlib.sha256(yaml_bytes).hexdigest()
+            extraction = _recall_result(("extract", yaml_digest))
+            if extraction is not None:  # Ya extraído: pasa al paso 2 sin trabajo
+                _apply_extraction(uploaded_yaml.name, yaml_bytes, extraction)
+            st.session_state.extract_upload = (
+                uploaded_yaml.name,
+                yaml_bytes,
+                yaml_digest,
+            )
+            st.session_state.setdefault("jobs", {})["extract"] = _submit_job(
+                "extract", _extract_job, yaml_digest, yaml_bytes
+            )
+        # La extracción corre en segundo plano: sigue aunque la página se
+        # recargue y, al terminar, se pasa al paso 2
+        job = _stage_job("extract", t("job_label_extract"))
+        if job is not None:
+            yaml_filename, yaml_bytes, yaml_digest = st.session_state.pop(
+                "extract_upload"
+            )
             try:
-                (
-                    df_utterances,
-                    df_dups,
-                    df_entity_declarations,
-                    df_entity_types,
-                    df_intent_details,
-                ) = extract_intents(uploaded_yaml.read())
-                # --- DEBUGGING START ---
-                st.write("--- Debug Info: Entity DataFrames ---")
-                st.write(
-                    "df_entity_declarations (primeras 5 filas):",
-                    df_entity_declarations.head(),
-                )
-                st.write(
-                    "df_entity_declarations ¿está vacío?:", df_entity_declarations.empty
-                )
-                st.write("df_entity_types (primeras 5 filas):", df_entity_types.head())
-                st.write("df_entity_types ¿está vacío?:", df_entity_types.empty)
-                st.write("--- Debug Info End ---")
-                # --- DEBUGGING END ---
-                uploaded_yaml.seek(0)
-                st.session_state.yaml_original_filename = (
-                    uploaded_yaml.name
-                )  # Guardar el nombre del archivo
-                st.session_state.yaml_original = uploaded_yaml.read()
-                st.session_state.df_utterances = (
-                    df_utterances  # Renamed from df_intents
-                )
-                st.session_state.df_dups = df_dups
-                st.session_state.df_entity_declarations = df_entity_declarations
-                st.session_state.df_entity_types = df_entity_types
-                st.session_state.df_intent_details = df_intent_details  # Store new df
-                st.session_state.step = 2
-                st.rerun()
+                extraction = job.result()
+                _remember_result(("extract", yaml_digest), extraction)
+                _apply_extraction(yaml_filename, yaml_bytes, extraction)
+            except JobCancelled:
+                st.info(t("job_info_cancelled"))
             except Exception as e:
                 st.error(t("step1_error_yaml"))
                 st.exception(e)
 
     elif st.session_state.step == 2:
         st.header(t("step2_header"))
-        tabs = st.tabs([t("step2_tab_extracted"), t("step2_tab_duplicates")])
+        threshold = st.slider(
+            t("step2_slider_threshold"),
+            min_value=DUPLICATE_MIN_THRESHOLD,
+            max_value=100,
+            value=DUPLICATE_THRESHOLD,
+            key="dup_threshold",
+            help=t("step2_help_threshold"),
+        )
+        st.toggle(
+            t("step2_toggle_sweep", threshold=DUPLICATE_SWEEP_THRESHOLD),
+            key="dup_sweep",
+            help=t("step2_help_sweep"),
+        )
+        # Solo se ejecuta la pestaña abierta: los duplicados se calculan recién
+        # al abrir la de duplicados o la de confusión (o al exportar). Sin
+        # pestañas perezosas se ejecutan las tres en cada rerun.
+        tab_labels = [
+            t("step2_tab_extracted"),
+            t("step2_tab_duplicates"),
+            t("step2_tab_confusion"),
+        ]
+        if LAZY_TABS:
+            tabs = st.tabs(tab_labels, key="step2_tab", on_change="rerun")
+        else:
+            tabs = st.tabs(tab_labels)
         if st.button(t("step2_button_download_excel")):
+            with st.spinner(t("step2_spinner_duplicates")):
+                df_dups, df_confusion = _duplicate_results(threshold, wait=True)
+                df_dups_view = _duplicates_view(df_dups, threshold, wait=True)
             output = io.BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                st.session_state.df_utterances.to_excel(  # Use df_utterances
-                    writer, sheet_name="utterances", index=False  # Renamed sheet
-                )
-                st.session_state.df_dups.to_excel(
-                    writer, sheet_name="duplicados", index=False
+            trace_memory = instrumentation.is_enabled() and st.session_state.get(
+                "performance_trace_memory", False
+            )
+            # tracemalloc es global: no se mide a la par de otra sesión
+            trace_context = (
+                instrumentation.trace_lock if trace_memory else contextlib.nullcontext()
+            )
+            with trace_context:
+                export_stats = write_curation_excel(
+                    output,
+                    st.session_state.df_utterances,
+                    df_dups_view,
+                    st.session_state.get("df_intent_details"),
+                    st.session_state.get("df_entity_declarations"),
+                    st.session_state.get("df_entity_types"),
+                    df_confusion,
+                    trace_memory=trace_memory,
                 )
-                if (
-                    "df_intent_details" in st.session_state
-                    and not st.session_state.df_intent_details.empty
-                ):
-                    st.session_state.df_intent_details.to_excel(
-                        writer, sheet_name="intents", index=False
-                    )  # New sheet for intent details
-                # El paréntesis extra estaba aquí y ha sido eliminado.
-                if (
-                    "df_entity_declarations" in st.session_state
-                    and not st.session_state.df_entity_declarations.empty
-                ):
-                    st.session_state.df_entity_declarations.to_excel(
-                        writer, sheet_name="EntityDeclarations", index=False
-                    )
-                if (
-                    "df_entity_types" in st.session_state
-                    and not st.session_state.df_entity_types.empty
-                ):
-                    st.session_state.df_entity_types.to_excel(
-                        writer, sheet_name="EntityTypeDefinitions", index=False
-                    )
+            instrumentation.record(
+                "write_curation_excel",
+                export_stats["seconds"],
+                export_stats["rows"],
+                export_stats["peak_mb"],
+            )
             output.seek(0)
+            export_caption = t(
+                "step2_caption_export_stats",
+                rows=export_stats["rows"],
+                seconds=export_stats["seconds"],
+                engine=export_stats["engine"],
+            )
+            if export_stats["peak_mb"] is not None:
+                export_caption += " " + t(
+                    "step2_caption_export_peak", peak_mb=export_stats["peak_mb"]
+                )
+            st.caption(export_caption)
 
             # Construir el nombre del archivo Excel dinámicamente
             original_yaml_basename = (
@@ -292,28 +775,91 @@ def main():
                 file_name=excel_file_name,  # Usar el nombre de archivo dinámico
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             )
-        with tabs[0]:
-            st.subheader(t("step2_subheader_intents_list"))
-            edited_df = st.data_editor(
-                st.session_state.df_utterances,  # Edit df_utterances
-                num_rows="dynamic",
-                use_container_width=True,
-            )
-            st.session_state.df_utterances = edited_df  # Store back to df_utterances
-
-        with tabs[1]:
-            st.subheader(t("step2_subheader_duplicates"))
+            # Paquete Parquet con las mismas tablas, para herramientas fuera de Excel
+            if curation_io.pyarrow is not None:
+                bundle_output = io.BytesIO()
+                write_curation_bundle(
+                    bundle_output,
+                    st.session_state.df_utterances,
+                    df_dups_view,
+                    st.session_state.get("df_intent_details"),
+                    st.session_state.get("df_entity_declarations"),
+                    st.session_state.get("df_entity_types"),
+                    df_confusion,
+                )
+                st.download_button(
+                    label=t("step2_download_bundle_label"),
+                    data=bundle_output.getvalue(),
+                    file_name=f"{original_yaml_basename}_intents.zip",
+                    mime="application/zip",
+                )
+        if _tab_open(tabs[0]):
+            with tabs[0]:
+                st.subheader(t("step2_subheader_intents_list"))
+                edited_df = st.data_editor(
+                    st.session_state.df_utterances,  # Edit df_utterances
+                    num_rows="dynamic",
+                    use_container_width=True,
+                )
+                # Store back to df_utterances
+                st.session_state.df_utterances = edited_df
+
+        if _tab_open(tabs[1]):
+            with tabs[1]:
+                st.subheader(t("step2_subheader_duplicates"))
+                st.toggle(
+                    t("step2_toggle_semantic"),
+                    key="semantic_duplicates",
+                    help=t("step2_help_semantic"),
+                )
 
-            def highlight_cross_intents(row):
-                return [
-                    "background-color: #ffd6d6" if row["mismo_intent"] == False else ""
-                    for _ in row
-                ]
+                def highlight_cross_intents(row):
+                    return [
+                        (
+                            "background-color: #ffd6d6"
+                            if row["mismo_intent"] == False
+                            else ""
+                        )
+                        for _ in row
+                    ]
 
-            styled_dups = st.session_state.df_dups.style.apply(
-                highlight_cross_intents, axis=1
-            )
-            st.dataframe(styled_dups, use_container_width=True)
+                dup_results = _duplicate_results(threshold)
+                df_dups_view = None
+                if dup_results is not None:
+                    df_dups_view = _duplicates_view(dup_results[0], threshold)
+                if df_dups_view is None:
+                    _duplicates_progress()
+                else:
+                    if st.session_state.get("dup_sweep"):
+                        # Pares por score: cuántos se ganan o pierden al mover
+                        # el umbral
+                        dup_index = _duplicate_index(threshold)
+                        st.caption(
+                            t(
+                                "step2_caption_sweep",
+                                pairs=dup_index.pair_count(threshold),
+                                threshold=threshold,
+                            )
+                        )
+                        st.bar_chart(dup_index.score_histogram(), height=160)
+                    styled_dups = df_dups_view.style.apply(
+                        highlight_cross_intents, axis=1
+                    )
+                    st.dataframe(styled_dups, use_container_width=True)
+
+        if _tab_open(tabs[2]):
+            with tabs[2]:
+                st.subheader(t("step2_subheader_confusion"))
+                st.caption(t("step2_caption_confusion"))
+                dup_results = _duplicate_results(threshold)
+                if dup_results is None and not LAZY_TABS:
+                    # El progreso (y su botón de cancelar) ya está en la
+                    # pestaña de duplicados, que también se ejecutó
+                    st.info(t("step2_spinner_duplicates"))
+                elif dup_results is None:
+                    _duplicates_progress()
+                else:
+                    st.dataframe(dup_results[1], use_container_width=True)
 
         if st.button(t("step2_button_confirm_curation")):
             st.success(t("step2_success_curation_confirmed"))
@@ -344,33 +890,15 @@ def main():
         st.markdown(f"#### {t('step3_subheader_load_excel')}")
         st.markdown(t("step3_markdown_upload_excel"))
         uploaded_excel = st.file_uploader(
-            t("step3_uploader_excel_label"), type=["xlsx"]
+            t("step3_uploader_excel_label"), type=["xlsx", "zip"]
         )
 
         if uploaded_excel:
             try:
-                # Leer la hoja de enunciados
-                df_utterances_excel = pd.read_excel(
-                    uploaded_excel, sheet_name="utterances"
+                df_utterances_excel, df_intent_details_excel = read_curation_file(
+                    uploaded_excel, uploaded_excel.name
                 )
-                # Asegurarse que la columna utterance_id exista
-                if "utterance_id" not in df_utterances_excel.columns:
-                    df_utterances_excel["utterance_id"] = None
-                # Renombrar columnas para compatibilidad con build_yaml
-                if "intent_name" in df_utterances_excel.columns:
-                    df_utterances_excel = df_utterances_excel.rename(
-                        columns={"intent_name": "intent"}
-                    )
-                if "utterance_text" in df_utterances_excel.columns:
-                    df_utterances_excel = df_utterances_excel.rename(
-                        columns={"utterance_text": "utterance"}
-                    )
                 st.session_state.df_utterances_from_excel = df_utterances_excel
-
-                # Leer la hoja de detalles de intenciones
-                df_intent_details_excel = pd.read_excel(
-                    uploaded_excel, sheet_name="intents"
-                )
                 st.session_state.df_intent_details_from_excel = df_intent_details_excel
 
                 st.success(t("step3_success_excel_loaded"))
@@ -378,7 +906,8 @@ def main():
                 st.error(t("step3_error_excel_read"))
                 st.exception(e)
 
-        if st.button(t("step3_button_generate_yaml")):
+        building = "build" in st.session_state.get("jobs", {})
+        if st.button(t("step3_button_generate_yaml"), disabled=building):
             if (
                 "df_utterances_from_excel" not in st.session_state
                 or st.session_state.df_utterances_from_excel.empty
@@ -396,46 +925,65 @@ def main():
             if "yaml_original" not in st.session_state:
                 st.error(t("step3_error_no_original_yaml"))
             else:
+                st.session_state.pop("yaml_generated", None)
                 try:
-                    # Convertir string YAML a dict
-                    nlu_block_str = build_yaml(
-                        df_utterances=st.session_state.df_utterances_from_excel,  # Pasar df_utterances
-                        df_intent_details=st.session_state.df_intent_details_from_excel,  # Pasar df_intent_details
-                        original_yaml_content_for_ids=st.session_state.yaml_original,
-                    )
-                    yaml_parser = YAML()
-                    nlu_block_dict = yaml_parser.load(nlu_block_str)
-
-                    # Fusionar con YAML original (el de st.session_state.yaml_original)
-                    yaml_completo = merge_into_original(
-                        st.session_state.yaml_original, nlu_block_dict
-                    )
-
-                    # Construir el nombre del archivo YAML de salida dinámicamente para la descarga
-                    original_yaml_basename_for_output = (
-                        "flow_generated"  # Valor por defecto
-                    )
-                    if (
-                        "yaml_original_filename" in st.session_state
-                        and st.session_state.yaml_original_filename
-                    ):
-                        original_yaml_basename_for_output = os.path.splitext(
-                            st.session_state.yaml_original_filename
-                        )[0]
-                    output_yaml_filename = (
-                        f"{original_yaml_basename_for_output}_update.yaml"
-                    )
-
-                    # Mostrar botón de descarga
-                    st.download_button(
-                        label=t("step3_download_yaml_label"),
-                        data=yaml_completo,
-                        file_name=output_yaml_filename,  # Usar el nombre de archivo dinámico
-                        mime="application/x-yaml",
+                    build_key = result_cache.build_yaml_key(
+                        st.session_state.df_utterances_from_excel,
+                        st.session_state.df_intent_details_from_excel,
+                        st.session_state.yaml_original,
                     )
                 except Exception as e:
                     st.error(t("step3_error_generate_yaml"))
                     st.exception(e)
+                    return
+                yaml_generated = _recall_result(("build", build_key))
+                if yaml_generated is not None:
+                    st.session_state.yaml_generated = yaml_generated
+                else:
+                    # Generación del bloque NLU y merge en segundo plano
+                    st.session_state.build_pending = build_key
+                    st.session_state.setdefault("jobs", {})["build"] = _submit_job(
+                        "build",
+                        _build_job,
+                        build_key,
+                        st.session_state.df_utterances_from_excel,  # Pasar df_utterances
+                        st.session_state.df_intent_details_from_excel,  # Pasar df_intent_details
+                        st.session_state.yaml_original,
+                    )
+
+        job = _stage_job("build", t("job_label_build"))
+        if job is not None:
+            build_key = st.session_state.pop("build_pending", None)
+            try:
+                # El YAML completo queda en la sesión: la descarga sobrevive a
+                # las recargas de la página
+                st.session_state.yaml_generated = job.result()
+                _remember_result(("build", build_key), st.session_state.yaml_generated)
+            except JobCancelled:
+                st.info(t("job_info_cancelled"))
+            except Exception as e:
+                st.error(t("step3_error_generate_yaml"))
+                st.exception(e)
+
+        if "yaml_generated" in st.session_state:
+            # Construir el nombre del archivo YAML de salida dinámicamente para la descarga
+            original_yaml_basename_for_output = "flow_generated"  # Valor por defecto
+            if (
+                "yaml_original_filename" in st.session_state
+                and st.session_state.yaml_original_filename
+            ):
+                original_yaml_basename_for_output = os.path.splitext(
+                    st.session_state.yaml_original_filename
+                )[0]
+            output_yaml_filename = f"{original_yaml_basename_for_output}_update.yaml"
+
+            # Mostrar botón de descarga
+            st.download_button(
+                label=t("step3_download_yaml_label"),
+                data=st.session_state.yaml_generated,
+                file_name=output_yaml_filename,  # Usar el nombre de archivo dinámico
+                mime="application/x-yaml",
+            )
     elif st.session_state.step == 4:
         st.header(t("step4_header"))
         st.markdown(t("step4_markdown_upload_yaml"))
@@ -480,7 +1028,8 @@ def main():
             ],
         )
 
-        if st.button(t("step4_button_publish")):
+        publishing = "publish" in st.session_state.get("jobs", {})
+        if st.button(t("step4_button_publish"), disabled=publishing):
             # Verificar si el archivo YAML fue cargado y guardado en el servidor
             yaml_file_for_archy_exists = yaml_uploaded is not None and os.path.exists(
                 server_side_yaml_path_for_archy
@@ -495,94 +1044,89 @@ def main():
                         t("step4_warning_no_yaml_uploaded_for_publish")
                     )  # Nueva clave de traducción
             else:
-                try:
-                    import subprocess
-
-                    comando = [
-                        "/usr/local/bin/archy",
-                        "update",
-                        "--file",
-                        server_side_yaml_path_for_archy,  # Usar la ruta del archivo en el servidor
-                        "--clientId",
-                        client_id,
-                        "--clientSecret",
-                        client_secret,
-                        "--location",
-                        location,
-                    ]
+                comando = [
+                    "/usr/local/bin/archy",
+                    "update",
+                    "--file",
+                    server_side_yaml_path_for_archy,  # Usar la ruta del archivo en el servidor
+                    "--clientId",
+                    client_id,
+                    "--clientSecret",
+                    client_secret,
+                    "--location",
+                    location,
+                ]
+                # Archy corre en segundo plano; su salida queda en la sesión
+                st.session_state.pop("publish_result", None)
+                st.session_state.setdefault("jobs", {})["publish"] = _submit_job(
+                    "publish", _publish_job, comando
+                )
 
-                    st.markdown(
-                        t("step4_markdown_executing_command", command=" ".join(comando))
-                    )
+        job = _stage_job("publish", t("job_label_publish"))
+        if job is not None:
+            try:
+                st.session_state.publish_result = job.result()
+            except JobCancelled:
+                st.info(t("job_info_cancelled"))
+            except FileNotFoundError:  # Específico para el ejecutable de Archy
+                st.error(t("step4_error_archy_not_found_executable"))
+            except Exception as e:
+                st.error(t("step4_error_archy_execution"))
+                st.exception(e)
 
-                    result = subprocess.run(
-                        comando,
-                        capture_output=True,
-                        text=True,
-                    )
+        result = st.session_state.get("publish_result")
+        if result is not None:
+            st.markdown(
+                t("step4_markdown_executing_command", command=" ".join(result.args))
+            )
 
-                    st.markdown(f"#### {t('step4_markdown_stdout')}")
-                    st.code(
-                        result.stdout or t("step4_text_empty_output"), language="bash"
-                    )
+            st.markdown(f"#### {t('step4_markdown_stdout')}")
+            st.code(result.stdout or t("step4_text_empty_output"), language="bash")
 
-                    st.markdown(f"#### {t('step4_markdown_stderr')}")
-                    st.code(
-                        result.stderr or t("step4_text_empty_output"), language="bash"
-                    )
+            st.markdown(f"#### {t('step4_markdown_stderr')}")
+            st.code(result.stderr or t("step4_text_empty_output"), language="bash")
 
-                    if result.returncode == 0:
-                        st.success(t("step4_success_publish"))
-                    else:
-                        st.error(t("step4_error_publish"))
-                        # Intentar mostrar logs de Archy
-                        try:
-                            log_dir = "/opt/archy/debug"
-                            if os.path.exists(log_dir):
-                                logs = sorted(
-                                    [
-                                        f
-                                        for f in os.listdir(log_dir)
-                                        if f.endswith(".txt")
-                                    ]
-                                )
-                                latest_log = logs[-1] if logs else None
-
-                                if latest_log:
-                                    st.markdown(f"#### {t('step4_markdown_archy_log')}")
-                                    with open(
-                                        os.path.join(log_dir, latest_log), "r"
-                                    ) as f:
-                                        log_contents = f.read()
-
-                                    st.download_button(
-                                        label=t(
-                                            "step4_download_log_label",
-                                            log_file=latest_log,
-                                        ),
-                                        data=log_contents,
-                                        file_name=latest_log,
-                                        mime="text/plain",
-                                    )
-                            elif (
-                                result.returncode != 0
-                            ):  # Solo mostrar si hubo un error en Archy y el dir no existe
-                                st.info(
-                                    t("step4_info_log_dir_not_found", log_dir=log_dir)
-                                )
-                        except Exception as log_ex:
-                            st.warning(
-                                t(
-                                    "step4_warning_log_processing_error",
-                                    error=str(log_ex),
-                                )
+            if result.returncode == 0:
+                st.success(t("step4_success_publish"))
+            else:
+                st.error(t("step4_error_publish"))
+                # Intentar mostrar logs de Archy
+                try:
+                    log_dir = "/opt/archy/debug"
+                    if os.path.exists(log_dir):
+                        logs = sorted(
+                            [f for f in os.listdir(log_dir) if f.endswith(".txt")]
+                        )
+                        latest_log = logs[-1] if logs else None
+
+                        if latest_log:
+                            st.markdown(f"#### {t('step4_markdown_archy_log')}")
+                            with open(os.path.join(log_dir, latest_log), "r") as f:
+                                log_contents = f.read()
+
+                            st.download_button(
+                                label=t(
+                                    "step4_download_log_label",
+                                    log_file=latest_log,
+                                ),
+                                data=log_contents,
+                                file_name=latest_log,
+                                mime="text/plain",
                             )
+                    elif (
+                        result.returncode != 0
+                    ):  # Solo mostrar si hubo un error en Archy y el dir no existe
+                        st.info(t("step4_info_log_dir_not_found", log_dir=log_dir))
+                except Exception as log_ex:
+                    st.warning(
+                        t(
+                            "step4_warning_log_processing_error",
+                            error=str(log_ex),
+                        )
+                    )
 
-                except FileNotFoundError:  # Específico para el ejecutable de Archy
-                    st.error(t("step4_error_archy_not_found_executable"))
-                except Exception as e:
-                    st.error(t("step4_error_archy_execution"))
-                    st.exception(e)
+    if performance_panel is not None:
+        _show_performance(performance_panel)
 
 
 if __name__ == "__main__":
@@ -1,3 +1,6 @@
+import logging
+
+import numpy as np
 import pandas as pd
 from ruamel.yaml import YAML
 import os
@@ -7,35 +10,91 @@ import uuid
 import json  # Para cargar segments_original
 import copy
 
+logger = logging.getLogger(__name__)
+
 # Intentar importar BotFlowLoader. Asumimos que sys.path está configurado
 # correctamente por el script principal (streamlit_app.py) o la estructura del proyecto.
 try:
-    from auto_train.loader import BotFlowLoader
+    from auto_train.loader import BotFlowLoader, parse_flow, segments_to_dicts
 except ImportError:
     # Fallback o manejo de error si es necesario, aunque idealmente el path está bien.
-    print(
-        "Warning: BotFlowLoader could not be imported in builder.py. ID preservation from original YAML might fail."
+    logger.warning(
+        "BotFlowLoader could not be imported in builder.py. ID preservation from original YAML might fail."
     )
     BotFlowLoader = None
+    parse_flow = None
+    segments_to_dicts = None
 
+from utils.instrumentation import stage, staged
+from utils.normalizer import normalize_series
 
-# Copiamos la función normalize para evitar dependencias directas con extractor.py
-# y para asegurar su disponibilidad aquí.
-def normalize_for_builder(text: str) -> str:
-    if not isinstance(text, str):  # Manejar datos que no sean string
-        return ""
-    t = text.strip().lower()
-    t = (
-        t.replace("á", "a")
-        .replace("é", "e")
-        .replace("í", "i")
-        .replace("ó", "o")
-        .replace("ú", "u")
-        .replace("ñ", "n")
-    )
-    t = re.sub(r"[¿\?¡!.,;:]+", "", t)
-    t = re.sub(r"\s+", " ", t)
-    return t
+try:  # orjson es opcional: decodifica segments_original bastante más rápido
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _loads_segments(raw: str):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # p. ej. NaN o enteros muy grandes: se reintenta con json
+    return json.loads(raw)
+
+
+def _decode_segments(raw_segments: list, texts: list) -> list:
+    """
+    Decodifica en una sola pasada la columna segments_original: texto JSON
+    (Excel) o tuplas de segmentos (recién extraídos). Si un valor falta, no es
+    JSON válido o no es una lista de diccionarios, el utterance queda como un
+    único segmento de texto plano.
+    """
+    segments_column = []
+    for raw, text in zip(raw_segments, texts):
+        segments = None
+        if isinstance(raw, str) and raw.strip():
+            try:
+                segments = _loads_segments(raw)
+            except ValueError:  # JSONDecodeError (json y orjson)
+                segments = None
+        elif isinstance(raw, (list, tuple)) and segments_to_dicts is not None:
+            segments = segments_to_dicts(raw)
+        if not (
+            segments
+            and isinstance(segments, list)
+            and all(isinstance(s, dict) for s in segments)
+        ):
+            segments = [{"text": text}]
+        segments_column.append(segments)
+    return segments_column
+
+
+def _explicit_utterance_id(value):
+    """ID indicado en el Excel, como string, o None si la celda está vacía."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if not value or not str(value).strip():
+        return None
+    return str(value)
+
+
+def _resolve_utterance_ids(
+    utterance_ids: pd.Series, texts: pd.Series, original_utterance_ids_map: dict
+) -> list:
+    """
+    ID de cada utterance: el del Excel si existe; si no, el del YAML original
+    para el mismo texto normalizado; si no, un UUID nuevo.
+    """
+    resolved = utterance_ids.map(_explicit_utterance_id)
+    missing = resolved.isna()
+    if missing.any() and original_utterance_ids_map:
+        resolved[missing] = normalize_series(texts[missing]).map(
+            original_utterance_ids_map
+        )
+        missing = resolved.isna()
+    resolved[missing] = [str(uuid.uuid4()) for _ in range(int(missing.sum()))]
+    return resolved.tolist()
 
 
 def build_nlu_yaml_block(
@@ -46,6 +105,7 @@ def build_nlu_yaml_block(
     """
     Construye el bloque NLU (solo la parte de 'settingsNaturalLanguageUnderstanding')
     basado en los DataFrames de enunciados y detalles de intenciones.
+    Segmentos e IDs se resuelven por columna, no fila a fila.
     """
     block = {
         "settingsNaturalLanguageUnderstanding": {
@@ -69,77 +129,53 @@ def build_nlu_yaml_block(
     # df_utterances ya tiene las columnas renombradas a 'intent' y 'utterance'
     # por streamlit_app.py antes de llamar a esta función.
     # También debería tener 'utterance_id', 'segments_original'.
+    n_rows = len(df_utterances)
+    texts = df_utterances["utterance"].reset_index(drop=True)
+    empty_column = pd.Series([None] * n_rows, dtype=object)
+    utterance_ids = (
+        df_utterances["utterance_id"].reset_index(drop=True).astype(object)
+        if "utterance_id" in df_utterances
+        else empty_column
+    )
+    raw_segments = (
+        df_utterances["segments_original"].tolist()
+        if "segments_original" in df_utterances
+        else empty_column.tolist()
+    )
 
-    for intent_name_from_excel, group in df_utterances.groupby(
-        "intent"
-    ):  # 'intent' es la columna con el nombre de la intención
-        utterances_for_intent = []
+    # Intenciones en orden alfabético (como groupby) y utterances en su orden
+    # original; las filas sin intención se descartan.
+    codes, intent_names = pd.factorize(df_utterances["intent"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    bounds = np.searchsorted(codes[order], np.arange(len(intent_names) + 1))
+
+    texts = texts.iloc[order].reset_index(drop=True)
+    text_values = texts.tolist()
+    segments_column = _decode_segments([raw_segments[i] for i in order], text_values)
+    ids_column = _resolve_utterance_ids(
+        utterance_ids.iloc[order].reset_index(drop=True),
+        texts,
+        original_utterance_ids_map,
+    )
 
+    for k, intent_name_from_excel in enumerate(intent_names.tolist()):
         # Obtener el ID original de la intención usando el nombre de la intención
         intent_id_to_use = intent_id_map.get(intent_name_from_excel)
 
         if not intent_id_to_use:
-            print(
-                f"ADVERTENCIA: La intención '{intent_name_from_excel}' de la hoja 'utterances' no se encontró en la hoja 'intents'. Se generará un nuevo ID para la intención."
+            logger.warning(
+                "La intención '%s' de la hoja 'utterances' no se encontró en la hoja 'intents'. Se generará un nuevo ID para la intención.",
+                intent_name_from_excel,
             )
             intent_id_to_use = str(uuid.uuid4())
 
-        for _, row in group.iterrows():
-            utterance_text = row["utterance"]
-            utterance_id_excel = row.get("utterance_id")
-            segments_original_str = row.get("segments_original")
-
-            # Lógica para los segmentos del utterance
-            segments = []
-            if (
-                segments_original_str
-                and isinstance(segments_original_str, str)
-                and segments_original_str.strip()
-            ):
-                try:
-                    parsed_segments = json.loads(segments_original_str)
-                    if isinstance(parsed_segments, list) and all(
-                        isinstance(s, dict) for s in parsed_segments
-                    ):
-                        segments = parsed_segments
-                    else:
-                        # print(f"Advertencia: segments_original para '{utterance_text}' no es una lista de diccionarios válida. Usando texto plano.")
-                        segments = [{"text": utterance_text}]
-                except json.JSONDecodeError:
-                    # print(f"Advertencia: JSONDecodeError en segments_original para '{utterance_text}'. Usando texto plano.")
-                    segments = [{"text": utterance_text}]
-            else:
-                segments = [{"text": utterance_text}]
-
-            if not segments:  # Asegurar que segments nunca esté vacío
-                segments = [{"text": utterance_text}]
-
-            # Lógica para el ID del utterance
-            final_utterance_id = None
-            if (
-                utterance_id_excel
-                and pd.notna(utterance_id_excel)
-                and str(utterance_id_excel).strip()
-            ):
-                final_utterance_id = str(utterance_id_excel)
-            else:
-                norm_text = normalize_for_builder(utterance_text)
-                if norm_text in original_utterance_ids_map:
-                    final_utterance_id = original_utterance_ids_map[norm_text]
-
-            if not final_utterance_id:
-                final_utterance_id = str(uuid.uuid4())
-
-            utterances_for_intent.append(
-                {
-                    "segments": segments,
-                    "id": final_utterance_id,
-                    "source": "User",
-                }
-            )
-
+        rows = range(bounds[k], bounds[k + 1])
         intent_data = {
-            "utterances": utterances_for_intent,
+            "utterances": [
+                {"segments": segments_column[i], "id": ids_column[i], "source": "User"}
+                for i in rows
+            ],
             "entityNameReferences": [],
             "id": intent_id_to_use,  # Usar el ID de la intención original/especificado
             "name": intent_name_from_excel,
@@ -163,21 +199,23 @@ def get_original_utterance_ids_map_from_yaml_bytes(yaml_bytes: bytes) -> dict:
         return {}
     try:
         flow = BotFlowLoader.load_from_bytes(yaml_bytes)
-        id_map = {}
+        texts, ids = [], []
         for intent_obj in flow.get_intents():
             for utt_obj in intent_obj.utterances:
                 if isinstance(utt_obj.text, str) and utt_obj.id:
-                    norm_text = normalize_for_builder(utt_obj.text)
-                    if (
-                        norm_text not in id_map
-                    ):  # Priorizar el primer ID encontrado para un texto normalizado
-                        id_map[norm_text] = utt_obj.id
+                    texts.append(utt_obj.text)
+                    ids.append(utt_obj.id)
+        id_map = {}
+        for norm_text, utt_id in zip(normalize_series(pd.Series(texts)), ids):
+            # Priorizar el primer ID encontrado para un texto normalizado
+            id_map.setdefault(norm_text, utt_id)
         return id_map
     except Exception as e:
-        print(f"Error al parsear YAML original para IDs en builder.py: {e}")
+        logger.error("Error al parsear YAML original para IDs en builder.py: %s", e)
         return {}
 
 
+@staged("build_yaml")
 def build_yaml(
     df_utterances: pd.DataFrame,  # Renombrado de df_intents
     df_intent_details: pd.DataFrame,  # Nuevo DataFrame con detalles de intenciones
@@ -188,14 +226,18 @@ def build_yaml(
     """
     original_utterance_ids_map = {}
     if original_yaml_content_for_ids:
-        original_utterance_ids_map = get_original_utterance_ids_map_from_yaml_bytes(
-            original_yaml_content_for_ids
-        )
+        with stage("original_utterance_ids") as current:
+            original_utterance_ids_map = get_original_utterance_ids_map_from_yaml_bytes(
+                original_yaml_content_for_ids
+            )
+            current.rows = len(original_utterance_ids_map)
 
     # La función build_nlu_yaml_block ahora toma los DataFrames directamente
-    nlu_yaml_block_dict = build_nlu_yaml_block(
-        df_utterances, df_intent_details, original_utterance_ids_map
-    )
+    with stage("nlu_block") as current:
+        nlu_yaml_block_dict = build_nlu_yaml_block(
+            df_utterances, df_intent_details, original_utterance_ids_map
+        )
+        current.rows = len(df_utterances)
 
     yaml = YAML()
     # yaml.preserve_quotes = True # Puede causar problemas con strings multilínea si no se maneja con cuidado
@@ -205,30 +247,18 @@ def build_yaml(
     yaml.indent(mapping=2, sequence=4, offset=2)
     yaml.width = 4096  # prevenir cortes de línea
     stream = StringIO()
-    yaml.dump(nlu_yaml_block_dict, stream)
+    with stage("nlu_block_dump"):
+        yaml.dump(nlu_yaml_block_dict, stream)
     return stream.getvalue()
 
 
-# ✅ merge_into_original sin el pop innecesario
-def merge_into_original(original_yaml_bytes: bytes, new_nlu_block: dict) -> str:
-    yaml = YAML()
-    yaml.preserve_quotes = True
-    # yaml.default_flow_style = False # Comentado para permitir que ruamel decida, puede mejorar legibilidad
-    yaml.indent(mapping=2, sequence=4, offset=2)
-    yaml.width = 4096
-
-    original_data = yaml.load(original_yaml_bytes)
-
-    if "botFlow" not in original_data:
-        raise KeyError("El YAML original no contiene 'botFlow'")
-
-    # Acceder al bloque NLU del YAML original
-    original_bot_flow = original_data.get("botFlow", {})
-    original_nlu_settings = original_bot_flow.get(
-        "settingsNaturalLanguageUnderstanding", {}
-    )
-    original_nlu_domain_version = original_nlu_settings.get("nluDomainVersion", {})
-
+def _final_nlu_domain_version(
+    original_nlu_domain_version: dict, new_nlu_block: dict
+) -> dict:
+    """
+    nluDomainVersion resultante del merge: las intenciones nuevas junto con
+    entidades, tipos, idioma y versiones del original.
+    """
     # Obtener entidades y tipos de entidad del YAML original para preservarlos
     # (Asumiendo que no se modifican a través del Excel en este flujo)
     preserved_entities = original_nlu_domain_version.get("entities", [])
@@ -259,37 +289,107 @@ def merge_into_original(original_yaml_bytes: bytes, new_nlu_block: dict) -> str:
     }
 
     # Reinsertar entityNameReferences y description si existen en el original
-    # y el intent_name coincide
-    if "intents" in original_nlu_domain_version:
-        for orig_intent_data in original_nlu_domain_version.get("intents", []):
-            tgt = next(
-                (
-                    intent_dict
-                    for intent_dict in final_nlu_domain_version["intents"]
-                    if intent_dict.get("name") == orig_intent_data.get("name")
-                ),
-                None,
-            )
-            if tgt:
-                if "entityNameReferences" in orig_intent_data:
-                    tgt["entityNameReferences"] = orig_intent_data[
-                        "entityNameReferences"
-                    ]
-                if (
-                    "description" in orig_intent_data and "description" not in tgt
-                ):  # Solo si no se puso desde Excel
-                    tgt["description"] = orig_intent_data["description"]
-
-    # Actualizar el bloque NLU en la estructura de datos original
-    original_data["botFlow"]["settingsNaturalLanguageUnderstanding"][
-        "nluDomainVersion"
-    ] = final_nlu_domain_version
-    # Preservar mutedUtterances si existe en el original
-    if "mutedUtterances" in original_nlu_settings:
-        original_data["botFlow"]["settingsNaturalLanguageUnderstanding"][
-            "mutedUtterances"
-        ] = original_nlu_settings["mutedUtterances"]
+    # y el intent_name coincide. Una sola pasada sobre el original, buscando
+    # por nombre (si un nombre se repite, gana la primera intención nueva).
+    new_intents_by_name = {}
+    for intent_dict in new_intents_list:
+        new_intents_by_name.setdefault(intent_dict.get("name"), intent_dict)
+    for orig_intent_data in original_nlu_domain_version.get("intents") or []:
+        tgt = new_intents_by_name.get(orig_intent_data.get("name"))
+        if tgt:
+            if "entityNameReferences" in orig_intent_data:
+                tgt["entityNameReferences"] = orig_intent_data["entityNameReferences"]
+            if (
+                "description" in orig_intent_data and "description" not in tgt
+            ):  # Solo si no se puso desde Excel
+                tgt["description"] = orig_intent_data["description"]
+
+    return final_nlu_domain_version
+
+
+def _splice_nlu_domain_version(
+    original_yaml_bytes: bytes, new_nlu_block: dict, yaml: YAML
+):
+    """
+    Merge por empalme: solo se parsea y se vuelve a escribir el subárbol
+    nluDomainVersion; el resto del texto original se copia sin tocar.
+    Devuelve None si el subárbol no se puede ubicar de forma segura.
+    """
+    span = parse_flow(original_yaml_bytes).nlu_domain_version_span()
+    if span is None:
+        return None
+    start, end, indent = span
+    text = original_yaml_bytes.decode("utf-8")
+
+    # El subárbol, desindentado, es un documento YAML por sí mismo
+    subtree = yaml.load(re.sub(rf"(?m)^ {{0,{indent}}}", "", text[start:end]))
+    subtree["nluDomainVersion"] = _final_nlu_domain_version(
+        subtree["nluDomainVersion"], new_nlu_block
+    )
 
+    # Se vuelca el mapping cargado (no uno nuevo) para conservar, como el
+    # merge completo, los comentarios que ruamel le asigna a la clave
     stream = StringIO()
-    yaml.dump(original_data, stream)
+    yaml.dump(subtree, stream)
+    replacement = re.sub(r"(?m)^(?=.)", " " * indent, stream.getvalue())
+    return text[:start] + replacement + text[end:]
+
+
+# ✅ merge_into_original sin el pop innecesario
+@staged("merge_into_original")
+def merge_into_original(
+    original_yaml_bytes: bytes, new_nlu_block: dict, splice: bool = False
+) -> str:
+    """
+    Reemplaza el nluDomainVersion del YAML original por el del bloque nuevo.
+    Con `splice=True` solo se reescribe ese subárbol y el resto del archivo
+    queda byte a byte igual (si no se puede ubicar, se usa el merge completo).
+    """
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    # yaml.default_flow_style = False # Comentado para permitir que ruamel decida, puede mejorar legibilidad
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    yaml.width = 4096
+
+    if splice:
+        spliced = _splice_nlu_domain_version(original_yaml_bytes, new_nlu_block, yaml)
+        if spliced is not None:
+            return spliced
+
+    # Documento compartido (parseado una sola vez por hash de contenido). Se
+    # modifica solo mientras se serializa y luego se restaura para no alterar
+    # lo que ven extractor y builder. El lock se toma antes de la primera
+    # lectura: otro merge del mismo flujo puede tener su bloque puesto.
+    parsed_flow = parse_flow(original_yaml_bytes)
+    original_data = parsed_flow.document
+    stream = StringIO()
+    with parsed_flow.lock:
+        if "botFlow" not in original_data:
+            raise KeyError("El YAML original no contiene 'botFlow'")
+
+        # Acceder al bloque NLU del YAML original
+        original_bot_flow = original_data.get("botFlow", {})
+        original_nlu_settings = original_bot_flow.get(
+            "settingsNaturalLanguageUnderstanding", {}
+        )
+        original_nlu_domain_version = original_nlu_settings.get("nluDomainVersion", {})
+        final_nlu_domain_version = _final_nlu_domain_version(
+            original_nlu_domain_version, new_nlu_block
+        )
+
+        # Actualizar el bloque NLU en la estructura de datos original
+        # (mutedUtterances se conserva tal cual está en el original)
+        nlu_settings_target = original_data["botFlow"][
+            "settingsNaturalLanguageUnderstanding"
+        ]
+        had_nlu_domain_version = "nluDomainVersion" in nlu_settings_target
+        previous_nlu_domain_version = nlu_settings_target.get("nluDomainVersion")
+        nlu_settings_target["nluDomainVersion"] = final_nlu_domain_version
+        try:
+            yaml.dump(original_data, stream)
+        finally:
+            if had_nlu_domain_version:
+                nlu_settings_target["nluDomainVersion"] = previous_nlu_domain_version
+            else:
+                del nlu_settings_target["nluDomainVersion"]
     return stream.getvalue()
@@ -0,0 +1,289 @@
+"""
+Lectura y escritura del Excel de curación, compartidas por el asistente
+(streamlit_app.py) y el modo por lotes (cli.py).
+
+El Excel exportado tiene las hojas "utterances", "duplicados" y, si hay
+datos, "intents", "EntityDeclarations", "EntityTypeDefinitions" y
+"confusion_intents". Para generar el YAML se leen de vuelta "utterances" e
+"intents".
+
+La escritura es en streaming: con xlsxwriter en modo `constant_memory` si
+está instalado y, si no, con un libro `write_only` de openpyxl. Las filas se
+vuelcan por tandas directamente desde los DataFrames, sin armar el libro
+completo en memoria.
+
+Como alternativa columnar (requiere pyarrow) está el paquete de curación: un
+.zip con un Parquet por hoja, con los mismos nombres y columnas que el Excel.
+Se escribe y se lee en milisegundos y el paso 3 y `cli.py build` lo aceptan
+en lugar del Excel.
+"""
+
+import io
+import os
+import time
+import tracemalloc
+import zipfile
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+try:  # Opcional: el escritor en streaming más rápido
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:  # Opcional: necesario solo para el paquete Parquet
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+from auto_train.loader import EXCEL_READ_ENGINE, segments_to_json
+
+# Tipos de las columnas al leer: todo texto, para que un ID o un utterance
+# numérico no se lea como número (las celdas vacías quedan como NaN)
+UTTERANCES_DTYPES = {
+    "intent_name": str,
+    "intent_id": str,
+    "utterance_text": str,
+    "utterance_id": str,
+    "slots": str,
+    "segments_original": str,
+}
+INTENTS_DTYPES = {"intent_name": str, "intent_id": str}
+
+# Filas que se convierten a valores Python de una vez al exportar
+EXPORT_CHUNK_ROWS = 10_000
+BUNDLE_EXTENSION = ".zip"
+
+
+def _curation_sheets(
+    df_utterances,
+    df_dups,
+    df_intent_details,
+    df_entity_declarations,
+    df_entity_types,
+    df_confusion,
+) -> list:
+    """(DataFrame, nombre de hoja) a exportar, en el orden del Excel."""
+    sheets = [(df_utterances, "utterances"), (df_dups, "duplicados")]
+    # Las hojas opcionales solo se agregan si tienen filas
+    optional_sheets = [
+        (df_intent_details, "intents"),
+        (df_entity_declarations, "EntityDeclarations"),
+        (df_entity_types, "EntityTypeDefinitions"),
+        (df_confusion, "confusion_intents"),
+    ]
+    return sheets + [
+        (df, name) for df, name in optional_sheets if df is not None and not df.empty
+    ]
+
+
+def serialize_segments(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` con segments_original como texto JSON. La extracción guarda los
+    segmentos como tuplas y se serializan recién al exportar o guardar.
+    """
+    if "segments_original" not in df.columns:
+        return df
+    return df.assign(segments_original=df["segments_original"].map(segments_to_json))
+
+
+def _iter_rows(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Filas de `df` como tuplas de valores Python (NaN -> celda vacía), por tandas."""
+    for start in range(0, len(df), chunk_rows):
+        chunk = serialize_segments(df.iloc[start : start + chunk_rows]).astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def _write_sheets_xlsxwriter(target, sheets) -> None:
+    workbook = xlsxwriter.Workbook(
+        target, {"constant_memory": True, "strings_to_urls": False}
+    )
+    header_format = workbook.add_format({"bold": True})
+    for df, sheet_name in sheets:
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, [str(c) for c in df.columns], header_format)
+        for row_number, row in enumerate(_iter_rows(df), start=1):
+            worksheet.write_row(row_number, 0, row)
+    workbook.close()
+
+
+def _write_sheets_openpyxl(target, sheets) -> None:
+    workbook = Workbook(write_only=True)
+    for df, sheet_name in sheets:
+        worksheet = workbook.create_sheet(sheet_name)
+        header = []
+        for column in df.columns:
+            cell = WriteOnlyCell(worksheet, value=str(column))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        worksheet.append(header)
+        for row in _iter_rows(df):
+            worksheet.append(row)
+    workbook.save(target)
+
+
+def write_curation_excel(
+    target,
+    df_utterances: pd.DataFrame,
+    df_dups: pd.DataFrame,
+    df_intent_details: pd.DataFrame = None,
+    df_entity_declarations: pd.DataFrame = None,
+    df_entity_types: pd.DataFrame = None,
+    df_confusion: pd.DataFrame = None,
+    trace_memory: bool = False,
+) -> dict:
+    """
+    Escribe el Excel de curación en `target` (ruta o buffer binario).
+    Devuelve el motor usado, las filas escritas y los segundos que tardó. Con
+    trace_memory=True (o si tracemalloc ya está activo) también el pico de
+    memoria asignada durante la escritura en MB; si no, peak_mb es None.
+    """
+    sheets = _curation_sheets(
+        df_utterances,
+        df_dups,
+        df_intent_details,
+        df_entity_declarations,
+        df_entity_types,
+        df_confusion,
+    )
+
+    # tracemalloc multiplica el tiempo de escritura: solo si se pide
+    was_tracing = tracemalloc.is_tracing()
+    if was_tracing:
+        tracemalloc.reset_peak()
+    elif trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        if xlsxwriter is not None:
+            engine = "xlsxwriter"
+            _write_sheets_xlsxwriter(target, sheets)
+        else:
+            engine = "openpyxl"
+            _write_sheets_openpyxl(target, sheets)
+        seconds = time.perf_counter() - started
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        if trace_memory and not was_tracing:
+            tracemalloc.stop()
+    return {
+        "engine": engine,
+        "rows": sum(len(df) for df, _ in sheets),
+        "seconds": round(seconds, 3),
+        "peak_mb": (
+            round(peak_bytes / 2**20, 1) if trace_memory or was_tracing else None
+        ),
+    }
+
+
+def _for_build_yaml(df_utterances: pd.DataFrame) -> pd.DataFrame:
+    """Columnas de utterances con los nombres que espera build_yaml."""
+    # Asegurarse que la columna utterance_id exista
+    if "utterance_id" not in df_utterances.columns:
+        df_utterances["utterance_id"] = None
+    # Renombrar columnas para compatibilidad con build_yaml
+    return df_utterances.rename(
+        columns={"intent_name": "intent", "utterance_text": "utterance"}
+    )
+
+
+def read_curation_excel(source) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Lee un Excel curado y devuelve (df_utterances, df_intent_details), con las
+    columnas que espera build_yaml ('intent', 'utterance', 'utterance_id').
+    El libro se abre una sola vez y los tipos se fijan al leer.
+    """
+    with pd.ExcelFile(source, engine=EXCEL_READ_ENGINE) as workbook:
+        # Leer la hoja de enunciados
+        df_utterances = workbook.parse("utterances", dtype=UTTERANCES_DTYPES)
+        # Leer la hoja de detalles de intenciones
+        df_intent_details = workbook.parse("intents", dtype=INTENTS_DTYPES)
+    return _for_build_yaml(df_utterances), df_intent_details
+
+
+def _require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ImportError("El paquete de curación Parquet requiere pyarrow")
+
+
+def _parquet_bytes(df: pd.DataFrame) -> bytes:
+    """
+    `df` en Parquet. Si una columna object mezcla tipos que Parquet no admite
+    (p. ej. valores de entidad 1 y "dos"), esas columnas se guardan como texto,
+    igual que quedarían al pasar por el Excel.
+    """
+    df = serialize_segments(df)
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except (ValueError, TypeError):  # ArrowInvalid / ArrowTypeError
+        buffer = io.BytesIO()
+        as_text = {
+            column: df[column].where(df[column].isna(), df[column].astype(str))
+            for column in df.columns
+            if df[column].dtype == object
+        }
+        df.assign(**as_text).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def write_curation_bundle(
+    target,
+    df_utterances: pd.DataFrame,
+    df_dups: pd.DataFrame,
+    df_intent_details: pd.DataFrame = None,
+    df_entity_declarations: pd.DataFrame = None,
+    df_entity_types: pd.DataFrame = None,
+    df_confusion: pd.DataFrame = None,
+) -> None:
+    """
+    Escribe el paquete de curación en `target` (ruta o buffer binario): un
+    .zip con `<hoja>.parquet` por cada hoja que tendría el Excel.
+    """
+    _require_pyarrow()
+    sheets = _curation_sheets(
+        df_utterances,
+        df_dups,
+        df_intent_details,
+        df_entity_declarations,
+        df_entity_types,
+        df_confusion,
+    )
+    # Parquet ya viene comprimido: el zip solo agrupa los archivos
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for df, sheet_name in sheets:
+            bundle.writestr(f"{sheet_name}.parquet", _parquet_bytes(df))
+
+
+def load_curation_bundle(source) -> dict:
+    """Todas las tablas de un paquete de curación, por nombre de hoja."""
+    _require_pyarrow()
+    with zipfile.ZipFile(source) as bundle:
+        return {
+            os.path.splitext(name)[0]: pd.read_parquet(io.BytesIO(bundle.read(name)))
+            for name in bundle.namelist()
+            if name.endswith(".parquet")
+        }
+
+
+def read_curation_bundle(source) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Como `read_curation_excel`, pero desde un paquete de curación."""
+    tables = load_curation_bundle(source)
+    for sheet_name in ("utterances", "intents"):
+        if sheet_name not in tables:
+            raise ValueError(f"El paquete de curación no tiene la hoja '{sheet_name}'")
+    return _for_build_yaml(tables["utterances"]), tables["intents"]
+
+
+def read_curation_file(source, filename: str = None):
+    """
+    `read_curation_bundle` si el archivo es un .zip y `read_curation_excel`
+    si no. `filename` hace falta cuando `source` es un buffer.
+    """
+    filename = filename or str(source)
+    if filename.lower().endswith(BUNDLE_EXTENSION):
+        return read_curation_bundle(source)
+    return read_curation_excel(source)
@@ -0,0 +1,486 @@
+"""
+Motor de búsqueda de pares similares usado por la detección de duplicados.
+
+En lugar de comparar todos los pares con `fuzz.ratio` en Python, se poda el
+espacio de candidatos con dos cotas superiores de `fuzz.ratio` y solo se
+puntúan en C++ (rapidfuzz) los pares que pueden alcanzar el umbral:
+
+1. Buckets de longitud: ratio(a, b) <= 200 * min(la, lb) / (la + lb).
+2. Bloqueo por n-gramas de carácter: la LCS de dos textos no puede superar
+   la intersección de sus multiconjuntos de caracteres, que se calcula para
+   un bloque completo con un producto de matrices.
+
+También arma la tabla de duplicados a partir de los pares y ofrece un índice
+incremental (`DuplicateIndex`) para re-detectar duplicados tras ediciones.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from utils.instrumentation import stage
+from utils.normalizer import normalize_series
+
+# Filas de la matriz de similitud que se procesan por bloque. Acota la memoria
+# de las matrices intermedias (block_size x candidatos).
+DEFAULT_BLOCK_SIZE = 256
+
+# Tope de celdas por bloque al comparar textos nuevos contra todos los
+# existentes (actualización incremental).
+MAX_BLOCK_CELLS = 2_000_000
+
+# Margen para que los errores de redondeo de las cotas nunca descarten un par
+# que sí alcanza el umbral.
+_BOUND_EPSILON = 1e-3
+
+# Columnas de la tabla de duplicados
+DUPLICATE_COLUMNS = ["utterance", "intents", "similarity", "type", "mismo_intent"]
+
+
+def _char_gram_features(texts: list[str]) -> np.ndarray:
+    """
+    Codifica cada texto como indicadores (carácter, ocurrencia k) de forma que
+    el producto escalar de dos filas sea la intersección de sus multiconjuntos
+    de caracteres.
+    """
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(
+        "".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+    ).astype(np.int64)
+    rows = np.repeat(np.arange(len(texts)), lengths)
+
+    # Número de ocurrencia (0, 1, ...) de cada carácter dentro de su texto
+    order = np.lexsort((codes, rows))
+    rows, codes = rows[order], codes[order]
+    positions = np.arange(len(order))
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (rows[1:] != rows[:-1]) | (codes[1:] != codes[:-1])
+    occurrence = positions - np.maximum.accumulate(np.where(new_group, positions, 0))
+
+    keys = codes * (int(occurrence.max(initial=0)) + 1) + occurrence
+    columns, cols = np.unique(keys, return_inverse=True)
+    features = np.zeros((len(texts), max(len(columns), 1)), dtype=np.float32)
+    features[rows, cols] = 1.0
+    return features
+
+
+def _resolve_workers(workers: int) -> int:
+    """Como en rapidfuzz: -1 (o 0) usa todos los núcleos."""
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+
+def iter_similar_pairs(
+    norms: list[str],
+    threshold: float,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+    progress=None,
+):
+    """
+    Genera, por bloques, los pares (i, j) con i < j cuyos textos cumplen
+    threshold <= fuzz.ratio < 100. Cada bloque es una tupla de arrays
+    (left, right, scores) con índices sobre `norms`. Si se pasa
+    `progress(hechos, total)`, se llama al terminar cada bloque.
+
+    Con workers > 1 los bloques se procesan en paralelo en hilos (el producto
+    de matrices y rapidfuzz liberan el GIL, y así la matriz de features se
+    comparte sin copiarla); se entregan igual en orden de bloque, por lo que
+    el resultado no depende de la cantidad de workers.
+    """
+    n = len(norms)
+    if n < 2 or threshold >= 100:
+        return
+
+    lengths = np.fromiter(map(len, norms), dtype=np.int64, count=n)
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    sorted_norms = np.empty(n, dtype=object)
+    sorted_norms[:] = [norms[k] for k in order]
+
+    # Longitud máxima de un compañero (más largo) que aún puede llegar al umbral
+    if threshold > 0:
+        max_partner = np.floor(
+            sorted_lengths * (200.0 - threshold) / threshold + _BOUND_EPSILON
+        ).astype(np.int64)
+    else:
+        max_partner = np.full(n, sorted_lengths[-1], dtype=np.int64)
+    window_end = np.searchsorted(sorted_lengths, max_partner, side="right")
+
+    features = _char_gram_features(sorted_norms.tolist())
+    lengths_f = sorted_lengths.astype(np.float32)
+
+    def score_block(start):
+        stop = min(start + block_size, n)
+        end = int(window_end[stop - 1])
+        if end <= start + 1:
+            return None
+
+        shared = features[start:stop] @ features[start:end].T
+        total_len = lengths_f[start:stop, None] + lengths_f[None, start:end]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bound = np.where(total_len > 0, 200.0 * shared / total_len, 100.0)
+        rows, cols = np.nonzero(bound >= threshold - _BOUND_EPSILON)
+        upper = cols > rows  # Solo el triángulo superior (en orden por longitud)
+        rows = start + rows[upper]
+        cols = start + cols[upper]
+        if rows.size == 0:
+            return None
+
+        scores = process.cpdist(
+            sorted_norms[rows],
+            sorted_norms[cols],
+            scorer=fuzz.ratio,
+            score_cutoff=threshold,
+            dtype=np.float64,
+        )
+        hit = (scores >= threshold) & (scores < 100)
+        if not hit.any():
+            return None
+
+        left = order[rows[hit]]
+        right = order[cols[hit]]
+        return np.minimum(left, right), np.maximum(left, right), scores[hit]
+
+    starts = range(0, n, block_size)
+    workers = _resolve_workers(workers)
+    if workers == 1:
+        results = map(score_block, starts)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        results = executor.map(score_block, starts)
+    try:
+        for done, block in enumerate(results, start=1):
+            if progress is not None:
+                progress(done, len(starts))
+            if block is not None:
+                yield block
+    finally:
+        if workers != 1:
+            executor.shutdown(cancel_futures=True)
+
+
+def _empty_pairs():
+    empty = np.array([], dtype=np.int64)
+    return empty, empty.copy(), np.array([], dtype=np.float64)
+
+
+def find_similar_pairs(
+    norms: list[str],
+    threshold: float,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int = 1,
+    progress=None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Devuelve todos los pares de `iter_similar_pairs` concatenados y ordenados
+    por (left, right), para que el resultado sea determinista.
+    """
+    blocks = list(
+        iter_similar_pairs(norms, threshold, block_size, workers, progress=progress)
+    )
+    if not blocks:
+        return _empty_pairs()
+    left = np.concatenate([b[0] for b in blocks])
+    right = np.concatenate([b[1] for b in blocks])
+    scores = np.concatenate([b[2] for b in blocks])
+    sort_idx = np.lexsort((right, left))
+    return left[sort_idx], right[sort_idx], scores[sort_idx]
+
+
+def iter_pairs_between(
+    queries: list[str], choices: list[str], threshold: float, workers: int = 1
+):
+    """
+    Como `iter_similar_pairs`, pero entre dos listas distintas: genera bloques
+    (left, right, scores) con `left` sobre `queries` y `right` sobre `choices`.
+    Pensado para pocos textos nuevos contra muchos existentes; con workers > 1
+    rapidfuzz reparte cada bloque entre hilos.
+    """
+    if not queries or not choices or threshold >= 100:
+        return
+    rows_per_block = max(1, MAX_BLOCK_CELLS // len(choices))
+    for start in range(0, len(queries), rows_per_block):
+        scores = process.cdist(
+            queries[start : start + rows_per_block],
+            choices,
+            scorer=fuzz.ratio,
+            score_cutoff=threshold,
+            dtype=np.float64,
+            workers=_resolve_workers(workers),
+        )
+        rows, cols = np.nonzero((scores >= threshold) & (scores < 100))
+        if rows.size:
+            yield start + rows, cols, scores[rows, cols]
+
+
+def build_norm_index(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Índice por texto normalizado, construido una sola vez: primer utterance,
+    tupla ordenada de intents y posiciones de sus filas (groupby). El orden
+    de las filas es el de primera aparición de cada norm.
+    """
+    first_rows = df.drop_duplicates("norm").set_index("norm")
+    # Una pasada sobre los pares (norm, intent) distintos; evita un apply por grupo
+    norm_intents = df[["norm", "intent"]].drop_duplicates()
+    intents = {}
+    for norm, intent in zip(
+        norm_intents["norm"].tolist(), norm_intents["intent"].tolist()
+    ):
+        intents.setdefault(norm, []).append(intent)
+    rows = df.groupby("norm", sort=False).indices
+    return pd.DataFrame(
+        {
+            "utterance": first_rows["utterance"].to_numpy(),
+            "intents": [tuple(sorted(intents[n])) for n in first_rows.index],
+            "rows": [rows[n] for n in first_rows.index],
+        },
+        index=first_rows.index,
+    )
+
+
+def duplicates_frame(
+    df: pd.DataFrame,
+    norm_index: pd.DataFrame,
+    left: np.ndarray,
+    right: np.ndarray,
+    scores: np.ndarray,
+    approx_type: str = "aproximado",
+    include_exact: bool = True,
+) -> pd.DataFrame:
+    """
+    Arma la tabla de duplicados: filas exactas (norm repetido, salvo con
+    include_exact=False) y, por cada par aproximado (posiciones en
+    `norm_index`), una fila por cada lado con type `approx_type`.
+    """
+    is_exact = norm_index["rows"].map(len) > 1
+
+    # exactos
+    exact_df = df[df["norm"].map(is_exact).astype(bool)].copy()
+    exact_intents = exact_df["norm"].map(norm_index["intents"])
+    exact_df["similarity"] = 100
+    exact_df["type"] = "duplicado"
+    exact_df["mismo_intent"] = exact_intents.map(len) == 1
+    exact_df["intents"] = exact_intents.map(", ".join)
+    exact_out = exact_df[DUPLICATE_COLUMNS]
+    if not include_exact:
+        exact_out = exact_out.iloc[:0]
+
+    if len(left) == 0:
+        # Solo exactos: se devuelven con sus tipos (similarity entera), como
+        # el original, en vez de pasarlos a float al concatenar un frame vacío
+        return exact_out.reset_index(drop=True)
+
+    # aproximados
+    utterances = norm_index["utterance"].to_numpy()
+    intents_str = norm_index["intents"].map(",".join).to_numpy()
+    intent_set_codes, _ = pd.factorize(norm_index["intents"])
+    same_intent = intent_set_codes[left] == intent_set_codes[right]
+
+    # Dos filas por par (una por cada lado), intercaladas como en el original
+    sides = np.column_stack((left, right)).ravel()
+    approx_out = pd.DataFrame(
+        {
+            "utterance": utterances[sides],
+            "intents": intents_str[sides],
+            "similarity": np.repeat(scores, 2),
+            "type": approx_type,
+            "mismo_intent": np.repeat(same_intent, 2),
+        }
+    ).drop_duplicates()
+    return pd.concat([exact_out, approx_out], ignore_index=True)
+
+
+class DuplicateIndex:
+    """
+    Índice incremental de duplicados para una tabla de utterances en edición.
+
+    Mantiene los norms distintos de la tabla y los pares de norms con
+    threshold <= fuzz.ratio < 100 como arrays compactos (ids de cada lado y
+    score) ordenados por score descendente. Al actualizar con una versión
+    editada de la tabla solo se puntúan los norms nuevos contra los existentes
+    y se descartan los pares de los norms que desaparecieron; la tabla de
+    duplicados resultante es la misma que devolvería `find_duplicates`.
+
+    Como los pares están ordenados por score, cualquier umbral mayor o igual
+    al del índice se responde cortando los arrays, sin volver a comparar
+    (barrido de umbrales: se construye una vez con el umbral más bajo).
+
+    `update` cambia el índice recién al final: si se interrumpe (p. ej. el
+    `progress` lanza una excepción para cancelar), queda como estaba. Si
+    varios hilos lo comparten, quien lo actualice debe tomar `lock`.
+    """
+
+    # Si cambia más de esta fracción de norms, conviene reconstruir por bloques
+    REBUILD_FRACTION = 0.25
+    # Con más de este múltiplo de ids por norm vigente (los de norms editados o
+    # eliminados no se reutilizan), se compactan
+    COMPACT_FACTOR = 2
+
+    def __init__(self, threshold: float = 90, workers: int = 1):
+        self.threshold = threshold
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._df = None
+        self._norms = []  # texto de cada id (los eliminados, hasta compactar)
+        self._ids = {}  # norm vigente -> id
+        self._set_pairs(*_empty_pairs())
+        self._norm_index = None
+        self._frames = {}
+
+    def _set_pairs(self, left, right, scores):
+        order = np.argsort(-scores, kind="stable")
+        self._left = left[order]
+        self._right = right[order]
+        self._scores = scores[order]
+
+    def update(self, df: pd.DataFrame, progress=None) -> bool:
+        """
+        Sincroniza el índice con `df` (columnas "intent" y "utterance").
+        Devuelve True si la tabla de duplicados puede haber cambiado.
+        `progress(hechos, total)` informa el avance de la comparación por
+        bloques (ver `iter_similar_pairs`).
+        """
+        df = df[["intent", "utterance"]].assign(norm=normalize_series(df["utterance"]))
+        if self._df is not None and df.equals(self._df):
+            return False
+
+        with stage("duplicate_index") as current:
+            current.rows = len(df)
+            new_norms = set(df["norm"].unique())
+            added = [n for n in new_norms if n not in self._ids]
+
+            if self._df is None or len(added) > self.REBUILD_FRACTION * len(new_norms):
+                norms = sorted(new_norms)
+                ids = {norm: i for i, norm in enumerate(norms)}
+                pairs = find_similar_pairs(
+                    norms, self.threshold, workers=self.workers, progress=progress
+                )
+            else:
+                # Se trabaja sobre copias: el índice cambia recién al final
+                ids = {norm: i for norm, i in self._ids.items() if norm in new_norms}
+                alive = np.zeros(len(self._norms), dtype=bool)
+                alive[list(ids.values())] = True
+                keep = alive[self._left] & alive[self._right]
+                parts = [(self._left[keep], self._right[keep], self._scores[keep])]
+
+                kept = list(ids)
+                kept_ids = np.fromiter(ids.values(), dtype=np.int64, count=len(kept))
+                first_id = len(self._norms)
+                for offset, norm in enumerate(added):
+                    ids[norm] = first_id + offset
+                norms = self._norms + added
+                for left, right, scores in iter_similar_pairs(
+                    added, self.threshold, workers=self.workers, progress=progress
+                ):
+                    parts.append((first_id + left, first_id + right, scores))
+                for left, right, scores in iter_pairs_between(
+                    added, kept, self.threshold, self.workers
+                ):
+                    parts.append((first_id + left, kept_ids[right], scores))
+                pairs = [np.concatenate(column) for column in zip(*parts)]
+
+            self._norms = norms
+            self._ids = ids
+            self._set_pairs(*pairs)
+            if len(self._norms) > self.COMPACT_FACTOR * len(self._ids):
+                self._compact()
+
+        self._df = df
+        self._norm_index = None
+        self._frames = {}
+        return True
+
+    def _compact(self):
+        """
+        Renumera los ids vigentes como 0..n-1 y suelta los textos de los norms
+        eliminados; los pares (que ya solo tienen ids vigentes) se traducen
+        sin volver a comparar y conservan su orden.
+        """
+        old_ids = np.fromiter(self._ids.values(), dtype=np.int64, count=len(self._ids))
+        new_ids = np.full(len(self._norms), -1, dtype=np.int64)
+        new_ids[old_ids] = np.arange(len(old_ids))
+        self._norms = [self._norms[i] for i in old_ids]
+        self._ids = dict(zip(self._ids, range(len(old_ids))))
+        self._left = new_ids[self._left]
+        self._right = new_ids[self._right]
+
+    def _pairs(self, threshold: float = None):
+        """(left, right, scores) en ids de los pares con score >= threshold."""
+        if threshold is None or threshold <= self.threshold:
+            return self._left, self._right, self._scores
+        stop = np.searchsorted(-self._scores, -threshold, side="right")
+        return self._left[:stop], self._right[:stop], self._scores[:stop]
+
+    def _positions(self, norms) -> np.ndarray:
+        """Posición en `norms` de cada id del índice (-1 si no está)."""
+        positions = np.full(len(self._norms), -1, dtype=np.int64)
+        for pos, norm in enumerate(norms):
+            norm_id = self._ids.get(norm)
+            if norm_id is not None:
+                positions[norm_id] = pos
+        return positions
+
+    def pair_count(self, threshold: float = None) -> int:
+        return len(self._pairs(threshold)[2])
+
+    def score_histogram(self) -> pd.Series:
+        """Cantidad de pares por score entero (desde el umbral del índice)."""
+        counts = np.bincount(np.floor(self._scores).astype(np.int64), minlength=100)[
+            int(np.floor(self.threshold)) : 100
+        ]
+        return pd.Series(
+            counts,
+            index=pd.RangeIndex(int(np.floor(self.threshold)), 100, name="score"),
+        )
+
+    def pair_blocks(self, norms: list[str], threshold: float = None):
+        """
+        Pares entre los textos de `norms` con score >= threshold (por defecto
+        el del índice), como un único bloque (left, right, scores) con
+        left < right: lo mismo que generaría `iter_similar_pairs(norms,
+        threshold)`, sin volver a comparar.
+        """
+        left, right, scores = self._pairs(threshold)
+        positions = self._positions(norms)
+        left, right = positions[left], positions[right]
+        found = (left >= 0) & (right >= 0)
+        if found.any():
+            left, right = left[found], right[found]
+            order = np.lexsort((np.maximum(left, right), np.minimum(left, right)))
+            yield (
+                np.minimum(left, right)[order],
+                np.maximum(left, right)[order],
+                scores[found][order],
+            )
+
+    def to_frame(self, threshold: float = None) -> pd.DataFrame:
+        """
+        Tabla de duplicados con score >= threshold (por defecto el del
+        índice), con las mismas columnas que `find_duplicates`.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if threshold not in self._frames:
+            df = self._df
+            if df is None:
+                df = pd.DataFrame(columns=["intent", "utterance", "norm"])
+            if self._norm_index is None:
+                self._norm_index = build_norm_index(df)
+            norm_index = self._norm_index
+            unique_norm = (norm_index["rows"].map(len) == 1).to_numpy()
+
+            # Pares aproximados solo entre norms que aparecen una única vez,
+            # en el mismo orden (primera aparición) que find_duplicates
+            left, right, scores = next(
+                self.pair_blocks(norm_index.index, threshold), _empty_pairs()
+            )
+            keep = unique_norm[left] & unique_norm[right]
+            self._frames[threshold] = duplicates_frame(
+                df, norm_index, left[keep], right[keep], scores[keep]
+            )
+        return self._frames[threshold]
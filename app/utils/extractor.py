@@ -7,28 +7,29 @@ auto_train_path = os.path.abspath(os.path.join(current_dir, "..", "auto_train"))
 if auto_train_path not in sys.path:
     sys.path.insert(0, auto_train_path)
 
+import logging
+import uuid
+
+import numpy as np
 import pandas as pd
-import re
-from io import BytesIO
 import json  # Para json.dumps
-from ruamel.yaml import YAML
-from rapidfuzz import fuzz
-from auto_train.loader import BotFlowLoader
-
-
-def normalize(text: str) -> str:
-    t = text.strip().lower()
-    t = (
-        t.replace("á", "a")
-        .replace("é", "e")
-        .replace("í", "i")
-        .replace("ó", "o")
-        .replace("ú", "u")
-        .replace("ñ", "n")
-    )
-    t = re.sub(r"[¿\?¡!.,;:]+", "", t)
-    t = re.sub(r"\s+", " ", t)
-    return t
+from auto_train.loader import parse_flow
+from utils.duplicates import (
+    DUPLICATE_COLUMNS,
+    build_norm_index,
+    duplicates_frame,
+    find_similar_pairs,
+    iter_similar_pairs,
+)
+from utils.instrumentation import stage, staged
+from utils.normalizer import normalize, normalize_series
+
+logger = logging.getLogger(__name__)
+
+try:  # Columnas de texto en Arrow (pandas >= 2.3 con pyarrow): menos memoria
+    TEXT_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)
+except (ImportError, TypeError):
+    TEXT_DTYPE = object
 
 
 def extract_entity_data_from_nlu_block(
@@ -38,28 +39,17 @@ def extract_entity_data_from_nlu_block(
     Extrae las declaraciones de entidades (instances) y las definiciones de tipos de entidad
     del bloque NLU proporcionado.
     """
-    # --- DEBUGGING START (extractor.py) ---
-    print(
-        "\n--- DEBUG (extractor.py): Entrando a extract_entity_data_from_nlu_block ---"
-    )
-    if isinstance(nlu_data_block, dict):
-        print(f"Keys in nlu_data_block: {list(nlu_data_block.keys())}")
-        if "entities" in nlu_data_block:
-            print(
-                f"Content of 'entities' (primeros 2 si existen): {nlu_data_block['entities'][:2]}"
-            )
-        else:
-            print("'entities' key NOT FOUND in nlu_data_block")
-        if "entityTypes" in nlu_data_block:
-            print(
-                f"Content of 'entityTypes' (primeros 2 si existen): {nlu_data_block['entityTypes'][:2]}"
+    if logger.isEnabledFor(logging.DEBUG):
+        if isinstance(nlu_data_block, dict):
+            logger.debug(
+                "Bloque NLU: claves %s; entities (primeras 2): %s; "
+                "entityTypes (primeras 2): %s",
+                list(nlu_data_block.keys()),
+                nlu_data_block.get("entities", [])[:2],
+                nlu_data_block.get("entityTypes", [])[:2],
             )
         else:
-            print("'entityTypes' key NOT FOUND in nlu_data_block")
-    else:
-        print(f"nlu_data_block NO es un dict. Tipo: {type(nlu_data_block)}")
-    print("--- DEBUG (extractor.py): Fin inspección nlu_data_block ---\n")
-    # --- DEBUGGING END (extractor.py) ---
+            logger.debug("El bloque NLU no es un dict: %s", type(nlu_data_block))
 
     entity_declarations_list = []
     entity_type_definitions_list = []
@@ -146,104 +136,125 @@ def extract_entity_data_from_nlu_block(
             ]
         )
 
-    # --- DEBUGGING START (extractor.py) ---
-    print("\n--- DEBUG (extractor.py): DataFrames generados internamente ---")
-    print(f"df_entity_declarations (head):\n{df_entity_declarations.head()}")
-    print(f"df_entity_declarations empty?: {df_entity_declarations.empty}")
-    print(f"df_entity_type_definitions (head):\n{df_entity_type_definitions.head()}")
-    print(f"df_entity_type_definitions empty?: {df_entity_type_definitions.empty}")
-    print("--- DEBUG (extractor.py): Fin DataFrames generados ---\n")
-    # --- DEBUGGING END (extractor.py) ---
+    logger.debug(
+        "Entidades extraídas: %d declaraciones, %d filas de tipos",
+        len(df_entity_declarations),
+        len(df_entity_type_definitions),
+    )
 
     return df_entity_declarations, df_entity_type_definitions
 
 
+def slots_column(segments_column: list) -> list:
+    """
+    Nombres de entidades (slots) de cada utterance, únicos, ordenados y
+    unidos por ", " (None si no tiene): se junta un par (fila, entidad) por
+    segmento y el resto se resuelve por columna.
+    """
+    rows, names = [], []
+    for row, segments in enumerate(segments_column):
+        for segment in segments:
+            if isinstance(segment.entity, dict) and segment.entity.get("name"):
+                rows.append(row)
+                names.append(segment.entity["name"])
+    slots = np.full(len(segments_column), None, dtype=object)
+    if not rows:
+        return slots.tolist()
+
+    # Pares (fila, entidad) únicos y ordenados, como una sola clave entera
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object), sort=True)
+    uniques = uniques.to_numpy()
+    keys = np.sort(np.asarray(rows, dtype=np.int64) * len(uniques) + codes)
+    keys = keys[np.diff(keys, prepend=-1) != 0]
+    key_rows, key_names = keys // len(uniques), keys % len(uniques)
+    starts = np.flatnonzero(np.diff(key_rows, prepend=-1) != 0)
+    counts = np.diff(np.append(starts, len(keys)))
+
+    # Lo común es una sola entidad por utterance: se asigna sin unir
+    single = counts == 1
+    slots[key_rows[starts[single]]] = uniques[key_names[starts[single]]]
+    for start, count in zip(starts[~single], counts[~single]):
+        slots[key_rows[start]] = ", ".join(uniques[key_names[start : start + count]])
+    return slots.tolist()
+
+
+@staged("extract_intents", rows=lambda result: len(result[0]))
 def extract_intents(
     yaml_bytes: bytes,
+    workers: int = 1,
+    detect_duplicates: bool = True,
+    progress=None,
 ) -> tuple[
     pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame
 ]:  # Added df_intent_details
-    flow = BotFlowLoader.load_from_bytes(yaml_bytes)
-
-    # Parsear el YAML completo una vez para acceder a los IDs de intención directamente
-    yaml_parser = YAML(typ="safe")
-    try:
-        yaml_content_str = yaml_bytes.decode("utf-8")
-    except UnicodeDecodeError:
-        yaml_content_str = yaml_bytes.decode("latin-1", errors="replace")
-
-    full_yaml_data = yaml_parser.load(yaml_content_str)
-
-    intent_name_to_id_map = {}
-    if isinstance(full_yaml_data, dict) and "botFlow" in full_yaml_data:
-        bot_flow_data = full_yaml_data.get("botFlow", {})
-        nlu_data_block_for_ids = bot_flow_data.get(
-            "settingsNaturalLanguageUnderstanding", {}
-        ).get("nluDomainVersion", {})
-
-        if nlu_data_block_for_ids and "intents" in nlu_data_block_for_ids:
-            for intent_data_from_yaml in nlu_data_block_for_ids["intents"]:
+    """
+    Tablas de curación del flujo: utterances, duplicados, entidades, tipos de
+    entidad e intents. Con detect_duplicates=False la tabla de duplicados
+    vuelve vacía, para calcularla aparte (y con otro umbral) solo si hace falta.
+    `progress(hechos, total)` informa las etapas terminadas.
+    """
+    total_stages = 4 if detect_duplicates else 3
+    report = progress or (lambda done, total: None)
+    report(0, total_stages)
+
+    # El YAML se parsea una sola vez y se comparte (por hash) con builder y merge.
+    # La extracción solo lee el bloque NLU, que se materializa sin construir el
+    # resto del flujo.
+    with stage("parse_flow"):
+        parsed_flow = parse_flow(yaml_bytes)
+        flow = parsed_flow.bot_flow()
+        nlu_data_block = (parsed_flow.nlu_settings() or {}).get("nluDomainVersion", {})
+    report(1, total_stages)
+
+    with stage("utterance_table") as current:
+        intent_name_to_id_map = {}
+        if nlu_data_block and "intents" in nlu_data_block:
+            for intent_data_from_yaml in nlu_data_block["intents"]:
                 if "name" in intent_data_from_yaml and "id" in intent_data_from_yaml:
                     intent_name_to_id_map[intent_data_from_yaml["name"]] = (
                         intent_data_from_yaml["id"]
                     )
 
-    utterances_list = []
-    intent_details_list = []
-    processed_intent_ids = set()  # To store unique intent_name and intent_id
-
-    for intent_obj in flow.get_intents():
-        intent_name_val = intent_obj.name
-        # Obtener el ID de la intención del mapa creado a partir del parseo directo del YAML
-        intent_id_val = intent_name_to_id_map.get(intent_name_val)
-
-        # Store unique intent details (name and ID)
-        if (
-            intent_id_val and intent_id_val not in processed_intent_ids
-        ):  # Solo si se encontró un ID
-            intent_details_list.append(
-                {"intent_name": intent_name_val, "intent_id": intent_id_val}
-            )
-            processed_intent_ids.add(intent_id_val)
-
-        for utt_obj in intent_obj.utterances:  # utt_obj is an Utterance object
-            raw_text = utt_obj.text
-            original_id = utt_obj.id
-            original_segments = utt_obj.segments  # Obtener los segmentos originales
-
-            # Extraer nombres de entidades (slots) de los segmentos
-            slots_found = []
-            if original_segments and isinstance(original_segments, list):
-                for segment in original_segments:
-                    if isinstance(segment, dict):
-                        entity_data = segment.get("entity")
-                        if isinstance(entity_data, dict):
-                            entity_name = entity_data.get("name")
-                            if entity_name:
-                                slots_found.append(entity_name)
-            # Unir nombres de slots únicos, si se encontraron
-            slots_str = (
-                ", ".join(sorted(list(set(slots_found)))) if slots_found else None
-            )
-
-            utterances_list.append(
-                {
-                    "intent_name": intent_name_val,  # For reference and potential joining
-                    "intent_id": (
-                        intent_id_val if intent_id_val else str(uuid.uuid4())
-                    ),  # Fallback a nuevo UUID si no se encontró ID
-                    "utterance_text": raw_text,
-                    "utterance_id": original_id,  # Store the original ID
-                    "slots": slots_str,  # Nueva columna con los nombres de las entidades
-                    "segments_original": (
-                        json.dumps(original_segments) if original_segments else None
-                    ),  # Guardar como JSON
-                    # "norm" column for find_duplicates will be derived later
-                }
-            )
+        # Intents únicos (nombre e ID), solo los que tienen ID en el YAML
+        intent_details_list = []
+        processed_intent_ids = set()
+        for intent_obj in flow.get_intents():
+            intent_id_val = intent_name_to_id_map.get(intent_obj.name)
+            if intent_id_val and intent_id_val not in processed_intent_ids:
+                intent_details_list.append(
+                    {"intent_name": intent_obj.name, "intent_id": intent_id_val}
+                )
+                processed_intent_ids.add(intent_id_val)
 
-    df_utterances_output = pd.DataFrame(utterances_list)
-    df_intent_details = pd.DataFrame(intent_details_list)
+        # Tabla columnar de utterances: una lista por columna, en una sola pasada
+        columns = flow.to_columns()
+        segments_column = columns["segments"]
+        intent_ids = pd.Series(columns["intent_name"], dtype=object).map(
+            intent_name_to_id_map
+        )
+        intent_ids = intent_ids.where(intent_ids.astype(bool), None)
+        missing = intent_ids.isna()
+        # Fallback a un UUID nuevo por utterance si el intent no tiene ID
+        intent_ids[missing] = [str(uuid.uuid4()) for _ in range(int(missing.sum()))]
+
+        df_utterances_output = pd.DataFrame(
+            {
+                "intent_name": pd.array(columns["intent_name"], dtype=TEXT_DTYPE),
+                "intent_id": pd.array(intent_ids.tolist(), dtype=TEXT_DTYPE),
+                "utterance_text": pd.array(columns["utterance_text"], dtype=TEXT_DTYPE),
+                "utterance_id": pd.array(columns["utterance_id"], dtype=TEXT_DTYPE),
+                "slots": pd.array(slots_column(segments_column), dtype=TEXT_DTYPE),
+                # Tuplas de Segment: se pasan a JSON recién al exportar
+                "segments_original": pd.Series(
+                    [segments or None for segments in segments_column], dtype=object
+                ),
+            }
+        )
+        df_intent_details = pd.DataFrame(
+            intent_details_list, columns=["intent_name", "intent_id"]
+        ).astype(TEXT_DTYPE)
+        current.rows = len(df_utterances_output)
+    report(2, total_stages)
 
     # Prepare DataFrame for find_duplicates function
     if not df_utterances_output.empty:
@@ -255,7 +266,11 @@ def extract_intents(
     else:
         df_for_duplicates = pd.DataFrame(columns=["intent", "utterance"])
 
-    df_dups = find_duplicates(df_for_duplicates, threshold=90)
+    if detect_duplicates:
+        df_dups = find_duplicates(df_for_duplicates, threshold=90, workers=workers)
+        report(3, total_stages)
+    else:
+        df_dups = pd.DataFrame(columns=DUPLICATE_COLUMNS)
 
     # Renombrar columnas para la salida esperada por streamlit_app.py
     # df_utterances_output already has the desired column names ('intent_name', 'utterance_text', etc.)
@@ -263,21 +278,12 @@ def extract_intents(
     # Ensure 'norm' is not in df_utterances_output if it was temporarily added.
     # (It's not added to utterances_list directly in this version, so .drop not needed for 'norm')
 
-    # Extraer datos de entidades usando el full_yaml_data ya parseado
-    nlu_data_block = {}  # Inicializar
-
-    # Ajuste para acceder correctamente al bloque NLU anidado
-    if isinstance(full_yaml_data, dict) and "botFlow" in full_yaml_data:
-        bot_flow_data = full_yaml_data.get("botFlow", {})
-        nlu_data_block = bot_flow_data.get(
-            "settingsNaturalLanguageUnderstanding", {}
-        ).get("nluDomainVersion", {})
-    else:  # Si no hay 'botFlow' o full_yaml_data no es un dict, nlu_data_block será vacío
-        nlu_data_block = {}
-
-    df_entity_declarations, df_entity_type_definitions = (
-        extract_entity_data_from_nlu_block(nlu_data_block)
-    )
+    # Extraer datos de entidades del mismo bloque NLU ya materializado
+    with stage("entities"):
+        df_entity_declarations, df_entity_type_definitions = (
+            extract_entity_data_from_nlu_block(nlu_data_block)
+        )
+    report(total_stages, total_stages)
 
     return (
         df_utterances_output,  # Renamed from df_intents_output
@@ -288,60 +294,145 @@ def extract_intents(
     )
 
 
-def find_duplicates(df: pd.DataFrame, threshold: int) -> pd.DataFrame:
-    df = df.assign(norm=df["utterance"].map(normalize))
-    counts = df["norm"].value_counts()
-    exact_norms = counts[counts > 1].index
-    exact_df = df[df["norm"].isin(exact_norms)].copy()
-    exact_df["similarity"] = 100
-    exact_df["type"] = "duplicado"
-    exact_df["mismo_intent"] = exact_df.groupby("norm")["intent"].transform(
-        lambda x: len(x.unique()) == 1
+@staged("find_duplicates", rows=len)
+def find_duplicates(
+    df: pd.DataFrame, threshold: int, workers: int = 1, progress=None
+) -> pd.DataFrame:
+    """
+    Pares de utterances duplicados: exactos (mismo texto normalizado) y
+    aproximados (threshold <= fuzz.ratio < 100). `workers` reparte la
+    comparación entre núcleos (-1 = todos); el resultado es el mismo.
+    `progress(hechos, total)` informa el avance por bloques.
+    """
+    df = df.assign(norm=normalize_series(df["utterance"]))
+    norm_index = build_norm_index(df)
+
+    # aproximados: solo entre norms que aparecen una única vez
+    uniq_pos = np.flatnonzero(norm_index["rows"].map(len).to_numpy() == 1)
+    left, right, scores = find_similar_pairs(
+        norm_index.index[uniq_pos].tolist(),
+        threshold,
+        workers=workers,
+        progress=progress,
     )
-    # Agrupar los intents únicos por cada utterance normalizado
-    intent_groups = (
-        df.groupby("norm")["intent"].unique().apply(lambda x: ", ".join(sorted(set(x))))
+    return duplicates_frame(df, norm_index, uniq_pos[left], uniq_pos[right], scores)
+
+
+CONFUSION_COLUMNS = [
+    "intent_a",
+    "intent_b",
+    "pairs",
+    "exact_pairs",
+    "mean_similarity",
+]
+
+
+def _aggregate_intent_pairs(n_intents, intent_a, intent_b, weights, scores):
+    """Suma, por par de intents (a < b), pares, pares exactos y similitud."""
+    keep = intent_a != intent_b
+    a = np.minimum(intent_a, intent_b)[keep]
+    b = np.maximum(intent_a, intent_b)[keep]
+    weights = weights[keep]
+    scores = scores[keep]
+    keys, inverse = np.unique(a * n_intents + b, return_inverse=True)
+    return (
+        keys,
+        np.bincount(inverse, weights=weights, minlength=len(keys)),
+        np.bincount(inverse, weights=weights * (scores >= 100), minlength=len(keys)),
+        np.bincount(inverse, weights=weights * scores, minlength=len(keys)),
     )
 
-    # exactos
-    exact_df = df[df["norm"].duplicated(keep=False)].copy()
-    exact_df["similarity"] = 100
-    exact_df["type"] = "duplicado"
-    exact_df["mismo_intent"] = exact_df["norm"].map(
-        lambda n: len(set(df[df["norm"] == n]["intent"])) == 1
+
+@staged("intent_confusion", rows=len)
+def intent_confusion(
+    df: pd.DataFrame, threshold: int = 90, workers: int = 1, pair_blocks=None
+) -> pd.DataFrame:
+    """
+    Matriz de confusión entre intents, en formato disperso (una fila por par
+    de intents con al menos un cruce): cuántos pares de utterances de uno y
+    otro intent son duplicados exactos o aproximados (fuzz.ratio >=
+    threshold) y su similitud media.
+
+    Los pares de textos se agregan bloque por bloque a medida que salen del
+    motor de búsqueda, sin armar nunca la tabla completa de pares. Con
+    `pair_blocks(norms)` se pueden reutilizar pares ya calculados (por
+    ejemplo, DuplicateIndex.pair_blocks); por defecto se buscan con
+    iter_similar_pairs.
+    """
+    df = df[df["intent"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=CONFUSION_COLUMNS)
+    norm_codes, norms = pd.factorize(normalize_series(df["utterance"]))
+    intent_codes, intent_names = pd.factorize(df["intent"], sort=True)
+    n_intents = len(intent_names)
+
+    # Tabla dispersa norm x intent con la cantidad de utterances (ordenada
+    # por norm, de modo que las entradas de cada norm son contiguas)
+    entry_keys, entry_counts = np.unique(
+        norm_codes.astype(np.int64) * n_intents + intent_codes, return_counts=True
     )
-    exact_df["intents"] = exact_df["norm"].map(intent_groups)
-    exact_out = exact_df[["utterance", "intents", "similarity", "type", "mismo_intent"]]
-
-    uniq = list(set(df["norm"]) - set(exact_norms))
-    approx_rows = []
-    for i, n1 in enumerate(uniq):
-        for n2 in uniq[i + 1 :]:
-            score = fuzz.ratio(n1, n2)
-            if threshold <= score < 100:
-                sample1 = df[df["norm"] == n1].iloc[0]
-                sample2 = df[df["norm"] == n2].iloc[0]
-                intents1 = ",".join(df[df["norm"] == n1]["intent"].unique())
-                intents2 = ",".join(df[df["norm"] == n2]["intent"].unique())
-                same_intent = intents1 == intents2
-                approx_rows.append(
-                    {
-                        "utterance": sample1.utterance,
-                        "intents": intents1,
-                        "similarity": score,
-                        "type": "aproximado",
-                        "mismo_intent": same_intent,
-                    }
-                )
-                approx_rows.append(
-                    {
-                        "utterance": sample2.utterance,
-                        "intents": intents2,
-                        "similarity": score,
-                        "type": "aproximado",
-                        "mismo_intent": same_intent,
-                    }
-                )
+    entry_norm = entry_keys // n_intents
+    entry_intent = entry_keys % n_intents
+    offsets = np.searchsorted(entry_norm, np.arange(len(norms) + 1))
+    entries_per_norm = np.diff(offsets)
+
+    partials = []
+    # Exactos: el mismo norm en intents distintos (pocos norms, bucle simple)
+    for norm_pos in np.flatnonzero(entries_per_norm > 1):
+        entries = np.arange(offsets[norm_pos], offsets[norm_pos + 1])
+        first, second = np.triu_indices(len(entries), k=1)
+        first, second = entries[first], entries[second]
+        partials.append(
+            _aggregate_intent_pairs(
+                n_intents,
+                entry_intent[first],
+                entry_intent[second],
+                (entry_counts[first] * entry_counts[second]).astype(np.float64),
+                np.full(len(first), 100.0),
+            )
+        )
 
-    approx_out = pd.DataFrame(approx_rows).drop_duplicates()
-    return pd.concat([exact_out, approx_out], ignore_index=True)
+    # Aproximados: cada par de norms cruza todas sus entradas (intent, cantidad)
+    if pair_blocks is None:
+        blocks = iter_similar_pairs(norms.tolist(), threshold, workers=workers)
+    else:
+        blocks = pair_blocks(norms.tolist())
+    for left, right, scores in blocks:
+        k_left = entries_per_norm[left]
+        k_right = entries_per_norm[right]
+        combos = k_left * k_right
+        pair = np.repeat(np.arange(len(left)), combos)
+        within = np.arange(combos.sum()) - np.repeat(np.cumsum(combos) - combos, combos)
+        first = offsets[left][pair] + within // k_right[pair]
+        second = offsets[right][pair] + within % k_right[pair]
+        partials.append(
+            _aggregate_intent_pairs(
+                n_intents,
+                entry_intent[first],
+                entry_intent[second],
+                (entry_counts[first] * entry_counts[second]).astype(np.float64),
+                scores[pair],
+            )
+        )
+
+    if not partials:
+        return pd.DataFrame(columns=CONFUSION_COLUMNS)
+    keys, inverse = np.unique(
+        np.concatenate([p[0] for p in partials]), return_inverse=True
+    )
+    totals = [
+        np.bincount(inverse, weights=np.concatenate([p[k] for p in partials]))
+        for k in (1, 2, 3)
+    ]
+    confusion = pd.DataFrame(
+        {
+            "intent_a": intent_names[keys // n_intents],
+            "intent_b": intent_names[keys % n_intents],
+            "pairs": totals[0].astype(np.int64),
+            "exact_pairs": totals[1].astype(np.int64),
+            "mean_similarity": np.round(totals[2] / totals[0], 2),
+        }
+    )
+    return confusion.sort_values(
+        ["pairs", "intent_a", "intent_b"], ascending=[False, True, True]
+    ).reset_index(drop=True)
@@ -0,0 +1,193 @@
+"""
+Instrumentación liviana de las etapas del pipeline (extracción, duplicados,
+generación del YAML y merge).
+
+Cada etapa se marca con `stage("nombre")` (o el decorador `staged`) y, al
+terminar, deja un StageRecord con su duración, las filas procesadas y, si se
+pidió, el pico de memoria asignada (tracemalloc). La recolección está
+apagada por defecto: sin un colector activo y sin el logger en DEBUG, una
+etapa no mide nada.
+
+El colector vive en una ContextVar, así que cada hilo (cada sesión de
+Streamlit, cada corrida del CLI) recolecta lo suyo:
+
+    with instrumentation.collect(trace_memory=True) as records:
+        extract_intents(yaml_bytes)
+    for record in records:
+        print(record.stage, record.seconds, record.rows, record.peak_mb)
+
+Con el logger "utils.instrumentation" en DEBUG cada etapa además se
+registra en el log.
+
+tracemalloc es global al proceso: las etapas que miden memoria se ejecutan de
+a una (toman `trace_lock`), aunque vengan de sesiones o hilos distintos. Quien
+use tracemalloc por su cuenta (p. ej. la exportación a Excel) debe tomar el
+mismo lock.
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class StageRecord(NamedTuple):
+    stage: str
+    seconds: float
+    rows: int = None
+    peak_mb: float = None
+
+
+class Stage:
+    """Etapa en curso: el bloque asigna `rows` si sabe cuántas filas procesó."""
+
+    __slots__ = ("name", "rows")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+
+
+class _Collector:
+    __slots__ = ("records", "trace_memory", "max_records", "_local")
+
+    def __init__(self, records: list, trace_memory: bool, max_records: int):
+        self.records = records
+        self.trace_memory = trace_memory
+        self.max_records = max_records
+        # El colector se comparte con los hilos que copian el contexto (los
+        # trabajos en segundo plano): cada hilo lleva su pila de picos
+        self._local = threading.local()
+
+    @property
+    def peaks(self) -> list:
+        """
+        Por cada etapa abierta en este hilo, el mayor pico absoluto (bytes) de
+        las etapas anidadas que ya terminaron.
+        """
+        peaks = getattr(self._local, "peaks", None)
+        if peaks is None:
+            peaks = self._local.peaks = []
+        return peaks
+
+    def add(self, record: StageRecord) -> None:
+        self.records.append(record)
+        if self.max_records and len(self.records) > self.max_records:
+            del self.records[: -self.max_records]
+
+
+_collector = contextvars.ContextVar("instrumentation_collector", default=None)
+# Reentrante: las etapas anidadas del mismo hilo lo vuelven a tomar
+trace_lock = threading.RLock()
+
+
+def enable(
+    records: list = None, trace_memory: bool = False, max_records: int = None
+) -> list:
+    """
+    Activa la recolección en el contexto actual y devuelve la lista donde se
+    agregan los StageRecord (`records`, si se pasa una, p. ej. la que guarda
+    la sesión de Streamlit). Con max_records solo se conservan los últimos.
+    """
+    records = [] if records is None else records
+    _collector.set(_Collector(records, trace_memory, max_records))
+    return records
+
+
+def disable() -> None:
+    """Apaga la recolección en el contexto actual."""
+    _collector.set(None)
+
+
+def is_enabled() -> bool:
+    return _collector.get() is not None
+
+
+@contextlib.contextmanager
+def collect(trace_memory: bool = False, max_records: int = None):
+    """Recolecta las etapas del bloque; entrega la lista de StageRecord."""
+    records = []
+    token = _collector.set(_Collector(records, trace_memory, max_records))
+    try:
+        yield records
+    finally:
+        _collector.reset(token)
+
+
+def record(name: str, seconds: float, rows: int = None, peak_mb: float = None) -> None:
+    """Agrega una medición hecha por otro medio (p. ej. la exportación a Excel)."""
+    collector = _collector.get()
+    if collector is not None:
+        collector.add(StageRecord(name, seconds, rows, peak_mb))
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Mide el bloque como la etapa `name` si hay un colector o log en DEBUG."""
+    current = Stage(name)
+    collector = _collector.get()
+    if collector is None and not logger.isEnabledFor(logging.DEBUG):
+        yield current
+        return
+
+    trace_memory = collector is not None and collector.trace_memory
+    if trace_memory:
+        trace_lock.acquire()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start_bytes, outer_peak = tracemalloc.get_traced_memory()
+        # El pico se reinicia para esta etapa; el de la etapa que la contiene
+        # se le devuelve al salir, vía collector.peaks
+        tracemalloc.reset_peak()
+        collector.peaks.append(start_bytes)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - started
+        peak_mb = None
+        if trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], collector.peaks.pop())
+            peak_mb = round(max(peak - start_bytes, 0) / 2**20, 1)
+            if collector.peaks:
+                collector.peaks[-1] = max(collector.peaks[-1], peak, outer_peak)
+            if started_tracing:
+                tracemalloc.stop()
+            trace_lock.release()
+        stage_record = StageRecord(name, round(seconds, 4), current.rows, peak_mb)
+        if collector is not None:
+            collector.add(stage_record)
+        logger.debug(
+            "%s: %.3f s, %s filas, pico %s MB",
+            name,
+            seconds,
+            current.rows,
+            peak_mb,
+        )
+
+
+def staged(name: str, rows=None):
+    """
+    Decorador: cada llamada es la etapa `name`. `rows(resultado)` da las
+    filas procesadas (p. ej. `len` para una función que devuelve un DataFrame).
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as current:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    current.rows = rows(result)
+                return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,267 @@
+"""
+Ejecución en segundo plano de las etapas largas del asistente: extracción,
+detección de duplicados, generación del YAML con su merge y publicación.
+
+Las sesiones de Streamlit envían trabajos a un JobRunner compartido (uno por
+proceso, vía st.cache_resource) y guardan el Job en su session_state: el
+trabajo sigue corriendo aunque la página se recargue o el usuario toque otro
+control, y en cada rerun la sesión consulta su estado y, al terminar, su
+resultado.
+
+    runner = JobRunner(max_workers=2, max_per_owner=1)
+    job = runner.submit(session_id, "extract", extraer, yaml_bytes)
+    ...
+    if job.done():
+        resultado = job.result()
+
+La función del trabajo recibe el Job como primer argumento y puede informar
+su avance con `job.report(hechos, total)`. La cancelación es cooperativa: un
+trabajo en cola se descarta en el acto y uno en curso termina en el próximo
+`report` (o `raise_if_cancelled`), que lanza JobCancelled; si termina sin
+enterarse, el resultado se descarta igual. Los trabajos sin esos puntos se
+envían con cancellable=False: solo se pueden cancelar mientras esperan.
+
+Reparto entre usuarios: hay `max_workers` hilos y cada dueño (sesión) tiene a
+lo sumo `max_per_owner` trabajos corriendo. El resto espera en una cola por
+dueño y, cada vez que se libera un hilo, arranca el trabajo del dueño atendido
+hace más tiempo, así que quien encola varios trabajos pesados no demora a los
+demás.
+
+Son hilos y no procesos: las partes pesadas (rapidfuzz, numpy, pyarrow)
+liberan el GIL, y los trabajos comparten con la sesión los DataFrames y la
+caché del flujo parseado sin copiarlos. El contexto (contextvars) se copia al
+encolar, así que las etapas del trabajo se registran en el panel de
+rendimiento de la sesión que lo envió.
+"""
+
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """El trabajo se canceló antes de terminar."""
+
+
+class Job:
+    """Un trabajo enviado al JobRunner; lo consulta la sesión que lo envió."""
+
+    __slots__ = (
+        "id",
+        "owner",
+        "name",
+        "cancellable",
+        "status",
+        "progress",
+        "error",
+        "submitted_at",
+        "started_at",
+        "finished_at",
+        "_result",
+        "_call",
+        "_runner",
+        "_cancel",
+        "_finished",
+    )
+
+    def __init__(self, runner, owner, name: str, cancellable: bool = True):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.name = name
+        # Si corriendo llama a report/raise_if_cancelled (se puede cancelar)
+        self.cancellable = cancellable
+        self.status = QUEUED
+        self.progress = (0, 0)  # hechos, total (0 si no se sabe)
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._result = None
+        self._call = None
+        self._runner = runner
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    def report(self, done: int, total: int) -> None:
+        """Avance del trabajo; si se pidió cancelarlo, lanza JobCancelled."""
+        self.raise_if_cancelled()
+        self.progress = (done, total)
+
+    def raise_if_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.name)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status == CANCELLED
+
+    def cancel(self) -> None:
+        """Pide cancelar el trabajo: si está en cola no llega a correr."""
+        self._runner.cancel(self)
+
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def wait(self, timeout: float = None) -> bool:
+        """Espera a que el trabajo termine; False si se agotó `timeout`."""
+        return self._finished.wait(timeout)
+
+    def result(self):
+        """
+        Resultado del trabajo. Si falló, lanza su excepción; si se canceló,
+        JobCancelled. Hay que esperar a que termine (`done` o `wait`).
+        """
+        if self.status == DONE:
+            return self._result
+        if self.status == FAILED:
+            raise self.error
+        if self.status == CANCELLED:
+            raise JobCancelled(self.name)
+        raise RuntimeError(f"El trabajo '{self.name}' todavía no terminó")
+
+    @property
+    def seconds(self) -> float:
+        """Segundos corriendo (o en cola, si todavía no empezó)."""
+        started = self.started_at or self.submitted_at
+        return (self.finished_at or time.time()) - started
+
+
+class JobRunner:
+    """Hilos compartidos por todas las sesiones, con turnos por dueño."""
+
+    def __init__(self, max_workers: int = 2, max_per_owner: int = 1):
+        self.max_workers = max_workers
+        self.max_per_owner = max_per_owner
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="jobs"
+        )
+        self._lock = threading.Lock()
+        self._queues = {}  # dueño -> trabajos en cola
+        self._running = {}  # dueño -> trabajos corriendo
+        # dueño -> turno en que se le arrancó un trabajo por última vez
+        self._served = {}
+        self._turns = itertools.count()
+
+    def submit(
+        self, owner, name: str, func, *args, cancellable: bool = True, **kwargs
+    ) -> Job:
+        """
+        Encola `func(job, *args, **kwargs)` como el trabajo `name` de `owner`
+        y devuelve el Job. cancellable=False si `func` no informa su avance.
+        """
+        job = Job(self, owner, name, cancellable)
+        job._call = functools.partial(
+            contextvars.copy_context().run, func, job, *args, **kwargs
+        )
+        with self._lock:
+            self._queues.setdefault(owner, []).append(job)
+            self._dispatch()
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job._cancel.set()
+        with self._lock:
+            queue = self._queues.get(job.owner, [])
+            if job not in queue:
+                return  # Ya está corriendo: termina en su próximo report
+            queue.remove(job)
+            if not queue:
+                del self._queues[job.owner]
+                if job.owner not in self._running:
+                    self._served.pop(job.owner, None)
+        self._finish(job, CANCELLED)
+
+    def counts(self) -> tuple:
+        """(trabajos corriendo, trabajos en cola), de todos los dueños."""
+        with self._lock:
+            return (
+                sum(self._running.values()),
+                sum(len(queue) for queue in self._queues.values()),
+            )
+
+    def shutdown(self) -> None:
+        """Cancela lo que está en cola y espera a los trabajos en curso."""
+        with self._lock:
+            queued = [job for queue in self._queues.values() for job in queue]
+        for job in queued:
+            job.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _dispatch(self) -> None:
+        """Con el lock tomado: arranca trabajos mientras haya hilos libres."""
+        free = self.max_workers - sum(self._running.values())
+        while free > 0:
+            waiting = [
+                owner
+                for owner in self._queues
+                if self._running.get(owner, 0) < self.max_per_owner
+            ]
+            if not waiting:
+                return
+            # Primero quien menos trabajos tiene corriendo y, entre ellos, el
+            # atendido hace más tiempo (o nunca)
+            owner = min(
+                waiting,
+                key=lambda o: (self._running.get(o, 0), self._served.get(o, -1)),
+            )
+            queue = self._queues[owner]
+            job = queue.pop(0)
+            if not queue:
+                del self._queues[owner]
+            self._running[owner] = self._running.get(owner, 0) + 1
+            self._served[owner] = next(self._turns)
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._executor.submit(self._run, job)
+            free -= 1
+
+    def _run(self, job: Job) -> None:
+        status = FAILED
+        try:
+            job.raise_if_cancelled()
+            job._result = job._call()
+            # Si se pidió cancelar y el trabajo no llegó a enterarse (no volvió
+            # a llamar a report), el resultado se descarta igual
+            job.raise_if_cancelled()
+            status = DONE
+        except JobCancelled:
+            job._result = None
+            status = CANCELLED
+        except Exception as e:
+            job.error = e
+            # La sesión que lo envió puede no volver a consultarlo
+            logger.exception("El trabajo %s de %s falló", job.name, job.owner)
+        finally:
+            with self._lock:
+                self._running[job.owner] -= 1
+                if not self._running[job.owner]:
+                    del self._running[job.owner]
+                    if job.owner not in self._queues:
+                        self._served.pop(job.owner, None)
+                self._dispatch()
+            self._finish(job, status)
+
+    @staticmethod
+    def _finish(job: Job, status: str) -> None:
+        job._call = None  # Suelta los argumentos (p. ej. DataFrames grandes)
+        job.finished_at = time.time()
+        job.status = status
+        job._finished.set()
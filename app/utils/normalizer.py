@@ -0,0 +1,113 @@
+"""
+Normalización de texto compartida por la detección de duplicados (extractor)
+y la recuperación de IDs originales (builder).
+
+La normalización básica pasa a minúsculas, quita espacios en los extremos,
+reemplaza "áéíóúñ" por "aeioun", elimina la puntuación "¿?¡!.,;:" y colapsa
+los espacios. El modo `full_unicode` además descompone el texto (NFKD) y
+elimina todas las marcas diacríticas, no solo las seis vocales/eñe.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+try:  # pyarrow es opcional: habilita las operaciones Series.str en C (Arrow)
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+# Un único str.translate reemplaza acentos y elimina la puntuación
+_TRANSLATION_TABLE = str.maketrans("áéíóúñ", "aeioun", "¿?¡!.,;:")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Bloques Unicode de marcas combinantes (tildes, diéresis, etc.) tras NFKD
+_COMBINING_MARKS_RE = re.compile(
+    "[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+)
+
+# Caracteres de espacio (según str.isspace) dentro de Latin-1, para que las
+# expresiones regulares de Arrow (RE2) se comporten igual que `\s` en Python.
+_LATIN1_SPACE = r"\t-\r\x1c-\x20\x85\xa0"
+
+# Memoria de textos ya normalizados, por modo. Se vacía al superar el límite
+# para que una sesión larga no crezca sin cota.
+MEMO_MAX_ENTRIES = 500_000
+_memo = {False: {}, True: {}}
+
+
+def normalize(text: str, full_unicode: bool = False) -> str:
+    if not isinstance(text, str):  # Manejar datos que no sean string
+        return ""
+    t = text.strip().lower()
+    if full_unicode:
+        t = _COMBINING_MARKS_RE.sub("", unicodedata.normalize("NFKD", t))
+    t = t.translate(_TRANSLATION_TABLE)
+    return _WHITESPACE_RE.sub(" ", t)
+
+
+def _normalize_batch_arrow(texts: pd.Series) -> pd.Series:
+    """
+    Misma normalización sobre una Series respaldada por Arrow. Solo se usa con
+    textos Latin-1, donde minúsculas y espacios de Arrow coinciden con Python.
+    """
+    t = texts.str.replace(f"^[{_LATIN1_SPACE}]+|[{_LATIN1_SPACE}]+$", "", regex=True)
+    t = t.str.lower()
+    for accented, plain in zip("áéíóúñ", "aeioun"):
+        t = t.str.replace(accented, plain, regex=False)
+    t = t.str.replace("[¿?¡!.,;:]+", "", regex=True)
+    return t.str.replace(f"[{_LATIN1_SPACE}]+", " ", regex=True)
+
+
+def _normalize_batch(texts: list, full_unicode: bool) -> list:
+    """Normaliza una lista de textos distintos, en lote cuando es posible."""
+    values = pd.Series(texts, dtype=object)
+    is_str = values.map(lambda v: isinstance(v, str)).astype(bool)
+    out = pd.Series("", index=values.index, dtype=object)
+    if not is_str.any():
+        return out.tolist()
+
+    strings = values[is_str]
+    if pyarrow is not None and not full_unicode:
+        strings = strings.astype("string[pyarrow]")
+        in_batch = ~strings.str.contains(r"[^\x00-\xff]", regex=True)
+        out[in_batch[in_batch].index] = _normalize_batch_arrow(
+            strings[in_batch]
+        ).astype(object)
+        strings = strings[~in_batch].astype(object)
+    if len(strings):
+        out[strings.index] = strings.map(lambda v: normalize(v, full_unicode))
+    return out.tolist()
+
+
+def normalize_series(series: pd.Series, full_unicode: bool = False) -> pd.Series:
+    """
+    Versión vectorizada de `normalize` para una Series. Cada texto distinto
+    se normaliza una sola vez y el resultado queda memorizado, así que volver
+    a normalizar una tabla editada solo procesa las filas nuevas o cambiadas.
+    """
+    memo = _memo[full_unicode]
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = np.asarray(uniques, dtype=object).tolist()
+
+    pending = [u for u in uniques if u not in memo]
+    fresh = dict(zip(pending, _normalize_batch(pending, full_unicode)))
+    if fresh:
+        if len(memo) + len(fresh) > MEMO_MAX_ENTRIES:
+            memo.clear()
+        memo.update(fresh)
+
+    normalized = []
+    for u in uniques:
+        value = fresh.get(u)
+        if value is None:
+            value = memo.get(u)
+        if value is None:  # Memoria vaciada por otro hilo entre medio
+            value = normalize(u, full_unicode)
+        normalized.append(value)
+    normalized_uniques = np.array(normalized + [""], dtype=object)
+    # El código -1 (nulos) apunta al "" agregado al final
+    return pd.Series(
+        normalized_uniques[codes], index=series.index, name=series.name, dtype=object
+    )
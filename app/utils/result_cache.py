@@ -0,0 +1,285 @@
+"""
+Caché en disco de los resultados de la extracción (`extract_intents`), de la
+detección de duplicados (tabla y matriz de confusión, por umbral) y de la
+generación del bloque NLU (`build_yaml`), indexada por hash de contenido.
+
+Es el segundo nivel detrás de `st.cache_data`: sobrevive a reinicios del
+servidor y se comparte entre procesos y usuarios que apunten al mismo
+directorio. Se habilita con la variable de entorno INTENTFLOW_CACHE_DIR y
+requiere pyarrow (los DataFrames se guardan en Parquet). Una entrada guardada
+hace más de INTENTFLOW_CACHE_TTL segundos no se devuelve: se borra al leerla
+o al escribir otra, aunque se siga usando. Si el total supera
+INTENTFLOW_CACHE_MAX_MB, al escribir se borran las usadas hace más tiempo.
+
+Cada entrada es un directorio: la fecha de sus archivos es la de escritura
+(para el TTL) y la del directorio, que se actualiza en cada lectura, la del
+último uso (para el tamaño máximo).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+try:  # pyarrow es opcional: sin él solo queda la caché en memoria
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+from auto_train.loader import flow_digest
+from utils.builder import build_yaml
+from utils.curation_io import serialize_segments
+from utils.duplicates import DuplicateIndex
+from utils.extractor import extract_intents, intent_confusion
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "INTENTFLOW_CACHE_DIR"
+CACHE_MAX_MB_ENV = "INTENTFLOW_CACHE_MAX_MB"
+CACHE_TTL_ENV = "INTENTFLOW_CACHE_TTL"
+DEFAULT_CACHE_MAX_MB = 1024
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Cambiar cuando cambie el formato de los resultados: invalida lo guardado.
+# 2: segments_original como tuplas al extraer y columnas de texto de Arrow
+CACHE_VERSION = "2"
+
+
+def cache_dir():
+    """Directorio de la caché en disco, o None si está deshabilitada."""
+    path = os.environ.get(CACHE_DIR_ENV)
+    if not path or pyarrow is None:
+        return None
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def frames_digest(*frames: pd.DataFrame) -> str:
+    """Hash de contenido (columnas y valores, sin el índice) de DataFrames."""
+    digest = hashlib.sha256()
+    for df in frames:
+        df = serialize_segments(df)  # Las tuplas de segmentos no son hasheables
+        digest.update(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _entry_path(root: str, namespace: str, key: str) -> str:
+    return os.path.join(root, f"{namespace}-{CACHE_VERSION}-{key}")
+
+
+def _ttl_seconds() -> float:
+    return float(os.environ.get(CACHE_TTL_ENV, DEFAULT_CACHE_TTL_SECONDS))
+
+
+def _load_entry(namespace: str, key: str):
+    """
+    Ruta de la entrada si existe y no venció (y la marca como usada recién),
+    o None. Una entrada vencida se borra.
+    """
+    root = cache_dir()
+    if root is None:
+        return None
+    path = _entry_path(root, namespace, key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        written_at = min(entry.stat().st_mtime for entry in os.scandir(path))
+        if time.time() - written_at > _ttl_seconds():
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        os.utime(path)
+    except (OSError, ValueError):  # Borrada por otro proceso entre medio
+        return None
+    return path
+
+
+def _store_entry(namespace: str, key: str, write) -> None:
+    """
+    Escribe una entrada en un directorio temporal con `write(tmp_path)` y la
+    publica con un rename atómico, para que otro proceso nunca lea una
+    entrada a medio escribir.
+    """
+    root = cache_dir()
+    if root is None:
+        return
+    path = _entry_path(root, namespace, key)
+    tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # Ya la publicó otro proceso (o el disco falló): no es un error
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    evict(root)
+
+
+def load_frames(namespace: str, key: str):
+    """DataFrames guardados bajo (namespace, key), o None si no están."""
+    path = _load_entry(namespace, key)
+    if path is None:
+        return None
+    try:
+        n_frames = len([f for f in os.listdir(path) if f.endswith(".parquet")])
+        return [
+            pd.read_parquet(os.path.join(path, f"{i}.parquet")) for i in range(n_frames)
+        ]
+    except (OSError, ValueError):
+        return None
+
+
+def store_frames(namespace: str, key: str, frames) -> None:
+    def write(tmp_path):
+        for i, df in enumerate(frames):
+            # Los segmentos vuelven como JSON: builder y exportación aceptan ambos
+            serialize_segments(df).to_parquet(
+                os.path.join(tmp_path, f"{i}.parquet"), index=False
+            )
+
+    try:
+        _store_entry(namespace, key, write)
+    except (ValueError, TypeError) as e:
+        # Columnas con tipos mezclados que Parquet no admite: no se cachea
+        logger.warning("No se pudo guardar en la caché (%s): %s", namespace, e)
+
+
+def load_text(namespace: str, key: str):
+    path = _load_entry(namespace, key)
+    if path is None:
+        return None
+    try:
+        with open(os.path.join(path, "result.txt"), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store_text(namespace: str, key: str, text: str) -> None:
+    def write(tmp_path):
+        with open(os.path.join(tmp_path, "result.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    _store_entry(namespace, key, write)
+
+
+def evict(root: str = None) -> None:
+    """Aplica TTL y tamaño máximo a las entradas de la caché en disco."""
+    root = root or cache_dir()
+    if root is None:
+        return
+    ttl = _ttl_seconds()
+    max_bytes = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB)) * 2**20
+
+    entries = []
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith(".tmp-") or not os.path.isdir(path):
+            continue
+        try:
+            used_at = os.stat(path).st_mtime
+            files = [e.stat() for e in os.scandir(path)]
+        except OSError:
+            continue
+        written_at = min((f.st_mtime for f in files), default=used_at)
+        size = sum(f.st_size for f in files)
+        if now - written_at > ttl:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            entries.append((used_at, size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def cached_extract_intents(
+    yaml_bytes: bytes,
+    digest: str = None,
+    workers: int = 1,
+    detect_duplicates: bool = True,
+    progress=None,
+):
+    """
+    `extract_intents` con caché en disco por hash del YAML. Con la caché
+    habilitada, segments_original vuelve siempre como texto JSON (lo que se
+    guarda), tanto si la entrada estaba como si no. `progress` se pasa a
+    `extract_intents` (si la entrada estaba, no se llama).
+    """
+    key = digest or flow_digest(yaml_bytes)
+    namespace = "extract" if detect_duplicates else "extract-utterances"
+    frames = load_frames(namespace, key)
+    if frames is None:
+        frames = extract_intents(
+            yaml_bytes,
+            workers=workers,
+            detect_duplicates=detect_duplicates,
+            progress=progress,
+        )
+        if cache_dir() is not None:
+            frames = [serialize_segments(df) for df in frames]
+            store_frames(namespace, key, frames)
+    return tuple(frames)
+
+
+def cached_duplicates(
+    df_for_duplicates: pd.DataFrame, threshold: int, workers: int = 1
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (df_dups, df_confusion) con caché en disco por hash de la tabla y umbral.
+    Los pares se buscan una sola vez (DuplicateIndex) para las dos tablas.
+    """
+    key = f"{frames_digest(df_for_duplicates)}-{threshold}"
+    frames = load_frames("duplicates-confusion", key)
+    if frames is None:
+        dup_index = DuplicateIndex(threshold=threshold, workers=workers)
+        dup_index.update(df_for_duplicates)
+        frames = [
+            dup_index.to_frame(),
+            intent_confusion(
+                df_for_duplicates, threshold, pair_blocks=dup_index.pair_blocks
+            ),
+        ]
+        store_frames("duplicates-confusion", key, frames)
+    return tuple(frames)
+
+
+def build_yaml_key(
+    df_utterances: pd.DataFrame,
+    df_intent_details: pd.DataFrame,
+    original_yaml_content_for_ids: bytes = None,
+) -> str:
+    yaml_key = (
+        flow_digest(original_yaml_content_for_ids)
+        if original_yaml_content_for_ids
+        else "sin-yaml"
+    )
+    return f"{frames_digest(df_utterances, df_intent_details)}-{yaml_key[:32]}"
+
+
+def cached_build_yaml(
+    df_utterances: pd.DataFrame,
+    df_intent_details: pd.DataFrame,
+    original_yaml_content_for_ids: bytes = None,
+    key: str = None,
+) -> str:
+    """`build_yaml` con caché en disco por hash de las tablas y del YAML."""
+    if key is None:
+        key = build_yaml_key(
+            df_utterances, df_intent_details, original_yaml_content_for_ids
+        )
+    nlu_block_str = load_text("build", key)
+    if nlu_block_str is None:
+        nlu_block_str = build_yaml(
+            df_utterances, df_intent_details, original_yaml_content_for_ids
+        )
+        store_text("build", key, nlu_block_str)
+    return nlu_block_str
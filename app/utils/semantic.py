@@ -0,0 +1,296 @@
+"""
+Detección semántica de duplicados (paráfrasis), como complemento opcional de
+`find_duplicates`: "quiero pagar mi factura" y "deseo abonar la cuenta" no se
+parecen carácter a carácter, pero sí en significado.
+
+1. Codificación por lotes en una matriz NumPy de vectores normalizados:
+   - con sentence-transformers instalado, un modelo local en CPU
+     (INTENTFLOW_SEMANTIC_MODEL; por defecto uno multilingüe de paráfrasis);
+   - si no, TF-IDF de n-gramas de carácter con hashing, calculado de forma
+     vectorizada y sin descargas (capta variantes morfológicas, no
+     sinónimos).
+2. Búsqueda de vecinos aproximada (ANN) por similitud coseno: faiss o
+   hnswlib si están instalados y, si no, LSH de hiperplanos aleatorios en
+   NumPy, que solo compara (con productos de matrices) los textos que caen
+   en el mismo bucket.
+
+La tabla resultante tiene las mismas columnas que `find_duplicates`, con
+type "semantico".
+
+Los paquetes opcionales (sentence-transformers importa torch) se importan
+recién al usarlos, así que importar este módulo no los carga.
+"""
+
+import importlib
+import logging
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from utils.duplicates import build_norm_index, duplicates_frame
+from utils.normalizer import normalize_series
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_MODEL_ENV = "INTENTFLOW_SEMANTIC_MODEL"
+DEFAULT_SEMANTIC_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_SEMANTIC_THRESHOLD = 0.85
+
+# TF-IDF con hashing: tamaños de n-grama, dimensión de los vectores y
+# cantidad de features distintas para calcular la IDF.
+NGRAM_SIZES = (3, 4, 5)
+HASH_DIM = 512
+_IDF_FEATURES = 1 << 20
+ENCODE_CHUNK_ROWS = 20_000
+
+# Vecinos por texto en los índices HNSW
+ANN_NEIGHBOURS = 10
+# LSH: tablas, textos esperados por bucket y tope de filas por producto
+LSH_TABLES = 16
+LSH_BUCKET_TARGET = 64
+LSH_BLOCK_ROWS = 1024
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    """Finalizador de splitmix64: reparte bien también los bits bajos."""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _ngram_hashes(texts: list[str], n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (fila, hash) de cada n-grama de carácter de `texts`, con un espacio como
+    borde de cada texto. Todas las ventanas se calculan a la vez sobre el
+    texto concatenado y se descartan las que cruzan de un texto al siguiente.
+    """
+    padded = [f" {t} " for t in texts]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer(
+        "".join(padded).encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+    ).astype(np.uint64)
+    rows = np.repeat(np.arange(len(padded)), lengths)
+    n_windows = len(codes) - n + 1
+    if n_windows <= 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.uint64)
+
+    h = np.full(n_windows, _FNV_OFFSET ^ np.uint64(n))
+    for k in range(n):
+        h = (h ^ codes[k : k + n_windows]) * _FNV_PRIME
+    valid = rows[:n_windows] == rows[n - 1 :]
+    return rows[:n_windows][valid], _mix64(h[valid])
+
+
+def tfidf_hash_encode(texts: list[str], dim: int = HASH_DIM) -> np.ndarray:
+    """
+    Vectores TF-IDF de n-gramas de carácter, proyectados a `dim` columnas con
+    hashing con signo (una proyección aleatoria dispersa) y normalizados.
+    """
+    n = len(texts)
+    chunks = [
+        texts[start : start + ENCODE_CHUNK_ROWS]
+        for start in range(0, n, ENCODE_CHUNK_ROWS)
+    ]
+
+    # Pasada 1: en cuántos textos aparece cada feature
+    doc_freq = np.zeros(_IDF_FEATURES, dtype=np.int64)
+    for chunk in chunks:
+        for size in NGRAM_SIZES:
+            rows, hashes = _ngram_hashes(chunk, size)
+            features = (hashes % np.uint64(_IDF_FEATURES)).astype(np.int64)
+            # Un conteo por (texto, feature): ordenar y quedarse con los distintos
+            keys = np.sort(rows * _IDF_FEATURES + features)
+            present = keys[np.diff(keys, prepend=-1) != 0] % _IDF_FEATURES
+            doc_freq += np.bincount(present, minlength=_IDF_FEATURES)
+    idf = np.log((1.0 + n) / (1.0 + doc_freq)) + 1.0
+
+    # Pasada 2: acumular TF * IDF con signo en la columna de cada feature
+    vectors = np.zeros((n, dim), dtype=np.float32)
+    offset = 0
+    for chunk in chunks:
+        flat = np.zeros(len(chunk) * dim, dtype=np.float64)
+        for size in NGRAM_SIZES:
+            rows, hashes = _ngram_hashes(chunk, size)
+            features = (hashes % np.uint64(_IDF_FEATURES)).astype(np.int64)
+            columns = features % dim
+            signs = ((hashes >> np.uint64(40)) & np.uint64(1)).astype(np.float64)
+            flat += np.bincount(
+                rows * dim + columns,
+                weights=idf[features] * (2.0 * signs - 1.0),
+                minlength=len(flat),
+            )
+        vectors[offset : offset + len(chunk)] = flat.reshape(len(chunk), dim)
+        offset += len(chunk)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+@lru_cache(maxsize=None)
+def _optional_module(name: str):
+    """El módulo `name` si está instalado, o None (se importa una sola vez)."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+@lru_cache(maxsize=1)
+def _load_sentence_model(model_name: str):
+    sentence_transformers = _optional_module("sentence_transformers")
+    if sentence_transformers is None:  # Opcional: embeddings de oraciones en CPU
+        return None
+    try:
+        return sentence_transformers.SentenceTransformer(model_name, device="cpu")
+    except Exception as e:  # Sin el modelo en disco ni acceso a la red
+        logger.warning("No se pudo cargar el modelo '%s': %s", model_name, e)
+        return None
+
+
+def encode_texts(texts: list[str], backend: str = "auto") -> tuple[np.ndarray, str]:
+    """
+    Codifica `texts` en una matriz (n, d) de vectores unitarios. `backend`
+    es "auto", "sentence-transformers" o "tfidf"; devuelve también el que se
+    usó realmente.
+    """
+    if backend in ("auto", "sentence-transformers"):
+        model = _load_sentence_model(
+            os.environ.get(SEMANTIC_MODEL_ENV, DEFAULT_SEMANTIC_MODEL)
+        )
+        if model is not None:
+            vectors = model.encode(
+                texts,
+                batch_size=256,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+            return vectors.astype(np.float32), "sentence-transformers"
+    return tfidf_hash_encode(texts), "tfidf"
+
+
+def _knn_pairs(indices: np.ndarray, similarities: np.ndarray, threshold: float):
+    """Pares (i < j) de una matriz de vecinos (n, k) con similitud >= threshold."""
+    rows = np.repeat(np.arange(len(indices)), indices.shape[1])
+    cols = indices.ravel().astype(np.int64)
+    sims = similarities.ravel().astype(np.float64)
+    keep = (cols >= 0) & (cols != rows) & (sims >= threshold)
+    return rows[keep], cols[keep], sims[keep]
+
+
+def _lsh_pairs(vectors: np.ndarray, threshold: float, seed: int = 0):
+    """
+    Pares candidatos por LSH de hiperplanos aleatorios: en cada tabla, los
+    textos con la misma firma de signos se comparan entre sí con productos
+    de matrices (por bloques si el bucket es grande).
+    """
+    n, dim = vectors.shape
+    n_bits = int(np.clip(np.round(np.log2(max(n, 1) / LSH_BUCKET_TARGET)), 1, 30))
+    rng = np.random.default_rng(seed)
+    weights = np.int64(1) << np.arange(n_bits, dtype=np.int64)
+
+    lefts, rights, sims = [], [], []
+    for _ in range(LSH_TABLES):
+        planes = rng.standard_normal((dim, n_bits)).astype(np.float32)
+        signatures = ((vectors @ planes) > 0).astype(np.int64) @ weights
+        order = np.argsort(signatures, kind="stable")
+        bounds = np.flatnonzero(np.diff(signatures[order])) + 1
+        for bucket in np.split(order, bounds):
+            if len(bucket) < 2:
+                continue
+            for start in range(0, len(bucket), LSH_BLOCK_ROWS):
+                queries = bucket[start : start + LSH_BLOCK_ROWS]
+                others = bucket[start:]
+                block = vectors[queries] @ vectors[others].T
+                rows, cols = np.nonzero(block >= threshold)
+                upper = cols > rows  # `others` empieza en `queries[0]`
+                lefts.append(queries[rows[upper]])
+                rights.append(others[cols[upper]])
+                sims.append(block[rows[upper], cols[upper]].astype(np.float64))
+    if not lefts:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty.copy(), np.array([], dtype=np.float64)
+    return np.concatenate(lefts), np.concatenate(rights), np.concatenate(sims)
+
+
+def similar_vector_pairs(vectors: np.ndarray, threshold: float):
+    """
+    Pares (left, right, similitud) con left < right y similitud coseno >=
+    threshold, únicos y ordenados. Usa faiss o hnswlib si están instalados y
+    LSH en NumPy si no.
+    """
+    n, dim = vectors.shape
+    k = min(ANN_NEIGHBOURS + 1, n)
+    # Opcionales: índices HNSW de faiss o de hnswlib
+    faiss = _optional_module("faiss")
+    hnswlib = _optional_module("hnswlib") if faiss is None else None
+    if n < 2:
+        left = right = np.array([], dtype=np.int64)
+        sims = np.array([], dtype=np.float64)
+    elif faiss is not None:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        similarities, indices = index.search(vectors, k)
+        left, right, sims = _knn_pairs(indices, similarities, threshold)
+    elif hnswlib is not None:
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.init_index(max_elements=n, ef_construction=200, M=32)
+        index.add_items(vectors)
+        index.set_ef(max(50, 2 * k))
+        indices, distances = index.knn_query(vectors, k=k)
+        left, right, sims = _knn_pairs(indices, 1.0 - distances, threshold)
+    else:
+        left, right, sims = _lsh_pairs(vectors, threshold)
+
+    left, right = np.minimum(left, right), np.maximum(left, right)
+    keys, first = np.unique(left * max(n, 1) + right, return_index=True)
+    return keys // max(n, 1), keys % max(n, 1), np.minimum(sims[first], 1.0)
+
+
+def find_semantic_duplicates(
+    df: pd.DataFrame,
+    threshold: float = DEFAULT_SEMANTIC_THRESHOLD,
+    fuzzy_threshold: int = 90,
+    backend: str = "auto",
+    progress=None,
+) -> pd.DataFrame:
+    """
+    Pares de utterances semánticamente parecidos (similitud coseno >=
+    threshold) entre textos normalizados distintos. Se omiten los pares que
+    `find_duplicates` ya reporta (fuzz.ratio >= fuzzy_threshold). Mismas
+    columnas que `find_duplicates`; similarity es el coseno * 100.
+    `progress(hechos, total)` informa las etapas terminadas.
+    """
+    report = progress or (lambda done, total: None)
+    report(0, 3)
+    df = df.assign(norm=normalize_series(df["utterance"]))
+    norm_index = build_norm_index(df)
+    norms = np.asarray(norm_index.index, dtype=object)
+
+    vectors, _ = encode_texts(norms.tolist(), backend)
+    report(1, 3)
+    left, right, sims = similar_vector_pairs(vectors, threshold)
+    report(2, 3)
+    if len(left):
+        ratios = process.cpdist(
+            norms[left], norms[right], scorer=fuzz.ratio, dtype=np.float64
+        )
+        keep = ratios < fuzzy_threshold
+        left, right, sims = left[keep], right[keep], sims[keep]
+
+    return duplicates_frame(
+        df,
+        norm_index,
+        left,
+        right,
+        np.round(sims * 100, 2),
+        approx_type="semantico",
+        include_exact=False,
+    )
@@ -0,0 +1,117 @@
+"""
+Benchmark de find_duplicates: motor por bloques vs. el doble bucle original.
+
+Uso:
+    python benchmarks/bench_duplicates.py --sizes 1000 10000 50000
+
+El doble bucle original solo se ejecuta hasta --legacy-max utterances (es
+O(n²) en Python) y, cuando corre, se verifica que ambos devuelvan las mismas
+filas. Con --workers 1 4 16 también se mide el escalado del motor en
+paralelo y se verifica que el resultado sea idéntico al de un solo worker.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from rapidfuzz import fuzz
+
+from synthetic import synthetic_utterance_frame
+from utils.extractor import find_duplicates, normalize
+
+
+def legacy_find_duplicates(df: pd.DataFrame, threshold: int) -> pd.DataFrame:
+    """Copia de la implementación original, usada como referencia."""
+    df = df.assign(norm=df["utterance"].map(normalize))
+    counts = df["norm"].value_counts()
+    exact_norms = counts[counts > 1].index
+    intent_groups = (
+        df.groupby("norm")["intent"].unique().apply(lambda x: ", ".join(sorted(set(x))))
+    )
+    exact_df = df[df["norm"].duplicated(keep=False)].copy()
+    exact_df["similarity"] = 100
+    exact_df["type"] = "duplicado"
+    exact_df["mismo_intent"] = exact_df["norm"].map(
+        lambda n: len(set(df[df["norm"] == n]["intent"])) == 1
+    )
+    exact_df["intents"] = exact_df["norm"].map(intent_groups)
+    exact_out = exact_df[["utterance", "intents", "similarity", "type", "mismo_intent"]]
+
+    uniq = list(set(df["norm"]) - set(exact_norms))
+    approx_rows = []
+    for i, n1 in enumerate(uniq):
+        for n2 in uniq[i + 1 :]:
+            score = fuzz.ratio(n1, n2)
+            if threshold <= score < 100:
+                for n in (n1, n2):
+                    approx_rows.append(
+                        {
+                            "utterance": df[df["norm"] == n].iloc[0].utterance,
+                            "intents": ",".join(df[df["norm"] == n]["intent"].unique()),
+                            "similarity": score,
+                            "type": "aproximado",
+                            "mismo_intent": ",".join(
+                                df[df["norm"] == n1]["intent"].unique()
+                            )
+                            == ",".join(df[df["norm"] == n2]["intent"].unique()),
+                        }
+                    )
+    approx_out = pd.DataFrame(approx_rows).drop_duplicates()
+    return pd.concat([exact_out, approx_out], ignore_index=True)
+
+
+def _canonical(df: pd.DataFrame) -> pd.DataFrame:
+    cols = ["utterance", "intents", "similarity", "type", "mismo_intent"]
+    return (
+        df[cols]
+        .astype({"similarity": float, "mismo_intent": bool})
+        .sort_values(cols)
+        .reset_index(drop=True)
+    )
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--threshold", type=int, default=90)
+    parser.add_argument("--legacy-max", type=int, default=10000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    print(
+        f"{'n':>8} {'pares':>8} {'nuevo (s)':>10} {'original (s)':>13} {'speedup':>8}"
+    )
+    for n in args.sizes:
+        df = synthetic_utterance_frame(n)
+        new, new_s = _timed(find_duplicates, df, args.threshold)
+        legacy_s = None
+        if n <= args.legacy_max:
+            legacy, legacy_s = _timed(legacy_find_duplicates, df, args.threshold)
+            pd.testing.assert_frame_equal(_canonical(new), _canonical(legacy))
+        speedup = f"{legacy_s / new_s:8.1f}x" if legacy_s else f"{'-':>9}"
+        legacy_txt = f"{legacy_s:13.2f}" if legacy_s else f"{'-':>13}"
+        print(f"{n:>8} {len(new):>8} {new_s:10.2f} {legacy_txt} {speedup}")
+        for workers in args.workers:
+            if workers == 1:
+                continue
+            parallel, parallel_s = _timed(find_duplicates, df, args.threshold, workers)
+            pd.testing.assert_frame_equal(parallel, new)
+            print(
+                f"{'':>8} workers={workers}: {parallel_s:.2f} s ({new_s / parallel_s:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
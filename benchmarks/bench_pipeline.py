@@ -0,0 +1,297 @@
+"""
+Benchmark de punta a punta del pipeline sobre un flujo sintético.
+
+Uso:
+    python benchmarks/bench_pipeline.py --intents 200 --utterances-per-intent 50 \\
+        --output resultados.json
+    python benchmarks/bench_pipeline.py --output nuevo.json --compare resultados.json
+
+Mide cada etapa por separado: carga del YAML, extracción, detección de
+duplicados, exportación e importación del Excel de curación (y del paquete
+Parquet si hay pyarrow), generación del bloque NLU y merge con el flujo
+original. El tiempo es el mínimo de --repeat corridas sin tracemalloc (que
+multiplica los tiempos); el pico de memoria sale de una corrida aparte con
+tracemalloc, salvo con --no-memory.
+
+El resultado se guarda como JSON con la configuración del flujo, las
+versiones de las dependencias y, por etapa, segundos, pico de memoria y filas
+procesadas. Con --compare se compara contra otro JSON y el proceso termina
+con código 1 si alguna etapa es más lenta que la referencia en más de
+--tolerance (proporción).
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import rapidfuzz
+from ruamel.yaml import YAML
+
+from auto_train import loader
+from synthetic import synthetic_flow_yaml
+from utils import curation_io
+from utils.builder import build_yaml, merge_into_original
+from utils.extractor import extract_intents, find_duplicates
+
+# Configuración del flujo sintético que se guarda en el JSON
+FLOW_OPTIONS = [
+    "intents",
+    "utterances_per_intent",
+    "near_duplicate_share",
+    "entities",
+    "padding_states",
+    "seed",
+]
+
+
+def _stages(yaml_bytes: bytes, threshold: int, workers: int) -> list:
+    """
+    (nombre, función) de cada etapa, en orden. Cada función toma el estado
+    que dejaron las anteriores y devuelve la cantidad de filas procesadas.
+    """
+
+    def load(state):
+        # Sin la caché de ParsedFlow, para medir el parseo real
+        loader._parsed_flow_cache.clear()
+        state["flow"] = loader.parse_flow(yaml_bytes).bot_flow()
+        return sum(len(intent.utterances) for intent in state["flow"].get_intents())
+
+    def extract(state):
+        (
+            state["df_utterances"],
+            state["df_dups"],
+            state["df_entity_declarations"],
+            state["df_entity_types"],
+            state["df_intent_details"],
+        ) = extract_intents(yaml_bytes, workers=workers)
+        return len(state["df_utterances"])
+
+    def dedupe(state):
+        df_for_duplicates = state["df_utterances"].rename(
+            columns={"intent_name": "intent", "utterance_text": "utterance"}
+        )[["intent", "utterance"]]
+        state["df_dups"] = find_duplicates(
+            df_for_duplicates, threshold=threshold, workers=workers
+        )
+        return len(state["df_dups"])
+
+    def frames(state):
+        return (
+            state["df_utterances"],
+            state["df_dups"],
+            state["df_intent_details"],
+            state["df_entity_declarations"],
+            state["df_entity_types"],
+        )
+
+    def export_excel(state):
+        state["excel"] = io.BytesIO()
+        return curation_io.write_curation_excel(state["excel"], *frames(state))["rows"]
+
+    def import_excel(state):
+        state["excel"].seek(0)
+        state["curated"] = curation_io.read_curation_excel(state["excel"])
+        return len(state["curated"][0])
+
+    def export_bundle(state):
+        state["bundle"] = io.BytesIO()
+        curation_io.write_curation_bundle(state["bundle"], *frames(state))
+        return sum(len(df) for df in frames(state) if df is not None)
+
+    def import_bundle(state):
+        state["bundle"].seek(0)
+        return len(curation_io.read_curation_bundle(state["bundle"])[0])
+
+    def build(state):
+        df_utterances, df_intent_details = state["curated"]
+        state["nlu_block"] = build_yaml(df_utterances, df_intent_details, yaml_bytes)
+        return len(df_utterances)
+
+    def merge(state):
+        merge_into_original(yaml_bytes, YAML().load(state["nlu_block"]))
+        return len(state["curated"][0])
+
+    def merge_splice(state):
+        merge_into_original(yaml_bytes, YAML().load(state["nlu_block"]), splice=True)
+        return len(state["curated"][0])
+
+    stages = [
+        ("load", load),
+        ("extract", extract),
+        ("dedupe", dedupe),
+        ("export_excel", export_excel),
+        ("import_excel", import_excel),
+    ]
+    if curation_io.pyarrow is not None:
+        stages += [("export_bundle", export_bundle), ("import_bundle", import_bundle)]
+    return stages + [
+        ("build", build),
+        ("merge", merge),
+        ("merge_splice", merge_splice),
+    ]
+
+
+def run_pipeline(yaml_bytes: bytes, threshold: int, workers: int, memory: bool):
+    """Una corrida del pipeline: {etapa: (segundos, pico en MB o None, filas)}."""
+    results = {}
+    state = {}
+    if memory:
+        tracemalloc.start()
+    try:
+        for name, stage in _stages(yaml_bytes, threshold, workers):
+            if memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            rows = stage(state)
+            seconds = time.perf_counter() - started
+            peak_mb = None
+            if memory:
+                peak_mb = (tracemalloc.get_traced_memory()[1] - baseline) / 2**20
+            results[name] = (seconds, peak_mb, rows)
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return results
+
+
+def benchmark(args) -> dict:
+    yaml_bytes = synthetic_flow_yaml(
+        args.intents,
+        args.utterances_per_intent,
+        padding_states=args.padding_states,
+        near_duplicate_share=args.near_duplicate_share,
+        seed=args.seed,
+        n_entities=args.entities,
+    )
+    timings = [
+        run_pipeline(yaml_bytes, args.threshold, args.workers, memory=False)
+        for _ in range(args.repeat)
+    ]
+    peaks = (
+        run_pipeline(yaml_bytes, args.threshold, args.workers, memory=True)
+        if args.memory
+        else {}
+    )
+
+    stages = {}
+    for name, (_, _, rows) in timings[0].items():
+        peak_mb = peaks.get(name, (None, None))[1]
+        stages[name] = {
+            "seconds": round(min(run[name][0] for run in timings), 4),
+            "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+            "rows": rows,
+        }
+    return {
+        "config": {
+            **{option: getattr(args, option) for option in FLOW_OPTIONS},
+            "threshold": args.threshold,
+            "workers": args.workers,
+            "repeat": args.repeat,
+        },
+        "flow_mb": round(len(yaml_bytes) / 1e6, 2),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "rapidfuzz": rapidfuzz.__version__,
+            "excel_writer": (
+                "xlsxwriter" if curation_io.xlsxwriter is not None else "openpyxl"
+            ),
+            "excel_reader": loader.EXCEL_READ_ENGINE,
+        },
+        "stages": stages,
+        "total_seconds": round(sum(s["seconds"] for s in stages.values()), 4),
+    }
+
+
+def compare(result: dict, reference: dict, tolerance: float) -> list:
+    """Imprime la comparación por etapa y devuelve las etapas más lentas."""
+    regressions = []
+    print(f"\n{'etapa':<14} {'ref (s)':>9} {'actual (s)':>10} {'ratio':>7}")
+    for name, stage in result["stages"].items():
+        old = reference["stages"].get(name)
+        if old is None or not old["seconds"]:
+            print(f"{name:<14} {'-':>9} {stage['seconds']:10.3f} {'-':>7}")
+            continue
+        ratio = stage["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  <- más lenta"
+        print(
+            f"{name:<14} {old['seconds']:9.3f} {stage['seconds']:10.3f} {ratio:7.2f}{flag}"
+        )
+    if reference.get("config") != result["config"]:
+        print("\nAviso: la referencia se corrió con otra configuración.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--intents", type=int, default=100)
+    parser.add_argument("--utterances-per-intent", type=int, default=30)
+    parser.add_argument("--near-duplicate-share", type=float, default=0.1)
+    parser.add_argument("--entities", type=int, default=3)
+    parser.add_argument("--padding-states", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=int, default=90)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="No medir el pico de memoria (ahorra una corrida con tracemalloc)",
+    )
+    parser.add_argument("-o", "--output", help="Guardar el resultado en este JSON")
+    parser.add_argument("--compare", help="JSON de referencia para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # extract_intents imprime diagnósticos: no se mezclan con la tabla
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            result = benchmark(args)
+        finally:
+            sys.stdout = stdout
+
+    print(
+        f"Flujo de {result['flow_mb']} MB: {args.intents} intents x "
+        f"{args.utterances_per_intent} utterances, {args.padding_states} estados"
+    )
+    print(f"{'etapa':<14} {'tiempo (s)':>10} {'pico (MB)':>10} {'filas':>8}")
+    for name, stage in result["stages"].items():
+        peak = f"{stage['peak_mb']:10.1f}" if stage["peak_mb"] is not None else " " * 10
+        print(f"{name:<14} {stage['seconds']:10.3f} {peak} {stage['rows']:8d}")
+    print(f"{'total':<14} {result['total_seconds']:10.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResultado: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            reference = json.load(f)
+        regressions = compare(result, reference, args.tolerance)
+        if regressions:
+            print(f"\nEtapas más lentas que la referencia: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark de carga del YAML: round-trip de ruamel (ruta anterior de la
+extracción) vs. las cargas de solo lectura y la extracción por eventos del
+bloque NLU.
+
+Uso:
+    python benchmarks/bench_yaml_load.py --padding-states 200 2000
+
+Cada modo corre en un subproceso aparte para medir su pico de RSS sin que
+los demás lo contaminen.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ["roundtrip", "ruamel-safe", "read-only", "nlu-stream"]
+
+
+def _load(mode: str, yaml_bytes: bytes):
+    from io import BytesIO
+
+    from ruamel.yaml import YAML
+
+    from auto_train.loader import load_read_only, stream_nlu_settings
+
+    if mode == "nlu-stream":
+        return stream_nlu_settings(yaml_bytes)
+    if mode == "roundtrip":
+        return YAML().load(BytesIO(yaml_bytes))
+    if mode == "ruamel-safe":
+        return YAML(typ="safe").load(BytesIO(yaml_bytes))
+    return load_read_only(yaml_bytes)
+
+
+def _run_one(mode: str, path: str) -> dict:
+    """Se ejecuta en el subproceso: carga una vez y reporta tiempo y RSS."""
+    from auto_train.loader import READ_ONLY_LOADER
+
+    with open(path, "rb") as f:
+        yaml_bytes = f.read()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    _load(mode, yaml_bytes)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode if mode != "read-only" else f"read-only ({READ_ONLY_LOADER})",
+        "seconds": elapsed,
+        "peak_rss_delta_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--intents", type=int, default=100)
+    parser.add_argument("--utterances-per-intent", type=int, default=30)
+    parser.add_argument("--padding-states", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--_child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        print(json.dumps(_run_one(*args._child)))
+        return
+
+    import tempfile
+
+    from synthetic import synthetic_flow_yaml
+
+    for padding in args.padding_states:
+        yaml_bytes = synthetic_flow_yaml(
+            args.intents, args.utterances_per_intent, padding_states=padding
+        )
+        with tempfile.NamedTemporaryFile(suffix=".yaml", delete=False) as f:
+            f.write(yaml_bytes)
+        print(f"\nFlujo de {len(yaml_bytes) / 1e6:.1f} MB ({padding} estados)")
+        print(f"{'modo':<30} {'tiempo (s)':>10} {'pico RSS (MB)':>14}")
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, __file__, "--_child", mode, f.name],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            r = json.loads(out.stdout)
+            print(
+                f"{r['mode']:<30} {r['seconds']:10.2f} {r['peak_rss_delta_mb']:14.1f}"
+            )
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
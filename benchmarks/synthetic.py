@@ -0,0 +1,148 @@
+"""
+Generador de datos sintéticos para los benchmarks.
+
+Produce utterances en español con una proporción configurable de
+casi-duplicados (una edición de carácter sobre un utterance previo).
+"""
+
+import random
+
+WORDS = (
+    "quiero pagar mi factura deseo abonar la cuenta consultar saldo tarjeta "
+    "credito debito hablar con un asesor cambiar clave olvide contraseña "
+    "bloquear robo perdida prestamo cuotas transferir dinero ahorro corriente "
+    "estado pedido envio reclamo devolucion horario sucursal cerca abrir "
+    "cerrar cancelar servicio plan datos internet vencida pago minimo"
+).split()
+
+
+def synthetic_utterances(
+    n: int, near_duplicate_share: float = 0.1, seed: int = 0
+) -> list[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if out and rng.random() < near_duplicate_share:
+            chars = list(rng.choice(out))
+            pos = rng.randrange(len(chars))
+            chars[pos] = rng.choice("aeiou ")
+            out.append("".join(chars))
+        else:
+            out.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))))
+    return out
+
+
+def synthetic_utterance_frame(
+    n: int, n_intents: int = 50, near_duplicate_share: float = 0.1, seed: int = 0
+):
+    import pandas as pd
+
+    rng = random.Random(seed + 1)
+    utterances = synthetic_utterances(n, near_duplicate_share, seed)
+    intents = [f"intent_{rng.randrange(n_intents)}" for _ in utterances]
+    return pd.DataFrame({"intent": intents, "utterance": utterances})
+
+
+def synthetic_flow_yaml(
+    n_intents: int = 50,
+    utterances_per_intent: int = 20,
+    padding_states: int = 100,
+    near_duplicate_share: float = 0.1,
+    seed: int = 0,
+    n_entities: int = 1,
+) -> bytes:
+    """
+    YAML de un botFlow de Architect con su bloque NLU y `padding_states`
+    estados de relleno que simulan la parte no-NLU de los exports reales.
+    Uno de cada tres utterances lleva un segmento con entidad; las
+    `n_entities` entidades se reparten entre ellos.
+    """
+    import uuid
+
+    rng = random.Random(seed)
+    texts = synthetic_utterances(
+        n_intents * utterances_per_intent, near_duplicate_share, seed
+    )
+    entities = ["producto"] + [f"entidad_{e}" for e in range(1, n_entities)]
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128)))
+
+    lines = [
+        "botFlow:",
+        "  name: Synthetic Bot",
+        '  description: "flujo sintético para benchmarks"',
+        "  settingsNaturalLanguageUnderstanding:",
+        "    nluDomainVersion:",
+        "      language: es-us",
+        "      intents:",
+    ]
+    k = 0
+    for i in range(n_intents):
+        lines += [
+            f"        - name: intent_{i}",
+            f"          id: {new_id()}",
+            "          entityNameReferences:",
+        ]
+        lines += [f"            - {entity}" for entity in entities]
+        lines += ["          utterances:"]
+        for j in range(utterances_per_intent):
+            lines += [
+                "            - segments:",
+                f'                - text: "{texts[k]} "',
+            ]
+            if j % 3 == 0:
+                lines += [
+                    "                - text: tarjeta",
+                    "                  entity:",
+                    f"                    name: {entities[(k // 3) % n_entities]}",
+                ]
+            lines += [f"              id: {new_id()}", "              source: User"]
+            k += 1
+    lines += [
+        "      entities:",
+    ]
+    for entity in entities:
+        lines += [f"        - name: {entity}", f"          type: {entity}Type"]
+    lines += ["      entityTypes:"]
+    for entity in entities:
+        lines += [
+            f"        - name: {entity}Type",
+            "          description: Productos",
+            "          mechanism:",
+            "            type: List",
+            "            restricted: true",
+            "            items:",
+            "              - value: tarjeta",
+            "                synonyms:",
+            "                  - plástico",
+            "              - value: cuenta",
+        ]
+    lines += [
+        "      languageVersions: {}",
+        "    mutedUtterances: []",
+        "  states:",
+    ]
+    for p in range(padding_states):
+        lines += [
+            "    - state:",
+            f"        name: State {p}",
+            f"        refId: {new_id()}",
+            "        actions:",
+            "          - askForIntent:",
+            f"              name: Ask {p}",
+            "              question:",
+            '                exp: "MakeCommunication(\\"¿En qué te puedo ayudar?\\")"',
+            "              outputs:",
+            "                intents:",
+        ]
+        for i in range(min(n_intents, 5)):
+            lines += [
+                f"                  - intent:",
+                f"                      name: intent_{i}",
+                "                      enabled: true",
+                "                      actions:",
+                "                        - disconnect:",
+                "                            name: Disconnect",
+            ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Los módulos de la app se importan como en streamlit_app.py (utils.*,
+# auto_train.*), y los datos sintéticos salen de los benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,67 @@
+import glob
+import os
+from collections import defaultdict
+
+import pandas as pd
+import pytest
+
+from auto_train.loader import load_intents_from_multiple_excels
+
+
+def row_loop(folder_path):
+    """La lectura original, fila por fila."""
+    intents = defaultdict(list)
+    for file_path in glob.glob(os.path.join(folder_path, "step1_intent_output_*.xlsx")):
+        df = pd.read_excel(file_path)
+        for _, row in df.iterrows():
+            intent = str(row["Intent"]).strip()
+            utterance = str(row["Utterance"]).strip()
+            if intent and utterance:
+                intents[intent].append(utterance)
+    return intents
+
+
+@pytest.fixture
+def intent_excels(tmp_path):
+    # Celdas con espacios alrededor, vacías, de solo espacios y numéricas
+    pd.DataFrame(
+        {
+            "Intent": ["pagar", " pagar ", "saldo", None, "saldo", "  ", 42, "pagar"],
+            "Utterance": [
+                "quiero pagar",
+                "abonar  ",
+                " ver saldo",
+                "sin intent",
+                None,
+                "vacío",
+                7,
+                3.5,
+            ],
+            "Otra": range(8),
+        }
+    ).to_excel(tmp_path / "step1_intent_output_a.xlsx", index=False)
+    pd.DataFrame(
+        {"Intent": ["saldo", "nuevo"], "Utterance": ["consultar saldo", "hola"]}
+    ).to_excel(tmp_path / "step1_intent_output_b.xlsx", index=False)
+    # Sin celdas vacías ni de solo espacios; utterances enteros
+    pd.DataFrame({"Intent": ["numeros", "saldo"], "Utterance": [1, 2]}).to_excel(
+        tmp_path / "step1_intent_output_c.xlsx", index=False
+    )
+    pd.DataFrame({"Intent": ["otro"], "Utterance": ["no se lee"]}).to_excel(
+        tmp_path / "otro_archivo.xlsx", index=False
+    )
+    return tmp_path
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_load_intents_matches_the_row_loop(intent_excels, processes):
+    intents = load_intents_from_multiple_excels(
+        str(intent_excels), workers=2, processes=processes
+    )
+    expected = row_loop(str(intent_excels))
+    assert list(intents.items()) == list(expected.items())
+    assert "nan" in intents and "otro" not in intents
+
+
+def test_load_intents_without_files(tmp_path):
+    assert load_intents_from_multiple_excels(str(tmp_path)) == {}
@@ -0,0 +1,136 @@
+import copy
+import io
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+from ruamel.yaml import YAML
+
+from auto_train.loader import nlu_domain_version_span
+from synthetic import synthetic_flow_yaml
+from utils.builder import build_yaml, merge_into_original
+from utils.curation_io import read_curation_excel, write_curation_excel
+from utils.extractor import extract_intents
+
+
+def curated_nlu_block(yaml_bytes, edited_text="quiero hablar con un asesor"):
+    """Bloque NLU de un Excel curado con ediciones, como en el paso 3."""
+    (
+        df_utterances,
+        _,
+        df_entity_declarations,
+        df_entity_types,
+        df_intent_details,
+    ) = extract_intents(yaml_bytes, detect_duplicates=False)
+    df_utterances = df_utterances.copy()
+    # Un utterance editado, uno borrado y uno nuevo (sin id)
+    df_utterances.loc[0, "utterance_text"] = edited_text
+    df_utterances = df_utterances.drop(index=1)
+    new_row = df_utterances.iloc[[2]].assign(
+        utterance_text="otro utterance", utterance_id=None
+    )
+    df_utterances = pd.concat([df_utterances, new_row], ignore_index=True)
+
+    excel = io.BytesIO()
+    write_curation_excel(
+        excel,
+        df_utterances,
+        pd.DataFrame(),
+        df_intent_details,
+        df_entity_declarations,
+        df_entity_types,
+    )
+    excel.seek(0)
+    df_utterances, df_intent_details = read_curation_excel(excel)
+    nlu_block_str = build_yaml(df_utterances, df_intent_details, yaml_bytes)
+    return YAML().load(nlu_block_str)
+
+
+def test_concurrent_merges_of_the_same_flow():
+    yaml_bytes = synthetic_flow_yaml(12, 6, padding_states=50, n_entities=2)
+    nlu_blocks = []
+    for k in range(4):
+        nlu_block = curated_nlu_block(yaml_bytes, f"texto editado {k}")
+        # Cada bloque renombra un intent distinto: si un merge leyera el bloque
+        # que otro puso en el documento, perdería sus entityNameReferences
+        intents = nlu_block["settingsNaturalLanguageUnderstanding"]["nluDomainVersion"][
+            "intents"
+        ]
+        intents[k]["name"] += "_renombrado"
+        nlu_blocks.append(nlu_block)
+    # El merge completa el bloque que recibe: cada uno usa una copia
+    expected = [
+        merge_into_original(yaml_bytes, copy.deepcopy(block)) for block in nlu_blocks
+    ]
+
+    # Todos los merges comparten el documento parseado del flujo
+    for _ in range(5):
+        results = [None] * len(nlu_blocks)
+        copies = copy.deepcopy(nlu_blocks)
+        barrier = threading.Barrier(len(nlu_blocks))
+
+        def merge(k):
+            barrier.wait()
+            # Escalonados: cada uno lee el documento mientras otro lo vuelca
+            time.sleep(0.01 * k)
+            results[k] = merge_into_original(yaml_bytes, copies[k])
+
+        threads = [
+            threading.Thread(target=merge, args=(k,)) for k in range(len(nlu_blocks))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == expected
+
+
+def with_comments(yaml_bytes):
+    """El flujo con comentarios antes, dentro y después de nluDomainVersion."""
+    text = yaml_bytes.decode("utf-8")
+    text = text.replace(
+        "    nluDomainVersion:\n",
+        "    # dominio NLU\n    nluDomainVersion:\n      # intents del bot\n",
+    )
+    text = text.replace(
+        "    mutedUtterances: []\n",
+        "    # fin del dominio\n\n    mutedUtterances: []\n",
+    )
+    return text.encode("utf-8")
+
+
+@pytest.mark.parametrize(
+    "yaml_bytes",
+    [
+        synthetic_flow_yaml(12, 6, padding_states=5, n_entities=2),
+        with_comments(synthetic_flow_yaml(12, 6, padding_states=5)),
+    ],
+    ids=["plain", "comments"],
+)
+def test_splice_merge_matches_full_merge(yaml_bytes):
+    if nlu_domain_version_span(yaml_bytes) is None:
+        pytest.skip("sin los bindings C de libyaml no hay empalme")
+    nlu_block = curated_nlu_block(yaml_bytes)
+    assert merge_into_original(yaml_bytes, copy.deepcopy(nlu_block), splice=True) == (
+        merge_into_original(yaml_bytes, nlu_block)
+    )
+
+
+def test_splice_merge_falls_back_on_flow_style():
+    yaml_bytes = synthetic_flow_yaml(4, 3, padding_states=2)
+    nlu_block = curated_nlu_block(yaml_bytes)
+    # nluDomainVersion en estilo flujo (JSON): no se puede empalmar
+    text = yaml_bytes.decode("utf-8")
+    start = text.index("    nluDomainVersion:")
+    end = text.index("    mutedUtterances:")
+    nlu_domain_version = YAML(typ="safe").load(yaml_bytes)["botFlow"][
+        "settingsNaturalLanguageUnderstanding"
+    ]["nluDomainVersion"]
+    flow_text = "    nluDomainVersion: " + json.dumps(nlu_domain_version) + "\n"
+    flow_bytes = (text[:start] + flow_text + text[end:]).encode("utf-8")
+    assert nlu_domain_version_span(flow_bytes) is None
+    assert merge_into_original(flow_bytes, copy.deepcopy(nlu_block), splice=True) == (
+        merge_into_original(flow_bytes, nlu_block)
+    )
@@ -0,0 +1,185 @@
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+from synthetic import synthetic_flow_yaml
+from utils import curation_io
+from utils.builder import build_yaml
+from utils.curation_io import (
+    load_curation_bundle,
+    read_curation_bundle,
+    read_curation_excel,
+    read_curation_file,
+    serialize_segments,
+    write_curation_bundle,
+    write_curation_excel,
+)
+from utils.extractor import extract_intents
+
+SHEET_NAMES = [
+    "utterances",
+    "duplicados",
+    "intents",
+    "EntityDeclarations",
+    "EntityTypeDefinitions",
+    "confusion_intents",
+]
+
+
+@pytest.fixture(scope="module")
+def curation_frames():
+    """Las seis tablas del Excel de curación de un flujo sintético."""
+    yaml_bytes = synthetic_flow_yaml(8, 6, padding_states=5, n_entities=2)
+    (
+        df_utterances,
+        df_dups,
+        df_entity_declarations,
+        df_entity_types,
+        df_intent_details,
+    ) = extract_intents(yaml_bytes)
+    df_confusion = pd.DataFrame(
+        {"intent_1": ["a", "b"], "intent_2": ["b", "c"], "pares": [3, 1]}
+    )
+    return [
+        df_utterances,
+        df_dups,
+        df_intent_details,
+        df_entity_declarations,
+        df_entity_types,
+        df_confusion,
+    ]
+
+
+def reference_excel(frames) -> bytes:
+    """El Excel como se escribía antes: todo en memoria con pd.ExcelWriter."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for df, sheet_name in zip(frames, SHEET_NAMES):
+            serialize_segments(df).to_excel(writer, sheet_name=sheet_name, index=False)
+    return output.getvalue()
+
+
+ENGINES = ["openpyxl"]
+if curation_io.xlsxwriter is not None:
+    ENGINES.append("xlsxwriter")
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_streamed_excel_matches_the_in_memory_writer(
+    curation_frames, engine, monkeypatch
+):
+    if engine == "openpyxl":
+        monkeypatch.setattr(curation_io, "xlsxwriter", None)
+    # Tandas chicas para que cada hoja se escriba en varias
+    monkeypatch.setattr(curation_io, "EXPORT_CHUNK_ROWS", 7)
+    output = io.BytesIO()
+    stats = write_curation_excel(output, *curation_frames, trace_memory=True)
+    assert stats["engine"] == engine
+    assert stats["rows"] == sum(len(df) for df in curation_frames)
+    assert stats["peak_mb"] is not None
+
+    streamed = pd.read_excel(output, sheet_name=None, engine="openpyxl")
+    expected = pd.read_excel(
+        io.BytesIO(reference_excel(curation_frames)),
+        sheet_name=None,
+        engine="openpyxl",
+    )
+    assert list(streamed) == SHEET_NAMES
+    for sheet_name in SHEET_NAMES:
+        pd.testing.assert_frame_equal(streamed[sheet_name], expected[sheet_name])
+
+
+def test_empty_optional_sheets_are_left_out(curation_frames):
+    output = io.BytesIO()
+    empty = pd.DataFrame()
+    write_curation_excel(output, *curation_frames[:2], empty, None, empty, empty)
+    assert pd.ExcelFile(output, engine="openpyxl").sheet_names == [
+        "utterances",
+        "duplicados",
+    ]
+
+
+def curated_excel(curation_frames, edit=True) -> io.BytesIO:
+    """El Excel exportado; con edit=True, con IDs y utterances que parecen números."""
+    df_utterances = curation_frames[0].copy()
+    if edit:
+        df_utterances.loc[0, "utterance_text"] = "123"
+        df_utterances.loc[1, "utterance_id"] = "00123"
+        df_utterances.loc[2, "utterance_id"] = None
+    output = io.BytesIO()
+    write_curation_excel(output, df_utterances, *curation_frames[1:])
+    output.seek(0)
+    return output
+
+
+def test_read_curation_excel_matches_reading_each_sheet(curation_frames):
+    excel = curated_excel(curation_frames)
+    df_utterances, df_intent_details = read_curation_excel(excel)
+
+    # Como se leía antes (una lectura del libro por hoja), con los tipos fijos
+    excel.seek(0)
+    expected_utterances = pd.read_excel(
+        excel, sheet_name="utterances", dtype=curation_io.UTTERANCES_DTYPES
+    ).rename(columns={"intent_name": "intent", "utterance_text": "utterance"})
+    excel.seek(0)
+    expected_intents = pd.read_excel(
+        excel, sheet_name="intents", dtype=curation_io.INTENTS_DTYPES
+    )
+    pd.testing.assert_frame_equal(df_utterances, expected_utterances)
+    pd.testing.assert_frame_equal(df_intent_details, expected_intents)
+
+    assert df_utterances.loc[0, "utterance"] == "123"
+    assert df_utterances.loc[1, "utterance_id"] == "00123"
+    assert pd.isna(df_utterances.loc[2, "utterance_id"])
+
+
+def test_bundle_round_trip(curation_frames):
+    pytest.importorskip("pyarrow")
+    bundle = io.BytesIO()
+    write_curation_bundle(bundle, *curation_frames)
+    bundle.seek(0)
+    tables = load_curation_bundle(bundle)
+    assert list(tables) == SHEET_NAMES
+    for df, sheet_name in zip(curation_frames, SHEET_NAMES):
+        pd.testing.assert_frame_equal(
+            tables[sheet_name], serialize_segments(df), check_dtype=False
+        )
+
+
+def test_bundle_and_excel_build_the_same_yaml(curation_frames):
+    pytest.importorskip("pyarrow")
+    yaml_bytes = synthetic_flow_yaml(8, 6, padding_states=5, n_entities=2)
+    bundle = io.BytesIO()
+    write_curation_bundle(bundle, *curation_frames)
+    bundle.seek(0)
+    from_bundle = read_curation_file(bundle, "curacion.zip")
+    from_excel = read_curation_file(curated_excel(curation_frames, edit=False))
+    assert list(from_bundle[0].columns) == list(from_excel[0].columns)
+    assert build_yaml(*from_bundle, yaml_bytes) == build_yaml(*from_excel, yaml_bytes)
+
+
+def test_bundle_stores_mixed_type_columns_as_text(curation_frames):
+    pytest.importorskip("pyarrow")
+    df_entity_types = pd.DataFrame(
+        {"name": ["numeros", "numeros"], "value": [1, "dos"]}
+    )
+    bundle = io.BytesIO()
+    write_curation_bundle(bundle, *curation_frames[:4], df_entity_types)
+    bundle.seek(0)
+    tables = load_curation_bundle(bundle)
+    assert tables["EntityTypeDefinitions"]["value"].tolist() == ["1", "dos"]
+    pd.testing.assert_frame_equal(
+        tables["utterances"], serialize_segments(curation_frames[0]), check_dtype=False
+    )
+
+
+def test_bundle_without_the_utterances_sheet(curation_frames):
+    pytest.importorskip("pyarrow")
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, "w") as z:
+        z.writestr("intents.parquet", curation_frames[2].to_parquet(index=False))
+    bundle.seek(0)
+    with pytest.raises(ValueError, match="utterances"):
+        read_curation_bundle(bundle)
@@ -0,0 +1,200 @@
+import random
+
+import pandas as pd
+import pytest
+from rapidfuzz import fuzz
+
+from synthetic import synthetic_utterance_frame, synthetic_utterances
+from utils.duplicates import DuplicateIndex, find_similar_pairs
+from utils.extractor import find_duplicates, intent_confusion
+from utils.normalizer import normalize
+
+THRESHOLDS = (80, 85, 90, 95, 99.5)
+
+
+def brute_force_pairs(norms, threshold):
+    """Todos los pares (i, j), i < j, con threshold <= fuzz.ratio < 100."""
+    pairs = {}
+    for i, a in enumerate(norms):
+        for j in range(i + 1, len(norms)):
+            score = fuzz.ratio(a, norms[j])
+            if threshold <= score < 100:
+                pairs[(i, j)] = score
+    return pairs
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+@pytest.mark.parametrize("block_size,workers", [(256, 1), (7, 1), (7, 3)])
+def test_find_similar_pairs_matches_brute_force(threshold, block_size, workers):
+    norms = sorted(set(synthetic_utterances(400, near_duplicate_share=0.4)))
+    left, right, scores = find_similar_pairs(
+        norms, threshold, block_size=block_size, workers=workers
+    )
+    found = dict(zip(zip(left.tolist(), right.tolist()), scores.tolist()))
+    expected = brute_force_pairs(norms, threshold)
+    assert found.keys() == expected.keys()
+    for pair, score in expected.items():
+        assert found[pair] == pytest.approx(score)
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_find_duplicates_matches_brute_force(threshold):
+    df = synthetic_utterance_frame(300, n_intents=8, near_duplicate_share=0.4)
+    # Algunos duplicados exactos, con mayúsculas y espacios distintos
+    extra = df.sample(30, random_state=1).assign(
+        utterance=lambda d: " " + d["utterance"].str.upper()
+    )
+    df = pd.concat([df, extra], ignore_index=True)
+
+    result = find_duplicates(df, threshold)
+
+    norms = df["utterance"].map(normalize)
+    counts = norms.value_counts()
+    exact = df[norms.map(counts) > 1]
+    exact_rows = result[result["type"] == "duplicado"]
+    assert sorted(exact_rows["utterance"]) == sorted(exact["utterance"])
+
+    # Cada norm único aparece con su primer utterance y sus intents
+    unique = [n for n in dict.fromkeys(norms) if counts[n] == 1]
+    first = df.groupby(norms, sort=False)["utterance"].first()
+    intents = df.groupby(norms, sort=False)["intent"].agg(
+        lambda x: ",".join(sorted(set(x)))
+    )
+    expected = set()
+    for (i, j), score in brute_force_pairs(unique, threshold).items():
+        for norm in (unique[i], unique[j]):
+            expected.add((first[norm], intents[norm], round(score, 6)))
+    approx_rows = result[result["type"] == "aproximado"]
+    found = {
+        (utterance, intent, round(score, 6))
+        for utterance, intent, score in zip(
+            approx_rows["utterance"], approx_rows["intents"], approx_rows["similarity"]
+        )
+    }
+    assert found == expected
+
+
+@pytest.mark.parametrize("threshold", [99.5, 100])
+def test_find_duplicates_exact_only_keeps_integer_similarity(threshold):
+    df = synthetic_utterance_frame(200, n_intents=10, near_duplicate_share=0.3)
+    df = pd.concat([df, df.iloc[:5]], ignore_index=True)
+    result = find_duplicates(df, threshold)
+    assert (result["type"] == "duplicado").all()
+    assert result["similarity"].dtype == "int64"
+
+
+def brute_force_confusion(df, threshold):
+    """Matriz de confusión comparando todos los pares de filas."""
+    rows = list(zip(df["intent"], df["utterance"].map(normalize)))
+    totals = {}
+    for i, (intent_a, norm_a) in enumerate(rows):
+        for intent_b, norm_b in rows[i + 1 :]:
+            if intent_a == intent_b:
+                continue
+            score = 100 if norm_a == norm_b else fuzz.ratio(norm_a, norm_b)
+            if score < threshold:
+                continue
+            key = tuple(sorted((intent_a, intent_b)))
+            pairs, exact, total = totals.get(key, (0, 0, 0.0))
+            totals[key] = (pairs + 1, exact + (score == 100), total + score)
+    confusion = pd.DataFrame(
+        [
+            (a, b, pairs, exact, round(total / pairs, 2))
+            for (a, b), (pairs, exact, total) in totals.items()
+        ],
+        columns=["intent_a", "intent_b", "pairs", "exact_pairs", "mean_similarity"],
+    )
+    return confusion.sort_values(
+        ["pairs", "intent_a", "intent_b"], ascending=[False, True, True]
+    ).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("threshold", (80, 90, 99.5))
+def test_intent_confusion_matches_brute_force(threshold):
+    df = synthetic_utterance_frame(250, n_intents=6, near_duplicate_share=0.4)
+    # Duplicados exactos dentro del mismo intent y entre intents distintos
+    df = pd.concat(
+        [df, df.iloc[:20], df.iloc[20:40].assign(intent="intent_otro")],
+        ignore_index=True,
+    )
+    expected = brute_force_confusion(df, threshold)
+    result = intent_confusion(df, threshold)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_intent_confusion_without_crossings():
+    df = pd.DataFrame({"intent": ["a", "a", None], "utterance": ["x", "x", "x"]})
+    result = intent_confusion(df, 90)
+    assert result.empty
+    assert list(result.columns) == [
+        "intent_a",
+        "intent_b",
+        "pairs",
+        "exact_pairs",
+        "mean_similarity",
+    ]
+
+
+def random_edit(df, rng):
+    """Cambia, borra o agrega utterances (casi-duplicados de otros)."""
+    df = df.copy()
+    for _ in range(rng.choice([3, 30, 300])):
+        k = rng.randrange(len(df))
+        op = rng.random()
+        if op < 0.4:
+            source = df.loc[rng.randrange(len(df)), "utterance"]
+            df.loc[k, "utterance"] = source + rng.choice(["", " a", "s"])
+        elif op < 0.7:
+            df = df.drop(index=df.index[k]).reset_index(drop=True)
+        else:
+            new_row = pd.DataFrame(
+                {"intent": ["intent_x"], "utterance": [df.loc[k, "utterance"] + " ya"]}
+            )
+            df = pd.concat([df, new_row], ignore_index=True)
+    return df
+
+
+def test_duplicate_index_small_edits():
+    df = synthetic_utterance_frame(200, n_intents=10, near_duplicate_share=0.3)
+    index = DuplicateIndex(threshold=85)
+    index.update(df)
+    rng = random.Random(1)
+    for step in range(30):
+        # Pocas ediciones por vez: siempre por la vía incremental
+        df = df.copy()
+        for k in rng.sample(range(len(df)), 10):
+            df.loc[k, "utterance"] = df.loc[rng.randrange(len(df)), "utterance"] + (
+                f" {step}"
+            )
+        assert index.update(df)
+        pd.testing.assert_frame_equal(
+            index.to_frame().reset_index(drop=True),
+            find_duplicates(df, 85).reset_index(drop=True),
+        )
+        # Los ids de los norms editados no se acumulan sin cota
+        alive = len(set(normalize(u) for u in df["utterance"]))
+        assert len(index._norms) <= DuplicateIndex.COMPACT_FACTOR * alive
+    assert not index.update(df)
+
+
+def test_duplicate_index_threshold_sweep():
+    df = synthetic_utterance_frame(1000, n_intents=20, near_duplicate_share=0.3)
+    index = DuplicateIndex(threshold=THRESHOLDS[0])
+    rng = random.Random(0)
+    for step in range(5):
+        if step:
+            df = random_edit(df, rng)
+        index.update(df)
+        for threshold in THRESHOLDS:
+            expected = find_duplicates(df, threshold).reset_index(drop=True)
+            pd.testing.assert_frame_equal(
+                index.to_frame(threshold).reset_index(drop=True), expected
+            )
+            pd.testing.assert_frame_equal(
+                intent_confusion(
+                    df,
+                    threshold,
+                    pair_blocks=lambda n, t=threshold: index.pair_blocks(n, t),
+                ),
+                intent_confusion(df, threshold),
+            )
@@ -0,0 +1,146 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from synthetic import synthetic_flow_yaml, synthetic_utterance_frame
+from utils.duplicates import DuplicateIndex
+from utils.extractor import extract_intents
+from utils.jobs import CANCELLED, DONE, FAILED, QUEUED, JobCancelled, JobRunner
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(max_workers=1, max_per_owner=1)
+    yield runner
+    runner.shutdown()
+
+
+def blocking_job(job, started, release, steps=3):
+    """Trabajo que avisa al arrancar y espera `release` antes de cada paso."""
+    started.set()
+    for step in range(steps):
+        release.wait()
+        job.report(step + 1, steps)
+    return "listo"
+
+
+def test_result_and_failure(runner):
+    job = runner.submit("a", "suma", lambda job, x, y=0: x + y, 2, y=3)
+    assert job.wait(5) and job.status == DONE and job.result() == 5
+
+    def fail(job):
+        raise ValueError("falló")
+
+    job = runner.submit("a", "falla", fail)
+    assert job.wait(5) and job.status == FAILED
+    with pytest.raises(ValueError, match="falló"):
+        job.result()
+    assert runner.counts() == (0, 0)
+
+
+def test_cancel_queued_and_running(runner):
+    started, release = threading.Event(), threading.Event()
+    running = runner.submit("a", "primero", blocking_job, started, release)
+    queued = runner.submit("b", "segundo", blocking_job, threading.Event(), release)
+    assert started.wait(5)
+    assert queued.status == QUEUED and runner.counts() == (1, 1)
+
+    # En cola: se descarta en el acto, sin llegar a correr
+    queued.cancel()
+    assert queued.status == CANCELLED and runner.counts() == (1, 0)
+    with pytest.raises(JobCancelled):
+        queued.result()
+
+    # Corriendo: termina en su próximo report
+    running.cancel()
+    release.set()
+    assert running.wait(5) and running.status == CANCELLED
+    assert running.progress == (0, 0)
+
+
+def test_cancel_after_the_last_report_discards_the_result(runner):
+    reported = threading.Event()
+    finish = threading.Event()
+
+    def work(job):
+        job.report(1, 1)
+        reported.set()
+        finish.wait()
+        return "descartado"
+
+    job = runner.submit("a", "sin más reports", work)
+    assert reported.wait(5)
+    job.cancel()
+    finish.set()
+    assert job.wait(5) and job.status == CANCELLED
+
+
+def test_owners_take_turns():
+    runner = JobRunner(max_workers=1, max_per_owner=1)
+    order = []
+    gate = threading.Event()
+
+    def work(job, label):
+        gate.wait()
+        order.append(label)
+
+    # "a" encola tres trabajos antes de que "b" y "c" encolen uno cada uno
+    jobs = [runner.submit("a", "a", work, f"a{k}") for k in range(3)]
+    jobs += [runner.submit("b", "b", work, "b0"), runner.submit("c", "c", work, "c0")]
+    gate.set()
+    for job in jobs:
+        assert job.wait(5)
+    runner.shutdown()
+    assert order == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_extraction_reports_its_stages(runner):
+    yaml_bytes = synthetic_flow_yaml(5, 4, padding_states=2)
+    reports = []
+    expected = extract_intents(yaml_bytes, detect_duplicates=False)
+    result = extract_intents(
+        yaml_bytes,
+        detect_duplicates=False,
+        progress=lambda done, total: reports.append((done, total)),
+    )
+    assert reports == [(0, 3), (1, 3), (2, 3), (3, 3)]
+    for df, expected_df in zip(result, expected):
+        assert list(df.columns) == list(expected_df.columns)
+        assert len(df) == len(expected_df)
+
+    # Cancelada al empezar: termina en el primer report
+    def extract(job):
+        job.cancel()
+        return extract_intents(yaml_bytes, progress=job.report)
+
+    job = runner.submit("a", "extract", extract)
+    assert job.wait(5) and job.status == CANCELLED
+
+
+def test_cancelled_index_update_keeps_the_index(runner):
+    df = synthetic_utterance_frame(400, seed=2)
+    dup_index = DuplicateIndex(threshold=85)
+    dup_index.update(df)
+    before = dup_index.to_frame().copy()
+
+    # Más de la cuarta parte de filas nuevas (reconstrucción) y pocas
+    # (actualización incremental)
+    for n_edited in (200, 10):
+        edited = df.copy()
+        edited.loc[: n_edited - 1, "utterance"] += " editado"
+
+        def update(job):
+            job.cancel()
+            dup_index.update(edited, progress=job.report)
+
+        job = runner.submit("a", "update", update)
+        assert job.wait(5) and job.status == CANCELLED
+        pd.testing.assert_frame_equal(dup_index.to_frame(), before)
+        # Sigue sirviendo para actualizaciones posteriores
+        fresh = DuplicateIndex(threshold=85)
+        fresh.update(edited)
+        dup_index.update(edited)
+        pd.testing.assert_frame_equal(dup_index.to_frame(), fresh.to_frame())
+        dup_index.update(df)
+        pd.testing.assert_frame_equal(dup_index.to_frame(), before)
@@ -0,0 +1,92 @@
+import pytest
+from ruamel.yaml import YAML
+
+from auto_train.loader import (
+    READ_ONLY_LOADER,
+    load_read_only,
+    parse_flow,
+    stream_nlu_settings,
+)
+from synthetic import synthetic_flow_yaml
+
+# Escalares que YAML 1.1 (PyYAML) y YAML 1.2 (ruamel) resuelven distinto
+YAML12_SCALARS = b"""\
+textos: [no, on, off, yes, y, n, "no", NO, On]
+booleanos: [true, false, True, FALSE]
+enteros: [12, -7, +3, 012, 0o12, 0x1F, 0b101, 1_000]
+sexagesimales: [1:30, "1:30", 190:20:30]
+flotantes: [1.5, -0.25, 1e3, 6.02E+23, .5, .inf, -.Inf, .nan]
+otros: [~, null, "", "0x1G"]
+valor: =
+"""
+
+
+needs_libyaml = pytest.mark.skipif(
+    READ_ONLY_LOADER != "pyyaml-libyaml", reason="sin PyYAML con libyaml"
+)
+
+
+def ruamel_load(yaml_bytes):
+    return YAML().load(yaml_bytes)
+
+
+@needs_libyaml
+def test_fast_loader_resolves_scalars_as_yaml_12():
+    fast = load_read_only(YAML12_SCALARS)
+    reference = ruamel_load(YAML12_SCALARS)
+    # "=" es texto (ruamel lo deja como TaggedScalar con ese valor)
+    assert fast.pop("valor") == reference.pop("valor").value == "="
+    fast_nan, reference_nan = fast["flotantes"].pop(), reference["flotantes"].pop()
+    assert fast_nan != fast_nan and reference_nan != reference_nan
+    assert fast == reference
+    for key in ("textos", "sexagesimales"):
+        assert all(isinstance(value, str) for value in fast[key])
+
+
+def test_fast_loader_matches_ruamel_on_a_flow():
+    yaml_bytes = synthetic_flow_yaml(10, 5, padding_states=20, n_entities=2)
+    assert load_read_only(yaml_bytes) == ruamel_load(yaml_bytes)
+
+
+@needs_libyaml
+def test_stream_nlu_settings_matches_full_load():
+    yaml_bytes = synthetic_flow_yaml(10, 5, padding_states=20, n_entities=2)
+    expected = load_read_only(yaml_bytes)["botFlow"][
+        "settingsNaturalLanguageUnderstanding"
+    ]
+    assert stream_nlu_settings(yaml_bytes) == expected
+
+    # El bloque también puede estar en la raíz, después de otras claves
+    top_level = b"""\
+otra: {a: [1, 2]}
+flujo:
+  settingsNaturalLanguageUnderstanding: no es este
+settingsNaturalLanguageUnderstanding:
+  nluDomainVersion:
+    language: es-us
+    intents: [{name: saludo, utterances: []}]
+"""
+    assert stream_nlu_settings(top_level) == (
+        load_read_only(top_level)["settingsNaturalLanguageUnderstanding"]
+    )
+
+
+@needs_libyaml
+def test_stream_nlu_settings_without_the_block():
+    assert stream_nlu_settings(b"botFlow:\n  name: x\n") is None
+    assert stream_nlu_settings(b"") is None
+
+
+def test_nlu_settings_with_an_anchor_outside_the_block():
+    # El alias apunta fuera del subárbol: se carga el documento completo
+    yaml_bytes = b"""\
+comun: &idioma es-us
+botFlow:
+  settingsNaturalLanguageUnderstanding:
+    nluDomainVersion:
+      language: *idioma
+      intents: []
+"""
+    assert parse_flow(yaml_bytes).nlu_settings() == {
+        "nluDomainVersion": {"language": "es-us", "intents": []}
+    }
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import synthetic_utterances
+from utils import normalizer
+from utils.normalizer import normalize, normalize_series
+
+TEXTS = [
+    "  ¿Quiero PAGAR mi factura?  ",
+    "Olvidé la contraseña!!",
+    "año\tnuevo\n\nmañana",
+    "ÁÉÍÓÚ Ñ ü ç",
+    "café\xa0con\u2003leche",  # Espacios no ASCII (el segundo fuera de Latin-1)
+    "ﬁnanciación ①",  # Compatibilidad NFKD
+    "naïve e\u0301",  # Marca combinante suelta
+    "ΣΊΣΥΦΟΣ",  # Minúsculas fuera de Latin-1
+    "",
+    "   ",
+    None,
+    np.nan,
+    3.5,
+]
+
+
+@pytest.mark.parametrize("full_unicode", [False, True])
+def test_normalize_series_matches_normalize(full_unicode):
+    texts = TEXTS + synthetic_utterances(200, seed=3) + TEXTS[:4]
+    series = pd.Series(texts, index=range(10, 10 + len(texts)), name="utterance")
+    result = normalize_series(series, full_unicode=full_unicode)
+    assert result.index.equals(series.index)
+    assert result.name == "utterance"
+    assert result.tolist() == [normalize(t, full_unicode) for t in texts]
+
+    # Con la memoria llena (segunda pasada) y vacía, el resultado es el mismo
+    assert normalize_series(series, full_unicode).tolist() == result.tolist()
+    normalizer._memo[full_unicode].clear()
+    assert normalize_series(series, full_unicode).tolist() == result.tolist()
+
+
+def test_normalize_series_on_string_dtypes():
+    texts = ["Hola ¡Mundo!", None, "  Adiós  "]
+    expected = [normalize(t) for t in texts]
+    for dtype in (object, "string"):
+        series = pd.Series(texts, dtype=dtype)
+        assert normalize_series(series).tolist() == expected
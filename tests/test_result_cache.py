@@ -0,0 +1,104 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from synthetic import synthetic_flow_yaml
+from utils import result_cache
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setenv(result_cache.CACHE_DIR_ENV, str(tmp_path))
+    monkeypatch.delenv(result_cache.CACHE_TTL_ENV, raising=False)
+    monkeypatch.delenv(result_cache.CACHE_MAX_MB_ENV, raising=False)
+    return tmp_path
+
+
+def entry_path(root, namespace, key):
+    return result_cache._entry_path(str(root), namespace, key)
+
+
+def age_entry(path, seconds):
+    """Hace que la entrada parezca escrita hace `seconds` segundos."""
+    past = time.time() - seconds
+    for name in os.listdir(path):
+        os.utime(os.path.join(path, name), (past, past))
+
+
+def test_text_and_frames_round_trip(cache_root):
+    assert result_cache.load_text("build", "k") is None
+    result_cache.store_text("build", "k", "texto ñ")
+    assert result_cache.load_text("build", "k") == "texto ñ"
+
+    frames = [pd.DataFrame({"a": [1, 2], "b": ["x", None]}), pd.DataFrame()]
+    assert result_cache.load_frames("extract", "k") is None
+    result_cache.store_frames("extract", "k", frames)
+    loaded = result_cache.load_frames("extract", "k")
+    assert len(loaded) == 2
+    pd.testing.assert_frame_equal(loaded[0], frames[0], check_dtype=False)
+
+
+def test_disabled_without_cache_dir(monkeypatch):
+    monkeypatch.delenv(result_cache.CACHE_DIR_ENV, raising=False)
+    result_cache.store_text("build", "k", "texto")
+    assert result_cache.load_text("build", "k") is None
+
+
+def test_cached_build_yaml_hit_and_miss(cache_root, monkeypatch):
+    calls = []
+
+    def fake_build_yaml(*args):
+        calls.append(args)
+        return f"bloque {len(calls)}"
+
+    monkeypatch.setattr(result_cache, "build_yaml", fake_build_yaml)
+    df = pd.DataFrame({"intent": ["a"], "utterance": ["hola"]})
+    details = pd.DataFrame({"intent_name": ["a"], "intent_id": ["1"]})
+    assert result_cache.cached_build_yaml(df, details, b"flujo") == "bloque 1"
+    assert result_cache.cached_build_yaml(df, details, b"flujo") == "bloque 1"
+    assert len(calls) == 1
+    # Otra tabla u otro YAML es otra clave
+    assert result_cache.cached_build_yaml(df, details, b"otro") == "bloque 2"
+    edited = df.assign(utterance=["chau"])
+    assert result_cache.cached_build_yaml(edited, details, b"flujo") == "bloque 3"
+
+
+def test_cached_extract_intents_hit_equals_miss(cache_root):
+    yaml_bytes = synthetic_flow_yaml(5, 4, padding_states=2)
+    miss = result_cache.cached_extract_intents(yaml_bytes, detect_duplicates=False)
+    hit = result_cache.cached_extract_intents(yaml_bytes, detect_duplicates=False)
+    assert len(miss) == len(hit)
+    for miss_df, hit_df in zip(miss, hit):
+        pd.testing.assert_frame_equal(miss_df, hit_df)
+
+
+def test_expired_entry_is_not_served_even_if_read(cache_root, monkeypatch):
+    monkeypatch.setenv(result_cache.CACHE_TTL_ENV, "60")
+    result_cache.store_text("build", "k", "texto")
+    path = entry_path(cache_root, "build", "k")
+    age_entry(path, 50)
+    # Leerla la marca como usada, pero no la rejuvenece
+    assert result_cache.load_text("build", "k") == "texto"
+    age_entry(path, 61)
+    assert result_cache.load_text("build", "k") is None
+    assert not os.path.exists(path)
+
+
+def test_evict_drops_expired_and_least_recently_used(cache_root, monkeypatch):
+    monkeypatch.setenv(result_cache.CACHE_TTL_ENV, "60")
+    for key in ("vieja", "a", "b"):
+        result_cache.store_text("build", key, "x" * 400)
+    age_entry(entry_path(cache_root, "build", "vieja"), 61)
+    # "a" se usó hace más tiempo que "b"
+    past = time.time() - 30
+    os.utime(entry_path(cache_root, "build", "a"), (past, past))
+
+    monkeypatch.setenv(result_cache.CACHE_MAX_MB_ENV, str(700 / 2**20))
+    result_cache.evict()
+    assert not os.path.exists(entry_path(cache_root, "build", "vieja"))
+    assert not os.path.exists(entry_path(cache_root, "build", "a"))
+    assert result_cache.load_text("build", "b") == "x" * 400
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import ROOT
+from synthetic import synthetic_utterances
+from utils.semantic import similar_vector_pairs, tfidf_hash_encode
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "faiss", "hnswlib"]
+
+
+def test_importing_the_cli_does_not_load_the_semantic_backends():
+    code = (
+        "import sys, cli, utils.semantic; "
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(ROOT, "app"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_similar_vector_pairs_against_all_pairs():
+    vectors = tfidf_hash_encode(sorted(set(synthetic_utterances(300, seed=5))))
+    left, right, sims = similar_vector_pairs(vectors, 0.8)
+    assert (left < right).all()
+    # Búsqueda aproximada: no inventa pares y la similitud es la exacta
+    exact = vectors @ vectors.T
+    np.testing.assert_allclose(sims, np.minimum(exact[left, right], 1.0), atol=1e-5)
+    assert (sims >= 0.8 - 1e-6).all()
+    expected = set(zip(*np.nonzero(np.triu(exact >= 0.8, k=1))))
+    assert set(zip(left.tolist(), right.tolist())) <= expected